@@ -1,71 +1,259 @@
-from flask import Flask, request, jsonify
+import time
+APP_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, request, jsonify, g, Response
 import subprocess
-import joblib
 import os
-import numpy as np
 import json
+import hashlib
 from dotenv import load_dotenv
-from supabase import create_client
-import supabase     
-from scripts.bybit.bybit_to_supabase import run_sync
+from services.db import get_client
+from services.prediction_cache import PredictionCache, feature_key
+from services.portfolio_store import PortfolioStore
+from services.daily_pipelines import build_vn_pipeline, build_bybit_pipeline
+from services.scheduler import Scheduler, Job, INTERVAL_SECONDS, candle_close, daily_at
+from services.sharding import filter_owned
+from services.warmup import Warmup, once
+from services.streaming import EventStream, MIMETYPES, negotiate
+from services.traffic_capture import TrafficCapture
+from services.metrics import metrics, batch_size_bucket
+from services.profiling import ProfileSession, parse_mode
+from utils.logger import get_logger
 import traceback 
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))    
 # ─────────── Load biến môi trường ───────────
 load_dotenv()
+logger = get_logger("app")
 
 # ─────────── Khởi tạo Flask ───────────
 app = Flask(__name__)
 
+# ─────────── Metrics cho mọi request (GET /metrics) ───────────
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.get("started")
+    if started is not None:
+        # Dùng rule (VD: /bybit/predict) thay cho path thật để không bùng nổ số label
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started,
+                        {"route": route, "method": request.method})
+        metrics.inc("http_requests_total", {"route": route, "method": request.method, "status": str(response.status_code)})
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# ─────────── Ghi mẫu traffic thật để replay khi đo tải (TRAFFIC_CAPTURE_RATE > 0) ───────────
+traffic_capture = TrafficCapture()
+
+@app.after_request
+def capture_traffic(response):
+    if not traffic_capture.should_capture(request.endpoint):
+        return response
+    try:
+        started = g.get("started")
+        traffic_capture.record(
+            request.method, request.path, request.query_string.decode(), request.headers,
+            request.get_data(cache=True), response.status_code,
+            time.perf_counter() - started if started is not None else 0.0,
+            response.calculate_content_length() or 0,
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Không ghi được traffic capture: {e}")
+    return response
+
+@app.route("/traffic/capture", methods=["GET"])
+def traffic_capture_stats():
+    return jsonify(traffic_capture.stats())
+
+# ─────────── Profiling theo request: header X-Profile hoặc ?profile=1|sample|cprofile ───────────
+# Mặc định tắt: request bất kỳ có thể làm chậm worker, ghi file vào .cache/profiles và lộ tên hàm / file nội bộ
+PROFILE_HTTP = os.getenv("PROFILE_HTTP", "0") == "1"
+
+@app.before_request
+def start_profile():
+    if not PROFILE_HTTP:
+        return
+    mode = parse_mode(request.headers.get("X-Profile") or request.args.get("profile"))
+    if mode:
+        g.profile = ProfileSession(request.endpoint or request.path, mode).start()
+
+@app.after_request
+def attach_profile(response):
+    session = g.pop("profile", None)
+    if session is None:
+        return response
+    report = session.stop()
+    response.headers["X-Profile-Summary"] = report["files"]["summary"]
+    # Response JSON dạng object → gắn luôn tóm tắt (giai đoạn + top-N) vào body
+    data = response.get_json(silent=True) if response.is_json else None
+    if isinstance(data, dict):
+        data["profile"] = report
+        response.set_data(json.dumps(data, ensure_ascii=False, default=str))
+    return response
+
+@app.teardown_request
+def stop_profile(error=None):
+    # View lỗi → after_request không chạy; vẫn phải dừng luồng lấy mẫu
+    session = g.pop("profile", None)
+    if session is not None:
+        session.stop()
+
 # ─────────── Load mô hình AI ───────────
 MODEL_PATH = os.getenv("MODEL_PATH", "model/model.pkl")
 model = None
+model_version = None
+
+# Cache kết quả /predict: key = hash(8 trường đầu vào + phiên bản model)
+prediction_cache = PredictionCache(
+    max_size=int(os.getenv("PREDICT_CACHE_SIZE", 4096)),
+    ttl_seconds=float(os.getenv("PREDICT_CACHE_TTL", 6 * 3600))
+)
 
-try:
-    model = joblib.load(MODEL_PATH)
-    print(f"✅ Loaded model từ {MODEL_PATH}")
-except Exception as e:
-    print(f"❌ Lỗi khi load model từ {MODEL_PATH}: {str(e)}")
+def load_model():
+    global model, model_version
+    import joblib
+
+    try:
+        with open(MODEL_PATH, "rb") as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:12]
+        model = joblib.load(MODEL_PATH)
+        model_version = version
+        metrics.set_info("model_info", {"model": "vn", "version": model_version})
+        logger.info(f"✅ Loaded model từ {MODEL_PATH} (version {model_version})")
+    except Exception as e:
+        logger.exception(f"❌ Lỗi khi load model từ {MODEL_PATH}: {str(e)}")
+    finally:
+        # Model đổi → toàn bộ kết quả cũ không còn đúng
+        prediction_cache.clear()
+    return model
+
+def require_model():
+    # load_model() nuốt lỗi và trả None → phải raise để once() không ghi nhớ lần nạp hỏng
+    # và warm-up báo failed thay vì ready
+    if load_model() is None:
+        raise RuntimeError(f"Không load được model từ {MODEL_PATH}")
+    return model
+
+# Nạp lần đầu khi có request cần model (hoặc ở luồng warm-up); lỗi thì request sau thử lại;
+# /model/reload, /train nạp lại
+ensure_model = once(require_model)
+
+def model_ready() -> bool:
+    try:
+        ensure_model()
+    except Exception:
+        pass
+    return model is not None
 
 # ─────────── Predict cho 1 mã ───────────
+EXPECTED_FIELDS = [
+    'close', 'volume', 'ma20', 'rsi',
+    'bb_upper', 'bb_lower', 'foreign_buy_value', 'foreign_sell_value'
+]
+
+def parse_features(data):
+    """Trả về (features, None) hoặc (None, tên trường bị thiếu)."""
+    features = []
+    for field in EXPECTED_FIELDS:
+        if field not in data:
+            return None, field
+        try:
+            features.append(float(data[field]))
+        except Exception:
+            features.append(0)
+    return features, None
+
+def to_result(prob):
+    recommendation = (
+        "MUA" if prob > 0.7 else
+        "BÁN" if prob < 0.3 else
+        "GIỮ"
+    )
+    return {
+        "probability": round(float(prob), 4),
+        "recommendation": recommendation
+    }
+
 @app.route("/predict", methods=["POST"])
 def predict():
-    if model is None:
+    import numpy as np
+
+    if not model_ready():
         return jsonify({"error": "❌ Model chưa được load"}), 500
 
     try:
         data = request.get_json()
 
-        expected_fields = [
-            'close', 'volume', 'ma20', 'rsi',
-            'bb_upper', 'bb_lower', 'foreign_buy_value', 'foreign_sell_value'
-        ]
+        features, missing = parse_features(data)
+        if missing:
+            return jsonify({"error": f"❌ Thiếu trường bắt buộc: {missing}"}), 400
 
-        features = []
-        for field in expected_fields:
-            if field not in data:
-                return jsonify({"error": f"❌ Thiếu trường bắt buộc: {field}"}), 400
-            try:
-                features.append(float(data[field]))
-            except Exception:
-                features.append(0)
+        cache_key = feature_key(features, model_version)
+        cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
 
         X = np.array([features])
-        prob = model.predict_proba(X)[0][1]
+        with metrics.timer("model_inference_seconds", {"model": "vn", "batch": "1"}):
+            prob = model.predict_proba(X)[0][1]
+        metrics.inc("model_inference_rows_total", {"model": "vn"})
 
-        recommendation = (
-            "MUA" if prob > 0.7 else
-            "BÁN" if prob < 0.3 else
-            "GIỮ"
-        )
+        result = to_result(prob)
+        prediction_cache.set(cache_key, result)
 
-        return jsonify({
-            "probability": round(float(prob), 4),
-            "recommendation": recommendation
-        })
+        return jsonify(result)
+
+    except Exception as e:
+        logger.exception(f"🔥 Predict error: {e}")
+        return jsonify({"error": f"❌ Lỗi xử lý dữ liệu: {str(e)}"}), 500
+
+# ─────────── Predict nhiều mã trong 1 request ───────────
+# Body: {"items": [{...8 trường như /predict...}, ...]} → 1 lần predict_proba cho các dòng chưa có trong cache
+@app.route("/predict_batch", methods=["POST"])
+def predict_batch():
+    import numpy as np
+
+    if not model_ready():
+        return jsonify({"error": "❌ Model chưa được load"}), 500
+
+    try:
+        items = (request.get_json() or {}).get("items")
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "❌ Cần danh sách items"}), 400
+
+        results = [None] * len(items)
+        misses, rows = [], []
+        for i, data in enumerate(items):
+            features, missing = parse_features(data)
+            if missing:
+                return jsonify({"error": f"❌ Dòng {i} thiếu trường bắt buộc: {missing}"}), 400
+            key = feature_key(features, model_version)
+            cached = prediction_cache.get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                misses.append((i, key))
+                rows.append(features)
+
+        if rows:
+            with metrics.timer("model_inference_seconds", {"model": "vn", "batch": batch_size_bucket(len(rows))}):
+                probs = model.predict_proba(np.array(rows))[:, 1]
+            metrics.inc("model_inference_rows_total", {"model": "vn"}, len(rows))
+            for (i, key), prob in zip(misses, probs):
+                results[i] = to_result(prob)
+                prediction_cache.set(key, results[i])
+
+        return jsonify({ "results": results, "cache_hits": len(items) - len(rows) })
 
     except Exception as e:
-        print("🔥 Predict error:", str(e))
+        logger.exception(f"🔥 Predict batch error: {e}")
         return jsonify({"error": f"❌ Lỗi xử lý dữ liệu: {str(e)}"}), 500
 
 # ─────────── Train mô hình ───────────
@@ -77,10 +265,24 @@ def train_model():
             capture_output=True,
             text=True
         )
+        if result.returncode == 0:
+            load_model()
         return jsonify({ "message": result.stdout or result.stderr })
     except Exception as e:
         return jsonify({ "error": f"Lỗi train model: {str(e)}" }), 500
 
+# ─────────── Reload model & thống kê cache ───────────
+@app.route("/model/reload", methods=["POST"])
+def reload_model():
+    load_model()
+    if model is None:
+        return jsonify({"error": "❌ Model chưa được load"}), 500
+    return jsonify({ "model_version": model_version, "cache": prediction_cache.stats() })
+
+@app.route("/predict/cache", methods=["GET"])
+def predict_cache_stats():
+    return jsonify({ "model_version": model_version, "cache": prediction_cache.stats() })
+
 # ─────────── Tối ưu danh mục ───────────
 @app.route("/optimize", methods=["POST"])
 def optimize():
@@ -99,122 +301,178 @@ def optimize():
 def predict_all():
     try:
         result = subprocess.run(
-            ["python", "scripts/predict_all.py"],
+            ["python", "scripts/predict_all.py", "--stream"],
             capture_output=True,
             text=True
         )
+        if result.returncode == 0:
+            # Xác suất mới → tính lại danh mục tính sẵn
+            try:
+                refresh_portfolios()
+            except Exception as e:
+                logger.warning(f"⚠️ Không làm mới được danh mục tính sẵn: {e}")
         return jsonify({ "message": result.stdout or result.stderr })
     except Exception as e:
         return jsonify({ "error": f"Lỗi predict_all: {str(e)}" }), 500
 
+# ─────────── Supabase client & risk model dùng chung ───────────
+_supabase_client = None
+_risk_store = None
+
+def get_supabase():
+    global _supabase_client
+    if _supabase_client is None:
+        # dùng SERVICE ROLE mới được quyền đọc toàn bộ
+        _supabase_client = get_client()
+    return _supabase_client
+
+def get_risk_store():
+    global _risk_store
+    from services.risk_model import RiskModelStore, supabase_close_loader
+
+    if _risk_store is None:
+        _risk_store = RiskModelStore(supabase_close_loader(get_supabase()))
+    return _risk_store
+
+PORTFOLIO_COLUMNS = "symbol, date, ai_predicted_probability, ai_recommendation"
+portfolio_store = PortfolioStore()
+
 @app.route("/portfolio", methods=["POST"])
 def portfolio():
+    from services.optimize_service import METHODS
+    from scripts.portfolio_optimizer import build_portfolio, portfolio_etag
+
     try:
         raw_data = request.get_json()
 
         if not raw_data or "userId" not in raw_data:
             return jsonify({"error": "Thiếu userId!"}), 400
 
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # dùng SERVICE ROLE mới được quyền đọc toàn bộ
-
-        sb = create_client(supabase_url, supabase_key)
-
-        resp = sb.table("ai_signals").select("*")\
+        method = raw_data.get("method", "proportional")
+        if method not in METHODS:
+            return jsonify({"error": f"method không hợp lệ, chọn 1 trong: {', '.join(METHODS)}"}), 400
+
+        # Danh mục tính sẵn bởi batch → trả O(1); chưa có trong bộ nhớ worker này → đọc portfolio_snapshots
+        if method == "proportional":
+            cached = portfolio_store.get(raw_data["userId"])
+            if cached is None:
+                from scripts.batch_portfolio import load_snapshot
+                cached = load_snapshot(get_supabase(), raw_data["userId"])
+                if cached is not None:
+                    portfolio_store.put(raw_data["userId"], cached)
+            if cached is not None:
+                response = jsonify({ "date": cached["date"], "portfolio": cached["portfolio"] })
+                response.set_etag(cached["etag"])
+                return response.make_conditional(request)
+
+        sb = get_supabase()
+
+        # Chỉ lấy ngày mới nhất của user rồi lấy đúng các cột cần dùng
+        latest = sb.table("ai_signals").select("date")\
             .eq("user_id", raw_data["userId"])\
             .order("date", desc=True)\
+            .limit(1)\
             .execute()
 
-        records = resp.data or []
-
-        # Gọi portfolio_optimizer.py bằng subprocess
-        import subprocess
-        import json
-
-        p = subprocess.Popen(
-            ["python", "scripts/portfolio_optimizer.py"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+        records = []
+        if latest.data:
+            resp = sb.table("ai_signals").select(PORTFOLIO_COLUMNS)\
+                .eq("user_id", raw_data["userId"])\
+                .eq("date", latest.data[0]["date"])\
+                .execute()
+            records = resp.data or []
+
+        result = build_portfolio(
+            records, method,
+            get_risk_store() if method != "proportional" else None
         )
 
-        stdout, stderr = p.communicate(json.dumps(records))
+        payload = {
+            "date": records[0]["date"] if records else None,
+            "portfolio": result
+        }
+
+        # ETag theo nội dung → client gửi If-None-Match nhận 304 nếu danh mục không đổi
+        response = jsonify(payload)
+        response.set_etag(portfolio_etag(payload))
+        return response.make_conditional(request)
 
-        if p.returncode != 0:
-            return jsonify({ "error": "Lỗi khi chạy portfolio_optimizer", "stderr": stderr }), 500
+    except Exception as e:
+        return jsonify({ "error": f"Lỗi xử lý portfolio: {str(e)}" }), 500
 
-        try:
-            portfolio = json.loads(stdout)
-        except:
-            return jsonify({ "error": "Lỗi parse kết quả JSON từ optimizer", "raw": stdout }), 500
+# ─────────── Tính lại danh mục cho toàn bộ user ───────────
+def refresh_portfolios():
+    from scripts.batch_portfolio import run_batch
+    return run_batch(get_supabase(), store=portfolio_store)
 
-        return jsonify({
-            "date": records[0]["date"] if records else None,
-            "portfolio": portfolio
-        })
+def load_portfolio_snapshots():
+    from scripts.batch_portfolio import load_snapshots
+    return portfolio_store.load_if_empty(load_snapshots(get_supabase()))
 
+@app.route("/portfolio/refresh", methods=["POST"])
+def portfolio_refresh():
+    try:
+        entries = refresh_portfolios()
+        return jsonify({ "message": f"✅ Đã tính danh mục cho {len(entries)} user", **portfolio_store.stats() })
     except Exception as e:
-        return jsonify({ "error": f"Lỗi xử lý portfolio: {str(e)}" }), 500
+        return jsonify({ "error": f"Lỗi batch portfolio: {str(e)}" }), 500
      
 # ─────────── Gọi toàn bộ pipeline AI: insert → label → evaluate ───────────
 @app.route("/run_daily", methods=["POST"])
 def run_daily():
-    steps = [
-        ("Insert AI signals", "scripts/insert_ai_signals.py"),
-        ("Label AI signals", "scripts/label_ai_signals.py"),
-        ("Evaluate AI accuracy", "scripts/evaluate_ai_accuracy.py"),
-    ]
+    logger.info("🚀 Đang chạy pipeline VN: insert → label → evaluate")
+    force = request.args.get("force") == "1"
 
-    logs = []
-
-    for step_name, script in steps:
-        print(f"🚀 Đang chạy: {step_name}")
+    try:
+        summary = build_vn_pipeline().run(force=force)
+    except Exception as e:
+        return jsonify({
+            "error": f"Exception khi chạy pipeline: {str(e)}",
+            "logs": []
+        }), 500
 
-        try:
-            result = subprocess.run(
-                ["python", script],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding="utf-8",
-                errors="replace"  # ✅ chống UnicodeDecodeError
-            )
-
-            log_entry = {
-                "step": step_name,
-                "script": script,
-                "returncode": result.returncode,
-                "stdout": result.stdout.strip() if result.stdout else "",
-                "stderr": result.stderr.strip() if result.stderr else "",
-            }
-
-            logs.append(log_entry)
-
-            if result.returncode != 0:
-                return jsonify({
-                    "error": f"Lỗi khi chạy {step_name}",
-                    "logs": logs
-                }), 500
-
-        except Exception as e:
-            logs.append({
-                "step": step_name,
-                "script": script,
-                "returncode": -1,
-                "stdout": "",
-                "stderr": str(e),
-            })
-            return jsonify({
-                "error": f"Exception tại bước {step_name}",
-                "logs": logs
-            }), 500
+    if not summary["success"]:
+        failed = next(s for s in summary["steps"] if s["status"] == "failed")
+        return jsonify({
+            "error": f"Lỗi khi chạy {failed['description']}",
+            "logs": summary["steps"],
+            "wall_s": summary["wall_s"]
+        }), 500
 
     return jsonify({
         "message": "✅ Đã hoàn thành toàn bộ pipeline AI",
-        "logs": logs
+        "logs": summary["steps"],
+        "wall_s": summary["wall_s"]
     }), 200
 
+# ─────────── Stream tiến độ pipeline (SSE / NDJSON) thay vì chờ hết mới trả log ───────────
+# Định dạng: ?stream=sse|ndjson hoặc header Accept; gzip khi client gửi Accept-Encoding: gzip
+def stream_response(name, fn):
+    fmt = negotiate(request.args.get("stream"), request.headers.get("Accept"))
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    stream = EventStream(fmt).run(fn, name=name)
+
+    response = Response(stream.body(gzip=use_gzip), mimetype=MIMETYPES[fmt])
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # nginx không gom buffer
+    if use_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+def streamed_summary(summary):
+    # stdout đã gửi dần theo từng dòng → sự kiện cuối chỉ còn số liệu của các bước
+    return {**summary, "steps": [{k: v for k, v in s.items() if k != "stdout"} for s in summary["steps"]]}
+
+@app.route("/run_daily/stream", methods=["POST"])
+def run_daily_stream():
+    force = request.args.get("force") == "1"
+
+    def run(on_event):
+        return streamed_summary(build_vn_pipeline().run(force=force, on_event=on_event, keep_stdout=False))
+
+    return stream_response("vn_daily", run)
+
 @app.route("/bybit/bybit_to_supabase", methods=["POST"])
 def sync_bybit():
     logs = []
@@ -223,7 +481,14 @@ def sync_bybit():
         logs.append("📡 Nhận yêu cầu POST từ Next.js")
         logs.append("🔄 Bắt đầu gọi hàm run_sync()...")
 
-        inserted = run_sync(logs)  # Truyền logs để ghi chi tiết quá trình
+        # Chạy qua scheduler để không chồng lên lần đồng bộ đang chạy
+        started, inserted = scheduler.run_inline("sync:all", source="http", logs=logs)  # Truyền logs để ghi chi tiết quá trình
+        if not started:
+            logs.append("⏳ Đang có lần đồng bộ khác chạy → yêu cầu đã được gộp.")
+            return jsonify({
+                'message': "⏳ Đồng bộ đang chạy, yêu cầu đã được gộp vào lần chạy kế tiếp.",
+                'logs': logs
+            }), 409
 
         logs.append(f"\n🎯 Tổng cộng đã thêm {inserted} nến vào Supabase.")
         success_msg = f"✅ Đồng bộ thành công! Đã thêm {inserted} nến."
@@ -239,76 +504,112 @@ def sync_bybit():
         logs.append(error_msg)
         logs.extend(traceback.format_exc().splitlines())
         return jsonify({ 'error': str(e), 'logs': logs }), 500
-        
-# ─────────── Gọi toàn bộ pipeline AI: insert → label → evaluate ───────────
-# Đảm bảo in được tiếng Việt và emoji ra stdout
-os.environ["PYTHONIOENCODING"] = "utf-8"
-
-def run_script(script_filename):
-    base_dir = os.path.dirname(os.path.realpath(__file__))
-    script_path = os.path.join(base_dir, "scripts", "bybit", script_filename)  # ✅ sửa ở đây
-
-    if not os.path.isfile(script_path):
-        return {
-            "success": False,
-            "stdout": "",
-            "stderr": f"❌ KHÔNG TÌM THẤY FILE: {script_path}"
-        }
+
+# ─────────── Dự đoán ngay khi nến đóng (REALTIME_REFRESH=1) ───────────
+# Mỗi lần đồng bộ lưu nến mới → chấm điểm lại riêng symbol đó, không chờ pipeline hàng ngày
+@once
+def get_bybit_model():
+    from services.realtime_refresh import ReloadingModel
+    return ReloadingModel()
+
+candle_refresher = None
+if os.getenv("REALTIME_REFRESH") == "1":
+    # Bật tính năng → chấp nhận import module đồng bộ ngay lúc khởi động để không lỡ nến nào
+    from services.realtime_refresh import CandleRefresher
+    from scripts.bybit.bybit_to_supabase import register_candle_listener
+
+    candle_refresher = CandleRefresher(get_bybit_model(), max_workers=int(os.getenv("REALTIME_REFRESH_WORKERS", 2)))
+    register_candle_listener(candle_refresher.on_candles)
+
+@app.route("/bybit/realtime", methods=["GET"])
+def realtime_status():
+    if candle_refresher is None:
+        return jsonify({ "enabled": False })
+    return jsonify({ "enabled": True, **candle_refresher.stats() })
+
+# ─────────── Buffer nến trong RAM: dự đoán không cần gọi Supabase ───────────
+def rehydrate_buffers(symbols=None):
+    from services.candle_buffer import candle_buffers
+
+    if symbols is None:
+        res = get_supabase().table("watched_symbols").select("symbol").eq("active", True).execute()
+        symbols = filter_owned([s["symbol"] for s in res.data or []])
+    return candle_buffers.rehydrate(get_supabase(), symbols)
+
+@app.route("/bybit/predict", methods=["GET"])
+def bybit_predict():
+    import pandas as pd
+    from services.candle_buffer import candle_buffers
+    from scripts.bybit.predict_signal import score, CANDLE_LOOKBACK
+
+    symbol = (request.args.get("symbol") or "").upper()
+    if not symbol:
+        return jsonify({ "error": "❌ Thiếu tham số symbol" }), 400
+
+    record = candle_buffers.latest_features(symbol)
+    candles = candle_buffers.candles(symbol, CANDLE_LOOKBACK)
+    if record is None or candles is None:
+        return jsonify({ "error": f"⚠️ Buffer chưa có dữ liệu cho {symbol}" }), 404
 
     try:
-        completed = subprocess.run(
-            [sys.executable, script_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-            check=True
-        )
-        return {
-            "success": True,
-            "stdout": completed.stdout.strip(),
-            "stderr": completed.stderr.strip()
-        }
-    except subprocess.CalledProcessError as e:
-        return {
-            "success": False,
-            "stdout": e.stdout.strip() if e.stdout else "",
-            "stderr": e.stderr.strip() if e.stderr else f"Lỗi không xác định trong {script_filename}"
-        }
+        result = score(get_bybit_model().get(), pd.DataFrame([record]), candles)
+    except Exception as e:
+        return jsonify({ "error": f"❌ Lỗi khi dự đoán: {str(e)}" }), 500
 
+    return jsonify({
+        "symbol": symbol,
+        "timestamp": result["timestamp"],
+        "prediction": result["prediction"],
+        "confidence": round(result["confidence"], 4),
+        "entry_price": float(result["entry"]),
+        "tp": float(result["tp"]),
+        "sl": float(result["sl"]),
+    })
+
+@app.route("/bybit/buffers", methods=["GET"])
+def bybit_buffers():
+    from services.candle_buffer import candle_buffers
+    return jsonify(candle_buffers.memory())
+
+@app.route("/bybit/buffers/rehydrate", methods=["POST"])
+def bybit_buffers_rehydrate():
+    from services.candle_buffer import candle_buffers
+
+    symbols = request.args.get("symbols")
+    loaded = rehydrate_buffers(symbols.upper().split(",") if symbols else None)
+    return jsonify({ "loaded": loaded, "memory": candle_buffers.memory() })
+        
+# ─────────── Pipeline Bybit: generate → train → predict → execute ───────────
 @app.route("/bybit/run_daily", methods=["POST"])
 def run_daily_ai():
-    stdout = []
+    stdout = ["🚀 Bắt đầu chạy quy trình AI hàng ngày..."]
     stderr = []
+    force = request.args.get("force") == "1"
 
     try:
-        stdout.append("🚀 Bắt đầu chạy quy trình AI hàng ngày...")
-
-        steps = [
-            ("generate_training_data.py", "📊 Sinh dữ liệu training"),
-            ("train_model.py", "🤖 Huấn luyện mô hình"),
-            ("predict_signal.py", "🔮 Dự đoán tín hiệu"),
-            ("ai_execute_signals.py", "💥 Ghi tín hiệu vào bảng")
-        ]
-
-        for filename, description in steps:
-            stdout.append(f"\n🔄 {description} ({filename})...")
-            result = run_script(filename)
-
-            if result["success"]:
-                stdout.append(f"✅ {description} thành công.")
-                if result["stdout"]:
-                    stdout.append(result["stdout"])
-                if result["stderr"]:
-                    stdout.append(f"⚠️ Cảnh báo:\n{result['stderr']}")
-            else:
-                stderr.append(f"❌ {description} thất bại!")
-                stderr.append(result["stderr"])
-                stdout.append(result["stdout"])
-                break  # Dừng quy trình tại đây nếu lỗi
-
-        if stderr:
+        # force=1 vẫn đi qua scheduler → không chạy chồng lên lần chạy theo lịch / request khác
+        started, summary = scheduler.run_inline("daily:bybit", source="http", force=force)
+        if not started:
+            return jsonify({
+                "message": "⏳ Quy trình hàng ngày đang chạy, yêu cầu đã được gộp.",
+                "stdout": "",
+                "stderr": ""
+            }), 409
+
+        for step in summary["steps"]:
+            if step["status"] == "skipped":
+                stdout.append(f"\n⏭️ {step['description']}: input không đổi, bỏ qua.")
+            elif step["status"] == "success":
+                stdout.append(f"\n✅ {step['description']} thành công "
+                              f"({step['wall_s']}s, {step['rows']} dòng).")
+                if step["stdout"]:
+                    stdout.append(step["stdout"])
+            elif step["status"] == "failed":
+                stderr.append(f"❌ {step['description']} thất bại!")
+                stderr.append(step["error"] or "")
+                stdout.append(step["stdout"])
+
+        if not summary["success"]:
             raise Exception("Một bước trong quy trình đã thất bại.")
 
         stdout.append("\n🏁 ✅ TOÀN BỘ QUY TRÌNH ĐÃ CHẠY THÀNH CÔNG.")
@@ -316,7 +617,9 @@ def run_daily_ai():
         return jsonify({
             "message": "Đã chạy xong quy trình AI hàng ngày",
             "stdout": "\n".join(stdout),
-            "stderr": ""
+            "stderr": "",
+            "steps": [{k: v for k, v in step.items() if k != "stdout"} for step in summary["steps"]],
+            "wall_s": summary["wall_s"]
         })
 
     except Exception as e:
@@ -330,12 +633,112 @@ def run_daily_ai():
             "stdout": "\n".join(stdout),
             "stderr": "\n".join(stderr)
         }), 500
+
+@app.route("/bybit/run_daily/stream", methods=["POST"])
+def run_daily_ai_stream():
+    force = request.args.get("force") == "1"
+
+    def run(on_event):
+        started, summary = scheduler.run_inline("daily:bybit", source="http", force=force, on_event=on_event,
+                                                keep_stdout=False)
+        if not started:
+            return { "coalesced": True, "message": "⏳ Quy trình hàng ngày đang chạy, yêu cầu đã được gộp." }
+        return streamed_summary(summary)
+
+    return stream_response("bybit_daily", run)
         
+# ─────────── Scheduler: đồng bộ theo giờ đóng nến + chạy hàng ngày ───────────
+SCHEDULER_JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", 5))
+DAILY_RUN_AT = os.getenv("DAILY_RUN_AT", "00:10")  # giờ UTC
+
+def run_sync(logs=None, interval=None):
+    from scripts.bybit.bybit_to_supabase import run_sync as sync
+    return sync(logs, interval=interval)
+
+scheduler = Scheduler()
+# Mọi job đồng bộ chung group "sync" → không bao giờ ghi chồng lên nhau
+scheduler.add_job(Job("sync:all", lambda logs=None: run_sync(logs), group="sync"))
+scheduler.add_job(Job(
+    "daily:bybit", lambda **kwargs: build_bybit_pipeline().run(**kwargs),
+    next_time=daily_at(DAILY_RUN_AT), jitter_seconds=SCHEDULER_JITTER_SECONDS, group="daily:bybit"
+))
+
+def register_sync_jobs():
+    intervals = set()
+    try:
+        res = get_supabase().table("watched_symbols").select("interval").eq("active", True).execute()
+        intervals = {str(r.get("interval") or "5") for r in (res.data or [])}
+    except Exception as e:
+        logger.warning(f"⚠️ Không lấy được interval từ watched_symbols: {e}")
+
+    for interval in sorted(intervals):
+        if interval not in INTERVAL_SECONDS and interval != "M":
+            logger.warning(f"⚠️ Bỏ qua interval không hỗ trợ: {interval}")
+            continue
+        scheduler.add_job(Job(
+            f"sync:{interval}", lambda i=interval: run_sync([], interval=i),
+            next_time=candle_close(interval), jitter_seconds=SCHEDULER_JITTER_SECONDS, group="sync"
+        ))
+
+if os.getenv("SCHEDULER_ENABLED") == "1":
+    register_sync_jobs()
+    scheduler.start()
+    logger.info("⏰ Scheduler đã bật")
+
+@app.route("/scheduler/jobs", methods=["GET"])
+def scheduler_jobs():
+    return jsonify(scheduler.snapshot())
+
+@app.route("/scheduler/history", methods=["GET"])
+def scheduler_history():
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify({ "history": list(scheduler.history)[:limit] })
+
+@app.route("/scheduler/trigger/<path:name>", methods=["POST"])
+def scheduler_trigger(name):
+    if name not in scheduler.jobs:
+        return jsonify({ "error": f"Không có job {name}" }), 404
+    return jsonify({ "job": name, "status": scheduler.trigger(name, source="http") })
+
 # ─────────── Endpoint kiểm tra ───────────
 @app.route("/", methods=["GET"])
 def home():
     return "✅ LHP-AI-SERVER đang hoạt động!"
 
+# ─────────── Warm-up nền: nạp trước những gì request đầu tiên sẽ cần ───────────
+# Module nặng (numpy/pandas/sklearn, script tạo client khi import) không còn nằm trên đường import của app
+HEAVY_MODULES = [
+    "numpy", "pandas", "services.optimize_service", "services.risk_model", "scripts.portfolio_optimizer",
+    "services.candle_buffer", "scripts.bybit.predict_signal", "scripts.bybit.bybit_to_supabase",
+]
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+
+def import_heavy_modules():
+    import importlib
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+warmup = Warmup()
+warmup.add("model:vn", ensure_model)
+warmup.add("supabase", get_supabase)
+warmup.add("modules", import_heavy_modules)
+warmup.add("model:bybit_rf", lambda: get_bybit_model().get())
+warmup.add("portfolio_snapshots", load_portfolio_snapshots)
+# Buffer nến nạp lại từ DB (trước đây là 1 luồng riêng lúc khởi động)
+if os.getenv("CANDLE_BUFFER_REHYDRATE", "1") == "1":
+    warmup.add("candle_buffers", rehydrate_buffers)
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    if not WARMUP_ENABLED:
+        return jsonify({ "ready": True, "warmup": "disabled", "import_s": APP_IMPORT_S })
+    status = { **warmup.snapshot(), "import_s": APP_IMPORT_S }
+    return jsonify(status), 200 if status["ready"] else 503
+
+APP_IMPORT_S = round(time.perf_counter() - APP_IMPORT_STARTED, 4)
+if WARMUP_ENABLED:
+    warmup.start()
+
 # ─────────── Chạy server ───────────
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
@@ -0,0 +1,199 @@
+"""
+Các hot path được đo. Module này phải được import SAU khi run.py đã trỏ
+SUPABASE_BACKEND=local + LOCAL_DB_PATH vào DB dữ liệu giả, vì các script tạo client ngay khi import.
+"""
+import contextlib
+import io
+import itertools
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from benchmarks.harness import Case, ROOT_DIR
+
+
+@contextlib.contextmanager
+def quiet():
+    # Các script in log từng dòng; vẫn chạy phần format nhưng không làm rối output benchmark
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+        yield
+
+
+def _payloads(rng, n: int) -> list:
+    from scripts.generate_synthetic_data import synth_stock_features
+
+    df = synth_stock_features(rng, "BENCH", n)
+    cols = ["close", "volume", "ma20", "rsi", "bb_upper", "bb_lower", "foreign_buy_value", "foreign_sell_value"]
+    # Nhiễu nhỏ để mỗi request là 1 key cache khác nhau → đo đúng đường chạy model
+    values = df[cols].to_numpy() * (1 + rng.normal(0, 1e-3, (n, len(cols))))
+    return [dict(zip(cols, map(float, row))) for row in values]
+
+
+def api_cases(rng) -> list:
+    import app as server
+
+    client = server.app.test_client()
+    singles = itertools.cycle(_payloads(rng, 5000))
+    fixed = next(singles)
+    batches = itertools.cycle([_payloads(rng, 100) for _ in range(50)])
+
+    def predict_single():
+        res = client.post("/predict", json=next(singles))
+        assert res.status_code == 200, res.get_json()
+
+    def predict_single_cached():
+        res = client.post("/predict", json=fixed)
+        assert res.status_code == 200, res.get_json()
+
+    def predict_batch_100():
+        res = client.post("/predict_batch", json={"items": next(batches)})
+        assert res.status_code == 200, res.get_json()
+
+    return [
+        Case("predict.single", predict_single, repeat=200, warmup=10,
+             description="/predict, cache miss"),
+        Case("predict.single_cached", predict_single_cached, repeat=200, warmup=10,
+             description="/predict, cache hit"),
+        Case("predict.batch_100", predict_batch_100, repeat=30, warmup=3,
+             description="/predict_batch 100 dòng, cache miss"),
+    ]
+
+
+def feature_cases(rng) -> list:
+    from scripts.generate_synthetic_data import synth_ohlcv
+    from scripts.bybit import generate_training_data
+    from scripts.bybit.predict_signal import calculate_trade_levels, CANDLE_LOOKBACK
+
+    candles = synth_ohlcv(rng, 2000, start_price=100.0)
+    df = candles.set_index(pd.to_datetime(candles["timestamp"], unit="ms")).drop(columns=["timestamp"])
+    window = candles.tail(CANDLE_LOOKBACK).reset_index(drop=True)
+
+    def generate_features():
+        with quiet():
+            out = generate_training_data.generate_features(df)
+        assert not out.empty
+
+    return [
+        Case("features.generate_features_2000", generate_features, repeat=5, warmup=1,
+             description="generate_training_data.generate_features, 2000 nến 5m"),
+        Case("trade_levels.calculate_trade_levels", lambda: calculate_trade_levels(window),
+             repeat=500, warmup=20, description="predict_signal.calculate_trade_levels, 50 nến"),
+    ]
+
+
+def signal_cases(rng, client) -> list:
+    from scripts import insert_ai_signals, label_ai_signals
+
+    history = {}
+    for code, table in (("VNINDEX", "vnindex_data"), ("VN30", "vn30_data")):
+        df = pd.DataFrame(client.table(table).select("*").order("date").execute().data)
+        df["date"] = pd.to_datetime(df["date"])
+        history[code] = df
+
+    def generate_all():
+        signals = []
+        for code, df in history.items():
+            for i in range(14, len(df)):
+                sub_df = df.iloc[i - 14:i + 1].reset_index(drop=True)
+                signals.append(insert_ai_signals.generate_signal(sub_df, code, sub_df.iloc[-1]["date"]))
+        return signals
+
+    # Dữ liệu cho bước gắn nhãn: toàn bộ tín hiệu lịch sử, chưa có nhãn
+    if not client.table("ai_market_signals").select("id").limit(1).execute().data:
+        rows = [insert_ai_signals.sanitize_signal(s) for s in generate_all()]
+        client.table("ai_market_signals").insert(rows).execute()
+    n_signals = client.table("ai_market_signals").select("id", count="exact").limit(1).execute().count
+
+    def reset_labels():
+        client.table("ai_market_signals").update({"label_win": None}).not_.is_("label_win", None).execute()
+
+    def process_signals():
+        with quiet():
+            label_ai_signals.process_signals()
+
+    return [
+        Case("signals.generate_signal_full_history", generate_all, repeat=3, warmup=1,
+             description=f"insert_ai_signals.generate_signal trên {sum(len(d) - 14 for d in history.values())} ngày"),
+        Case("signals.process_signals", process_signals, setup=reset_labels, repeat=3, warmup=1,
+             description=f"label_ai_signals.process_signals, {n_signals} tín hiệu (DB local)"),
+    ]
+
+
+def portfolio_cases(rng, client) -> list:
+    from scripts.portfolio_optimizer import validate_and_prepare, get_latest_signals, allocate_portfolio
+
+    user = client.table("ai_signals").select("user_id").limit(1).execute().data[0]["user_id"]
+    records = client.table("ai_signals") \
+        .select("symbol, date, ai_predicted_probability, ai_recommendation") \
+        .eq("user_id", user) \
+        .not_.is_("ai_predicted_probability", None) \
+        .execute().data
+    raw = pd.DataFrame(records)
+
+    def allocate():
+        with quiet():
+            df = get_latest_signals(validate_and_prepare(raw))
+            allocate_portfolio(df)
+
+    return [
+        Case("portfolio.allocate_portfolio", allocate, repeat=100, warmup=5,
+             description=f"validate → latest → allocate, {len(raw)} dòng của 1 user"),
+    ]
+
+
+def dtype_cases(rng) -> list:
+    from sklearn.ensemble import RandomForestClassifier
+    from scripts.generate_synthetic_data import synth_ohlcv
+    from scripts.bybit import generate_training_data
+    from services.dtype_policy import DTYPE_PARITY_ATOL, compact, check_parity, memory_mb
+
+    candles = synth_ohlcv(rng, 3000, start_price=100.0)
+    df = candles.set_index(pd.to_datetime(candles["timestamp"], unit="ms")).drop(columns=["timestamp"])
+    with quiet():
+        features = generate_training_data.compute_features(df)
+    y = (df["close"].shift(-3) > df["close"]).astype(int)
+    X64 = features.select_dtypes("number").astype(np.float64).replace([np.inf, -np.inf], np.nan).iloc[:-3].dropna()
+    y = y.loc[X64.index]
+    X32 = compact(X64)
+
+    def fit(X):
+        return RandomForestClassifier(n_estimators=50, max_depth=10, random_state=0, n_jobs=1).fit(X, y)
+
+    # Cùng 1 model, input float64 vs float32/int8/bool → xác suất phải trùng
+    diff = check_parity(fit(X64), X64, X32)
+    assert diff <= DTYPE_PARITY_ATOL, f"dtype gọn lệch xác suất {diff}"
+
+    sizes = f"{memory_mb(X64)} MB → {memory_mb(X32)} MB"
+    return [
+        Case("dtype.rf_fit_float64", lambda: fit(X64), repeat=3, warmup=1,
+             description=f"RandomForest 50 cây, {X64.shape[0]}×{X64.shape[1]} float64"),
+        Case("dtype.rf_fit_compact", lambda: fit(X32), repeat=3, warmup=1,
+             description=f"Như trên, dtype gọn ({sizes}), parity {diff:.1e}"),
+    ]
+
+
+def model_cases() -> list:
+    cases = []
+    for name, path in (("model.load_model_pkl", "model/model.pkl"), ("model.load_model_rf_pkl", "model/model_rf.pkl")):
+        full = os.path.join(ROOT_DIR, path)
+        if os.path.isfile(full):
+            cases.append(Case(name, lambda full=full: joblib.load(full), repeat=5, warmup=1,
+                              description=f"joblib.load {path}"))
+        else:
+            print(f"⚠️ Bỏ qua {name}: không có {path}")
+    return cases
+
+
+def build_cases(client, seed: int = 42) -> list:
+    rng = np.random.default_rng(seed)
+    return (
+        api_cases(rng)
+        + feature_cases(rng)
+        + signal_cases(rng, client)
+        + portfolio_cases(rng, client)
+        + dtype_cases(rng)
+        + model_cases()
+    )
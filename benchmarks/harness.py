@@ -0,0 +1,132 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+BASELINE_PATH = os.path.join(ROOT_DIR, "benchmarks", "baseline.json")
+
+PACKAGES = ["numpy", "pandas", "scikit-learn", "xgboost", "ta", "joblib", "flask"]
+
+# Chênh lệch tuyệt đối nhỏ hơn mức này coi là nhiễu đo, không tính là chậm đi
+NOISE_FLOOR_MS = 0.05
+
+
+class Case:
+    def __init__(self, name, fn, setup=None, repeat=20, warmup=2, description=""):
+        self.name = name
+        self.fn = fn
+        self.setup = setup
+        self.repeat = repeat
+        self.warmup = warmup
+        self.description = description
+
+
+def measure(case: Case, repeat: int = None) -> dict:
+    """Chạy `case.fn` nhiều lần; thời gian `setup` (nếu có) không tính vào kết quả."""
+    repeat = repeat or case.repeat
+    timings = []
+    for i in range(case.warmup + repeat):
+        if case.setup:
+            case.setup()
+        started = time.perf_counter()
+        case.fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        if i >= case.warmup:
+            timings.append(elapsed)
+
+    timings.sort()
+    return {
+        "n": len(timings),
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "max_ms": round(timings[-1], 4),
+        "stdev_ms": round(statistics.stdev(timings), 4) if len(timings) > 1 else 0.0,
+    }
+
+
+def _version(package):
+    try:
+        from importlib.metadata import version
+        return version(package)
+    except Exception:
+        return None
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def environment() -> dict:
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+        "cpu_count": os.cpu_count(),
+        "packages": {p: _version(p) for p in PACKAGES},
+    }
+
+
+def save_results(report: dict, path: str = None) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    path = path or os.path.join(RESULTS_DIR, f"{stamp}.json")
+    for target in (path, os.path.join(RESULTS_DIR, "latest.json")):
+        with open(target, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_baseline(path: str = BASELINE_PATH):
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """So median từng case với baseline; trả về danh sách dòng so sánh kèm cờ `regressed`."""
+    rows = []
+    base_results = baseline.get("results", {})
+    for name, cur in report["results"].items():
+        base = base_results.get(name)
+        if base is None:
+            rows.append({"case": name, "current_ms": cur["median_ms"], "baseline_ms": None,
+                         "ratio": None, "regressed": False})
+            continue
+        ratio = cur["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        regressed = ratio > 1 + threshold and cur["median_ms"] - base["median_ms"] > NOISE_FLOOR_MS
+        rows.append({"case": name, "current_ms": cur["median_ms"], "baseline_ms": base["median_ms"],
+                     "ratio": round(ratio, 3), "regressed": regressed})
+    return rows
+
+
+def environment_drift(report: dict, baseline: dict) -> list:
+    """Các khác biệt môi trường khiến so sánh kém tin cậy (khác máy, khác phiên bản thư viện)."""
+    cur, base = report["meta"], baseline.get("meta", {})
+    drift = [
+        f"{key}: {base.get(key)} → {cur.get(key)}"
+        for key in ("python", "machine", "cpu_count", "processor")
+        if base.get(key) != cur.get(key)
+    ]
+    for pkg, ver in cur.get("packages", {}).items():
+        if base.get("packages", {}).get(pkg) != ver:
+            drift.append(f"{pkg}: {base.get('packages', {}).get(pkg)} → {ver}")
+    return drift
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.harness import (
+    BASELINE_PATH, ROOT_DIR, measure, environment, save_results, load_baseline, compare, environment_drift
+)
+
+# ===== 1. Môi trường offline: DB local + dữ liệu giả cố định seed =====
+BENCH_DB = os.path.join(ROOT_DIR, ".cache", "benchmarks", "bench.db")
+DATA_PARAMS = {
+    "symbols": 5, "candles": 2000, "index_days": 500,
+    "stocks": 30, "users": 5, "signal_days": 60, "pending_days": 1, "seed": 42,
+}
+
+
+def prepare_environment(db_path: str, params: dict, rebuild: bool):
+    os.environ["SUPABASE_BACKEND"] = "local"
+    os.environ["LOCAL_DB_PATH"] = db_path
+    # Server chạy trong tiến trình benchmark: tắt mọi luồng nền
+    os.environ["SCHEDULER_ENABLED"] = "0"
+    os.environ["REALTIME_REFRESH"] = "0"
+    os.environ["CANDLE_BUFFER_REHYDRATE"] = "0"
+    os.environ["SHARDING_ENABLED"] = "0"
+    os.environ["WARMUP_ENABLED"] = "0"
+    # Log đi qua hàng đợi ra stderr, quiet() không chặn được → chỉ giữ cảnh báo
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(ROOT_DIR)
+
+    from services.db import get_client
+    from scripts.generate_synthetic_data import generate
+
+    if rebuild:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    client = get_client()
+    if not client.columns("ohlcv_data"):
+        print(f"🧪 Sinh dữ liệu giả → {db_path}")
+        generate(client, **params)
+    return client
+
+
+# ===== 2. Chạy & so sánh với baseline =====
+def print_table(rows):
+    print(f"\n{'case':45} {'baseline':>11} {'current':>11} {'ratio':>7}")
+    for r in rows:
+        base = f"{r['baseline_ms']:.3f}ms" if r["baseline_ms"] is not None else "-"
+        ratio = f"{r['ratio']:.2f}x" if r["ratio"] is not None else "mới"
+        flag = " ❌" if r["regressed"] else ""
+        print(f"{r['case']:45} {base:>11} {r['current_ms']:>9.3f}ms {ratio:>7}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các hot path trên dữ liệu giả, so với baseline")
+    parser.add_argument("--only", help="Chỉ chạy case có tên chứa chuỗi này (nhiều giá trị cách nhau dấu phẩy)")
+    parser.add_argument("--repeat", type=int, help="Ghi đè số lần lặp của mọi case")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_REGRESSION_THRESHOLD", 0.25)),
+                        help="Tỉ lệ chậm đi tối đa so với baseline (0.25 = +25%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="Ghi kết quả lần này làm baseline mới")
+    parser.add_argument("--rebuild-data", action="store_true", help="Sinh lại DB dữ liệu giả")
+    parser.add_argument("--db", default=BENCH_DB)
+    parser.add_argument("--list", action="store_true", help="Liệt kê các case rồi thoát")
+    args = parser.parse_args()
+
+    client = prepare_environment(args.db, DATA_PARAMS, args.rebuild_data)
+
+    from benchmarks.cases import build_cases
+    cases = build_cases(client, seed=DATA_PARAMS["seed"])
+    if args.only:
+        keys = [k.strip() for k in args.only.split(",") if k.strip()]
+        cases = [c for c in cases if any(k in c.name for k in keys)]
+    if args.list:
+        for c in cases:
+            print(f"{c.name:45} {c.description}")
+        return 0
+
+    report = {"meta": {**environment(), "data": DATA_PARAMS}, "results": {}}
+    for case in cases:
+        print(f"⏱️ {case.name} ...", flush=True)
+        stats = measure(case, args.repeat)
+        report["results"][case.name] = {**stats, "description": case.description}
+        print(f"   median {stats['median_ms']:.3f}ms | p95 {stats['p95_ms']:.3f}ms | n={stats['n']}")
+
+    path = save_results(report)
+    print(f"\n💾 Đã lưu kết quả: {path}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📌 Đã cập nhật baseline: {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"ℹ️ Chưa có baseline ({args.baseline}) → chạy lại với --update-baseline để tạo")
+        return 0
+
+    drift = environment_drift(report, baseline)
+    if drift:
+        print("⚠️ Môi trường khác baseline, so sánh có thể lệch:")
+        for line in drift:
+            print(f"   - {line}")
+
+    rows = compare(report, baseline, args.threshold)
+    print_table(rows)
+    regressed = [r["case"] for r in rows if r["regressed"]]
+    if regressed:
+        print(f"\n❌ {len(regressed)} case chậm hơn baseline quá {args.threshold:.0%}: {', '.join(regressed)}")
+        return 1
+    print(f"\n✅ Không có case nào chậm hơn baseline quá {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
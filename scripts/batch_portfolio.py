@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import json
+import pandas as pd
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.portfolio_optimizer import (
+    validate_and_prepare, get_latest_signals_grouped, allocate_portfolio_grouped, portfolio_etag
+)
+from utils.logger import get_logger
+
+logger = get_logger("batch_portfolio")
+
+# ===== 1. Cấu hình =====
+BATCH_COLUMNS = "user_id, symbol, date, ai_predicted_probability, ai_recommendation"
+LOOKBACK_DAYS = int(os.getenv("PORTFOLIO_BATCH_LOOKBACK_DAYS", 7))
+PAGE_SIZE = 1000
+OUTPUT_COLUMNS = ["symbol", "probability", "recommendation", "allocation"]
+
+# ===== 2. Lấy tín hiệu mới nhất của mọi user trong 1 lượt (phân trang) =====
+def fetch_recent_signals(supabase, lookback_days: int = LOOKBACK_DAYS) -> pd.DataFrame:
+    latest = supabase.table("ai_signals").select("date").order("date", desc=True).limit(1).execute()
+    if not latest.data:
+        return pd.DataFrame(columns=BATCH_COLUMNS.split(", "))
+
+    since = (pd.to_datetime(latest.data[0]["date"]) - timedelta(days=lookback_days)).strftime("%Y-%m-%d")
+    # Phân trang keyset theo id (duy nhất) như predict_all → không sót / lặp dòng giữa các trang
+    rows, after_id = [], None
+    while True:
+        query = supabase.table("ai_signals") \
+            .select(f"id, {BATCH_COLUMNS}") \
+            .gte("date", since)
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        data = query.order("id").limit(PAGE_SIZE).execute().data or []
+        rows.extend(data)
+        if len(data) < PAGE_SIZE:
+            break
+        after_id = data[-1]["id"]
+    return pd.DataFrame(rows, columns=BATCH_COLUMNS.split(", "))
+
+# ===== 3. Tính danh mục cho toàn bộ user =====
+def compute_all_portfolios(raw: pd.DataFrame) -> dict:
+    if raw.empty:
+        return {}
+
+    df = raw.copy()
+    df["date_raw"] = df["date"]
+    df = validate_and_prepare(df.dropna(subset=["user_id"]))
+    df = get_latest_signals_grouped(df)
+    alloc = allocate_portfolio_grouped(df)
+
+    entries = {}
+    for user_id, group in alloc.groupby("user_id", sort=False):
+        payload = {
+            "date": group["date_raw"].iloc[0],
+            "portfolio": group[OUTPUT_COLUMNS].to_dict(orient="records"),
+        }
+        entries[user_id] = {**payload, "etag": portfolio_etag(payload)}
+    return entries
+
+# ===== 4. Ghi bảng portfolio_snapshots =====
+def save_snapshots(supabase, entries: dict):
+    computed_at = datetime.utcnow().isoformat()
+    rows = [
+        {
+            "user_id": user_id,
+            "date": e["date"],
+            "portfolio": e["portfolio"],
+            "etag": e["etag"],
+            "computed_at": computed_at,
+        }
+        for user_id, e in entries.items()
+    ]
+    for i in range(0, len(rows), PAGE_SIZE):
+        supabase.table("portfolio_snapshots") \
+            .upsert(rows[i:i + PAGE_SIZE], on_conflict="user_id") \
+            .execute()
+
+# ===== 5. Đọc lại portfolio_snapshots (mọi worker dùng chung kết quả batch) =====
+SNAPSHOT_COLUMNS = "user_id, date, portfolio, etag"
+
+def snapshot_entry(row: dict) -> dict:
+    portfolio = row["portfolio"]
+    if isinstance(portfolio, str):  # DB local lưu jsonb dạng text
+        portfolio = json.loads(portfolio)
+    return {"date": row["date"], "portfolio": portfolio, "etag": row["etag"]}
+
+def load_snapshot(supabase, user_id):
+    res = supabase.table("portfolio_snapshots") \
+        .select(SNAPSHOT_COLUMNS) \
+        .eq("user_id", user_id) \
+        .limit(1) \
+        .execute()
+    return snapshot_entry(res.data[0]) if res.data else None
+
+def load_snapshots(supabase) -> dict:
+    # user_id là khoá chính → thứ tự phân trang ổn định
+    entries, start = {}, 0
+    while True:
+        data = supabase.table("portfolio_snapshots") \
+            .select(SNAPSHOT_COLUMNS) \
+            .order("user_id") \
+            .range(start, start + PAGE_SIZE - 1) \
+            .execute().data or []
+        entries.update({row["user_id"]: snapshot_entry(row) for row in data})
+        if len(data) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    return entries
+
+def run_batch(supabase, store=None, persist: bool = True) -> dict:
+    started = time.perf_counter()
+    raw = fetch_recent_signals(supabase)
+    entries = compute_all_portfolios(raw)
+    duration = time.perf_counter() - started
+
+    if store is not None:
+        store.replace_all(entries, duration)
+    if persist and entries:
+        save_snapshots(supabase, entries)
+
+    logger.info(f"✅ Đã tính danh mục cho {len(entries)} user ({len(raw)} dòng) sau {duration:.2f}s",
+                users=len(entries), rows=len(raw))
+    return entries
+
+# ===== 6. Chạy trực tiếp =====
+if __name__ == "__main__":
+    from services.db import get_client
+
+    load_dotenv()
+    client = get_client()
+    result = run_batch(client)
+    print(json.dumps({"message": "✅ Batch portfolio xong", "users": len(result)}, ensure_ascii=False))
@@ -1,12 +1,17 @@
 import os
+import sys
 import uuid
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
-from supabase import create_client
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from services.db import get_client
+from utils.logger import get_logger
 
 # ===== 1. Load biến môi trường =====
 load_dotenv()
-supabase = create_client(
+logger = get_logger("bybit.execute_signals")
+supabase = get_client(
     os.getenv("SUPABASE_URL"),
     os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 )
@@ -19,6 +24,12 @@ TIME_WINDOW_MINUTES = 45
 def get_now_vn():
     return datetime.now(timezone(timedelta(hours=7)))
 
+def safe_float(value):
+    try:
+        return float(value)
+    except:
+        return 0.0
+
 # ===== 4. Xử lý tín hiệu =====
 def execute_signals():
     now_utc = datetime.utcnow()
@@ -34,10 +45,10 @@ def execute_signals():
             .execute()
 
         predictions = response.data or []
-        print(f"📥 Có {len(predictions)} tín hiệu mạnh cần xử lý...")
+        logger.info(f"📥 Có {len(predictions)} tín hiệu mạnh cần xử lý...")
 
     except Exception as e:
-        print(f"❌ Lỗi khi truy vấn ai_predictions: {e}")
+        logger.error(f"❌ Lỗi khi truy vấn ai_predictions: {e}")
         return
 
     for pred in predictions:
@@ -46,7 +57,7 @@ def execute_signals():
         prediction_id = pred.get("id")
 
         if action == "HOLD":
-            print(f"⏭️ Bỏ qua tín hiệu HOLD cho {symbol}")
+            logger.info(f"⏭️ Bỏ qua tín hiệu HOLD cho {symbol}")
             continue
 
         try:
@@ -57,19 +68,13 @@ def execute_signals():
                 .execute()
 
             if check and check.data:
-                print(f"⚠️ Tín hiệu {symbol} đã được xử lý trước đó. Bỏ qua.")
+                logger.warning(f"⚠️ Tín hiệu {symbol} đã được xử lý trước đó. Bỏ qua.")
                 continue
         except Exception as e:
-            print(f"❌ Lỗi khi kiểm tra log cho {symbol}: {e}")
+            logger.error(f"❌ Lỗi khi kiểm tra log cho {symbol}: {e}")
             continue
 
         # ✅ Lấy dữ liệu AI
-        def safe_float(value):
-            try:
-                return float(value)
-            except:
-                return 0.0
-
         entry_price    = safe_float(pred.get("entry_price"))
         tp             = safe_float(pred.get("tp"))
         sl             = safe_float(pred.get("sl"))
@@ -86,14 +91,14 @@ def execute_signals():
             try:
                 signal_time = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
                 age_minutes = (datetime.now(timezone.utc) - signal_time).total_seconds() / 60
-                print(f"🕒 Tín hiệu {symbol} cách đây khoảng {round(age_minutes)} phút")
+                logger.debug(f"🕒 Tín hiệu {symbol} cách đây khoảng {round(age_minutes)} phút")
             except Exception as e:
-                print(f"⚠️ Lỗi khi xử lý thời gian cho {symbol}: {e}")
+                logger.warning(f"⚠️ Lỗi khi xử lý thời gian cho {symbol}: {e}")
 
         # Kiểm tra giá trị đầu vào
-        print(f"✅ DEBUG: {symbol} | entry: {entry_price}, tp: {tp}, sl: {sl}, price_now: {current_price}")
+        logger.debug(f"✅ DEBUG: {symbol} | entry: {entry_price}, tp: {tp}, sl: {sl}, price_now: {current_price}")
 
-        print(f"➡️ Vào lệnh {action} {symbol} tại giá {entry_price}")
+        logger.info(f"➡️ Vào lệnh {action} {symbol} tại giá {entry_price}")
 
         log_data = {
             "id": str(uuid.uuid4()),
@@ -115,7 +120,7 @@ def execute_signals():
 
         try:
             supabase.table("trading_logs").insert(log_data).execute()
-            print(f"✅ Đã ghi log lệnh {action} cho {symbol}")
+            logger.info(f"✅ Đã ghi log lệnh {action} cho {symbol}")
 
             try:
                 supabase.table("ai_predictions") \
@@ -123,13 +128,118 @@ def execute_signals():
                     .eq("id", prediction_id) \
                     .execute()
             except Exception as e:
-                print(f"⚠️ Không thể cập nhật 'executed' cho {symbol}: {e}")
+                logger.warning(f"⚠️ Không thể cập nhật 'executed' cho {symbol}: {e}")
 
         except Exception as e:
-            print(f"❌ Lỗi khi ghi log cho {symbol}: {e}")
+            logger.error(f"❌ Lỗi khi ghi log cho {symbol}: {e}")
+
+    logger.info("🎯 Hoàn tất xử lý tất cả tín hiệu!")
+
+# ===== 5. Xử lý tín hiệu theo lô (set-based) =====
+# Tránh 3 round-trip / tín hiệu: 1 truy vấn in_, 1 upsert hàng loạt, 1 update hàng loạt.
+# Tính idempotent dựa trên unique key trading_logs.prediction_id
+# (xem sql/trading_logs_prediction_id_unique.sql), không đọc-trước-ghi.
+def build_log_row(pred, executed_at):
+    return {
+        "id": str(uuid.uuid4()),
+        "symbol": pred.get("symbol"),
+        "action": pred.get("prediction"),
+        "price": safe_float(pred.get("entry_price")),
+        "tp": safe_float(pred.get("tp")),
+        "sl": safe_float(pred.get("sl")),
+        "high": safe_float(pred.get("high")),
+        "low": safe_float(pred.get("low")),
+        "current_price": safe_float(pred.get("current_price")),
+        "qty": 0.01,
+        "executed_at": executed_at,
+        "predicted_by": pred.get("model_name", "AI"),
+        "prediction_id": pred.get("id"),
+        "notes": "Tự động tạo từ AI",
+        "created_at": executed_at
+    }
+
+def execute_signals_batch():
+    now_utc = datetime.utcnow()
+    window_start = int((now_utc - timedelta(minutes=TIME_WINDOW_MINUTES)).timestamp() * 1000)
+
+    try:
+        response = supabase.table("ai_predictions") \
+            .select("*") \
+            .gte("confidence", CONFIDENCE_THRESHOLD) \
+            .gte("timestamp", window_start) \
+            .neq("prediction", "HOLD") \
+            .order("timestamp", desc=True) \
+            .limit(50) \
+            .execute()
+        predictions = response.data or []
+        logger.info(f"📥 Có {len(predictions)} tín hiệu mạnh cần xử lý...")
+    except Exception as e:
+        logger.error(f"❌ Lỗi khi truy vấn ai_predictions: {e}")
+        return 0
+
+    if not predictions:
+        logger.info("🎯 Không có tín hiệu nào cần xử lý.")
+        return 0
+
+    candidate_ids = [p["id"] for p in predictions if p.get("id") is not None]
+
+    # 1 truy vấn: các prediction_id đã có log (lọc sớm để không gửi dòng thừa)
+    try:
+        existing = supabase.table("trading_logs") \
+            .select("prediction_id") \
+            .in_("prediction_id", candidate_ids) \
+            .execute()
+        done_ids = {r["prediction_id"] for r in (existing.data or [])}
+    except Exception as e:
+        logger.warning(f"⚠️ Không lấy được trading_logs đã có, dựa vào unique key: {e}")
+        done_ids = set()
+
+    executed_at = get_now_vn().isoformat()
+    rows = [
+        build_log_row(p, executed_at)
+        for p in predictions
+        if p.get("id") is not None and p["id"] not in done_ids
+    ]
+    skipped = len(predictions) - len(rows)
+    if skipped:
+        logger.warning(f"⚠️ Bỏ qua {skipped} tín hiệu đã được xử lý trước đó.")
+
+    if not rows:
+        logger.info("🎯 Hoàn tất: không có lệnh mới.")
+        return 0
+
+    # 1 request: ghi toàn bộ lệnh, trùng prediction_id thì bỏ qua;
+    # chỉ các dòng thật sự được insert được trả về (replica khác ghi trước → không có trong kết quả)
+    try:
+        res = supabase.table("trading_logs") \
+            .upsert(rows, on_conflict="prediction_id", ignore_duplicates=True, returning="representation") \
+            .execute()
+        inserted = res.data or []
+    except Exception as e:
+        logger.error(f"❌ Lỗi khi ghi log lệnh hàng loạt: {e}")
+        return 0
+
+    raced = len(rows) - len(inserted)
+    if raced:
+        logger.warning(f"⚠️ {raced} tín hiệu vừa được tiến trình khác ghi trước. Bỏ qua.")
+    if not inserted:
+        logger.info("🎯 Hoàn tất: không có lệnh mới.")
+        return 0
+    for row in inserted:
+        logger.info(f"➡️ Vào lệnh {row['action']} {row['symbol']} tại giá {row['price']}")
+
+    # 1 request: đánh dấu executed cho các lệnh vừa ghi
+    try:
+        supabase.table("ai_predictions") \
+            .update({ "executed": True }) \
+            .in_("id", [row["prediction_id"] for row in inserted]) \
+            .execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Không thể cập nhật 'executed' hàng loạt: {e}")
 
-    print("🎯 Hoàn tất xử lý tất cả tín hiệu!")
+    logger.info(f"🎯 Hoàn tất: đã ghi {len(inserted)} lệnh mới!")
+    return len(inserted)
 
-# ===== 5. Chạy nếu gọi trực tiếp =====
+# ===== 6. Chạy nếu gọi trực tiếp =====
 if __name__ == "__main__":
-    execute_signals()
+    execute_signals_batch()
@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from services.backtest_service import run_backtest, summarize
+
+# ===== 1. Cấu hình =====
+sys.stdout.reconfigure(encoding='utf-8')
+load_dotenv()
+
+PAGE_SIZE = 1000
+# created_at: sweep_thresholds cần để tính độ trễ tín hiệu (TIME_WINDOW_MINUTES) khi chạy từ snapshot
+PREDICTION_COLUMNS = "symbol, timestamp, prediction, confidence, model_name, entry_price, tp, sl, created_at"
+CANDLE_COLUMNS = "symbol, timestamp, high, low, close"
+
+# ===== 2. Tải dữ liệu từ Supabase (phân trang) =====
+def fetch_table(supabase, table: str, columns: str) -> pd.DataFrame:
+    # timestamp trùng giữa các symbol → phân trang offset theo timestamp có thể sót / lặp dòng;
+    # keyset theo id (duy nhất) thay thế, run_backtest tự sắp lại theo (symbol, timestamp)
+    rows, after_id = [], None
+    while True:
+        query = supabase.table(table).select(f"id, {columns}")
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        data = query.order("id").limit(PAGE_SIZE).execute().data or []
+        rows.extend(data)
+        if len(data) < PAGE_SIZE:
+            break
+        after_id = data[-1]["id"]
+    return pd.DataFrame(rows, columns=[c.strip() for c in columns.split(",")])
+
+def load_from_supabase():
+    from services.db import get_client
+
+    supabase = get_client()
+    print("📥 Đang tải ai_predictions và ohlcv_data từ Supabase...")
+    predictions = fetch_table(supabase, "ai_predictions", PREDICTION_COLUMNS)
+    candles = fetch_table(supabase, "ohlcv_data", CANDLE_COLUMNS)
+    return predictions, candles
+
+# ===== 3. Snapshot Parquet để chạy offline =====
+def load_snapshot(snapshot_dir: str):
+    print(f"📂 Đọc snapshot từ {snapshot_dir}...")
+    predictions = pd.read_parquet(os.path.join(snapshot_dir, "ai_predictions.parquet"))
+    candles = pd.read_parquet(os.path.join(snapshot_dir, "ohlcv_data.parquet"))
+    return predictions, candles
+
+def save_snapshot(snapshot_dir: str, predictions: pd.DataFrame, candles: pd.DataFrame):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    predictions.to_parquet(os.path.join(snapshot_dir, "ai_predictions.parquet"), index=False)
+    candles.to_parquet(os.path.join(snapshot_dir, "ohlcv_data.parquet"), index=False)
+    print(f"💾 Đã lưu snapshot vào {snapshot_dir}")
+
+# ===== 4. Chạy chính =====
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest ai_predictions trên ohlcv_data")
+    parser.add_argument("--snapshot", help="Thư mục snapshot Parquet (chạy offline)")
+    parser.add_argument("--save-snapshot", help="Tải từ Supabase rồi lưu snapshot vào thư mục này")
+    parser.add_argument("--threshold", type=float, default=0.75, help="Ngưỡng confidence (mặc định = CONFIDENCE_THRESHOLD)")
+    parser.add_argument("--horizon", type=int, default=288, help="Số nến tối đa giữ lệnh (288 nến 5m = 1 ngày)")
+    parser.add_argument("--fee", type=float, default=0.0006, help="Phí mỗi chiều (tỉ lệ)")
+    parser.add_argument("--trades-out", help="Ghi chi tiết lệnh ra file CSV")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.snapshot:
+        predictions, candles = load_snapshot(args.snapshot)
+    else:
+        predictions, candles = load_from_supabase()
+        if args.save_snapshot:
+            save_snapshot(args.save_snapshot, predictions, candles)
+
+    print(f"📊 {len(predictions)} tín hiệu | {len(candles)} nến")
+
+    started = time.perf_counter()
+    trades = run_backtest(
+        predictions, candles,
+        confidence_threshold=args.threshold,
+        horizon=args.horizon,
+        fee_rate=args.fee
+    )
+    elapsed = time.perf_counter() - started
+    print(f"⚡ Backtest {len(trades)} lệnh trong {elapsed:.2f}s")
+
+    if trades.empty:
+        print("⚠️ Không có lệnh nào thoả điều kiện.")
+        return trades
+
+    print("\n=== 📈 THEO SYMBOL ===")
+    print(summarize(trades, by="symbol").to_string(index=False))
+    print("\n=== 🤖 THEO MODEL ===")
+    print(summarize(trades, by="model_name").to_string(index=False))
+
+    if args.trades_out:
+        trades.to_csv(args.trades_out, index=False)
+        print(f"💾 Đã ghi chi tiết lệnh vào {args.trades_out}")
+
+    return trades
+
+if __name__ == "__main__":
+    main()
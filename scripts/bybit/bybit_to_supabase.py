@@ -1,22 +1,32 @@
+import logging
 import requests
 import os
 import sys
-from supabase import create_client, Client
 from dotenv import load_dotenv
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from services.db import get_client, has_credentials
+from services.sharding import filter_owned
+from services.scheduler import INTERVAL_SECONDS
+from services.candle_buffer import candle_buffers
+from services.metrics import metrics
+from services.profiling import profiled, span
+from utils.logger import get_logger, log_context
+
 # ====== 1. Nạp biến môi trường từ .env ======
 sys.stdout.reconfigure(encoding='utf-8')
 load_dotenv()
+logger = get_logger("bybit.sync")
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    print("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
+if not has_credentials():
+    logger.error("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
     sys.exit(1)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = get_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 # ====== 2. Cấu hình mặc định ======
 BYBIT_API_URL = "https://api.bybit.com/v5/market/kline"
@@ -24,9 +34,9 @@ CATEGORY = "linear"
 DEFAULT_INTERVAL = "5"
 DEFAULT_LIMIT = 100
 
-# ====== 3. Hàm in log có timestamp ======
-def log(msg: str):
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}")
+# ====== 3. Ghi log qua utils.logger (timestamp do logger thêm) ======
+def log(msg: str, level: int = logging.INFO):
+    logger.log(level, msg)
 
 # ====== 4. Lấy danh sách symbol đang theo dõi kèm interval & candle_limit ======
 def get_active_symbols():
@@ -37,7 +47,7 @@ def get_active_symbols():
                       .execute()
         return res.data or []
     except Exception as e:
-        log(f"❌ Lỗi khi lấy danh sách coin: {e}")
+        log(f"❌ Lỗi khi lấy danh sách coin: {e}", logging.ERROR)
         return []
 
 # ====== 5. Lấy dữ liệu nến từ Bybit ======
@@ -49,11 +59,11 @@ def fetch_candles(symbol: str, interval: str, limit: int):
         "limit": limit
     }
     try:
-        response = requests.get(BYBIT_API_URL, params=params, timeout=10)
-        data = response.json()
-
-        if response.status_code != 200 or data.get("retCode") != 0:
-            raise Exception(f"Bybit lỗi: {data.get('retMsg')}")
+        with metrics.timer("bybit_request_duration_seconds", {"endpoint": "kline"}, counter="bybit_requests_total"):
+            response = requests.get(BYBIT_API_URL, params=params, timeout=10)
+            data = response.json()
+            if response.status_code != 200 or data.get("retCode") != 0:
+                raise Exception(f"Bybit lỗi: {data.get('retMsg')}")
 
         candles = data.get("result", {}).get("list", [])
         if not candles:
@@ -65,12 +75,40 @@ def fetch_candles(symbol: str, interval: str, limit: int):
         raise Exception(f"🚨 Lỗi khi gọi API Bybit: {e}")
 
 # ====== 6. Lưu dữ liệu nến vào Supabase ======
-def save_to_supabase(symbol: str, candles: list):
+# Listener nhận (symbol, interval, [timestamp nến mới]) mỗi khi có nến mới được lưu
+_candle_listeners = []
+
+def register_candle_listener(fn):
+    if fn not in _candle_listeners:
+        _candle_listeners.append(fn)
+    return fn
+
+def notify_candle_listeners(symbol: str, interval, timestamps: list):
+    for fn in list(_candle_listeners):
+        try:
+            fn(symbol, interval, timestamps)
+        except Exception as e:
+            log(f"⚠️ Listener nến lỗi ({symbol}): {e}", logging.WARNING)
+
+# Bybit trả cả cây nến đang chạy → chỉ lưu nến đã đóng để dữ liệu không bị "đóng băng" giữa chừng
+def is_closed(timestamp: int, interval, now_ms: int = None) -> bool:
+    period = INTERVAL_SECONDS.get(str(interval)) if interval is not None else None
+    if period is None:
+        return True
+    now_ms = now_ms if now_ms is not None else int(datetime.now().timestamp() * 1000)
+    return timestamp + period * 1000 <= now_ms
+
+def save_to_supabase(symbol: str, candles: list, interval=None):
     inserted = 0
+    new_timestamps = []
+    closed = []
     for candle in candles:
         try:
             timestamp, open_, high, low, close, volume, *_ = candle
             timestamp = int(timestamp)
+            if not is_closed(timestamp, interval):
+                continue
+            closed.append((timestamp, open_, high, low, close, volume))
 
             # Kiểm tra trùng timestamp + symbol
             exists = supabase.table("ohlcv_data") \
@@ -91,22 +129,36 @@ def save_to_supabase(symbol: str, candles: list):
                 "volume": float(volume)
             }).execute()
             inserted += 1
+            new_timestamps.append(timestamp)
         except Exception as e:
-            log(f"⚠️ Lỗi khi lưu nến {symbol} tại {timestamp}: {e}")
+            # Lỗi theo từng nến → giới hạn tần suất để không làm chậm vòng lặp
+            logger.every(("save_error", symbol), f"⚠️ Lỗi khi lưu nến {symbol} tại {timestamp}: {e}", level=logging.WARNING)
+
+    # Buffer trong RAM luôn có nến mới nhất, kể cả nến đã có sẵn trong DB
+    candle_buffers.add_candles(symbol, closed)
+    if new_timestamps:
+        notify_candle_listeners(symbol, interval, sorted(new_timestamps))
     return inserted
 
 # ====== 7. Hàm chính để gọi từ app.py ======
-def run_sync(logs=None):
+def run_sync(logs=None, interval=None):
     if logs is None:
         logs = []
 
     total = 0
     symbols = get_active_symbols()
 
+    # Chỉ đồng bộ các symbol có interval tương ứng (scheduler chạy theo giờ đóng nến)
+    if interval is not None:
+        symbols = [s for s in symbols if str(s.get("interval") or DEFAULT_INTERVAL) == str(interval)]
+
+    # Nhiều replica → mỗi replica chỉ đồng bộ phần symbol nó sở hữu
+    symbols = filter_owned(symbols, key=lambda s: s.get("symbol"))
+
     if not symbols:
         msg = "⚠️ Không có đồng coin nào đang được theo dõi."
         logs.append(msg)
-        log(msg)
+        log(msg, logging.WARNING)
         return 0
 
     for item in symbols:
@@ -115,12 +167,15 @@ def run_sync(logs=None):
         limit = item.get("candle_limit") or DEFAULT_LIMIT
 
         try:
-            logs.append(f"\n📥 Đang xử lý {symbol} ({interval} - {limit} nến)...")
-            candles = fetch_candles(symbol, interval, limit)
-            logs.append(f"🟢 Lấy được {len(candles)} cây nến từ Bybit.")
-            count = save_to_supabase(symbol, candles)
-            logs.append(f"✅ Đã lưu {count} cây nến mới vào Supabase.")
-            total += count
+            with log_context(symbol=symbol):
+                logs.append(f"\n📥 Đang xử lý {symbol} ({interval} - {limit} nến)...")
+                with span("fetch"):
+                    candles = fetch_candles(symbol, interval, limit)
+                logs.append(f"🟢 Lấy được {len(candles)} cây nến từ Bybit.")
+                with span("write"):
+                    count = save_to_supabase(symbol, candles, interval)
+                logs.append(f"✅ Đã lưu {count} cây nến mới vào Supabase.")
+                total += count
         except Exception as e:
             logs.append(f"❌ {symbol} bị lỗi: {e}")
     return total
@@ -128,6 +183,7 @@ def run_sync(logs=None):
 # ====== 8. Nếu chạy trực tiếp thì tự chạy ======
 if __name__ == "__main__":
     logs = []
-    inserted = run_sync(logs)
+    with profiled("bybit_to_supabase"):
+        inserted = run_sync(logs)
     for line in logs:
         log(line)
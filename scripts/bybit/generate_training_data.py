@@ -1,24 +1,33 @@
+import logging
 import os
 import sys
 import pandas as pd
 import numpy as np
-from supabase import create_client, Client
 from ta import add_all_ta_features
 from dotenv import load_dotenv
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from services.db import get_client, has_credentials
+from services.label_engine import build_labels, label_columns, LABEL_UNKNOWN
+from services.sharding import filter_owned
+from services.candle_buffer import candle_buffers
+from services.profiling import profiled, span
+from utils.logger import get_logger, log_context
+
 # ====== 1. Nạp biến môi trường từ .env ======
 sys.stdout.reconfigure(encoding='utf-8')
 load_dotenv()
+logger = get_logger("bybit.generate_training_data")
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    print("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
+if not has_credentials():
+    logger.error("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
     sys.exit(1)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = get_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 # ===== 2. Lấy danh sách symbol cần xử lý =====
 def get_watched_symbols():
@@ -26,7 +35,7 @@ def get_watched_symbols():
         res = supabase.table("watched_symbols").select("symbol").execute()
         return [s["symbol"] for s in res.data if s.get("symbol")]
     except Exception as e:
-        print(f"❌ Không thể lấy danh sách symbol: {e}")
+        logger.error(f"❌ Không thể lấy danh sách symbol: {e}")
         return []
 
 # ===== 3. Lấy dữ liệu nến từ ohlcv_data =====
@@ -35,137 +44,182 @@ def fetch_ohlcv(symbol: str) -> pd.DataFrame:
         response = supabase.table("ohlcv_data").select("*").eq("symbol", symbol).order("timestamp").execute()
         raw = response.data
         if not raw:
-            print(f"⚠️ Không có dữ liệu OHLCV cho {symbol}")
+            logger.warning(f"⚠️ Không có dữ liệu OHLCV cho {symbol}")
             return pd.DataFrame()
         df = pd.DataFrame(raw)
         df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
         df.set_index('timestamp', inplace=True)
         return df
     except Exception as e:
-        print(f"❌ Lỗi khi fetch dữ liệu OHLCV của {symbol}: {e}")
+        logger.error(f"❌ Lỗi khi fetch dữ liệu OHLCV của {symbol}: {e}")
         return pd.DataFrame()
 
 # ===== 4. Tính chỉ báo kỹ thuật & target =====
+# Số nến tối thiểu phía trước để chỉ báo của nến cuối ổn định (dùng khi chấm điểm realtime)
+FEATURE_WARMUP = 200
+
+def compute_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Chỉ báo kỹ thuật + feature bổ sung, không cần nến tương lai → dùng được cho nến vừa đóng."""
+    df = df.copy()
+    df = add_all_ta_features(
+        df,
+        open="open", high="high", low="low", close="close", volume="volume",
+        fillna=True
+    )
+
+    # Các feature bổ sung sẽ được tạo 1 lần rồi concat vào dataframe
+    new_features = pd.DataFrame({
+        "ema_cross": (df["trend_ema_fast"] > df["trend_ema_slow"]).astype(np.int8),
+        "bb_width_pct": ((df["volatility_bbh"] - df["volatility_bbl"]) / df["volatility_bbm"]).fillna(0),
+        "volume_change_pct": df["volume"].pct_change().fillna(0),
+        "price_change_pct": df["close"].pct_change().fillna(0),
+        "candle_body": abs(df["close"] - df["open"]),
+        "upper_wick": df["high"] - df[["close", "open"]].max(axis=1),
+        "lower_wick": df[["close", "open"]].min(axis=1) - df["low"],
+        "volume_spike": (df["volume"] > df["volume"].rolling(20).mean() * 1.5).astype(bool),
+        "rsi_reversal": ((df["momentum_rsi"] < 30) | (df["momentum_rsi"] > 70)).astype(np.int8),
+        "macd_divergence": df["trend_macd"] - df["trend_macd_signal"],
+        "reversal_candle": (
+            (abs(df["close"] - df["open"]) > (df["high"] - df[["close", "open"]].max(axis=1) +
+                                              df[["close", "open"]].min(axis=1) - df["low"])) &
+            ((df["high"] - df[["close", "open"]].max(axis=1)) > abs(df["close"] - df["open"]) * 0.5)
+        ).astype(np.int8),
+        "hour_of_day": df.index.hour.astype(np.int8),
+        "day_of_week": df.index.dayofweek.astype(np.int8),
+    })
+    return pd.concat([df, new_features], axis=1)
+
 def generate_features(df: pd.DataFrame) -> pd.DataFrame:
     try:
-        df = df.copy()
-        df = add_all_ta_features(
-            df,
-            open="open", high="high", low="low", close="close", volume="volume",
-            fillna=True
-        )
+        df = compute_features(df)
 
         df["future_close"] = df["close"].shift(-3)
         df["target"] = "hold"
         df.loc[df["future_close"] > df["close"] * 1.002, "target"] = "buy"
         df.loc[df["future_close"] < df["close"] * 0.998, "target"] = "sell"
+        df["signal"] = df["target"].map({"buy": 1, "sell": -1}).fillna(0).astype(int)
+
+        # Nhãn nhiều horizon/ngưỡng tính 1 lượt, lưu dạng int8 cạnh các feature
+        labels = build_labels(df["close"])
 
-        # Các feature bổ sung sẽ được tạo 1 lần rồi concat vào dataframe
-        new_features = pd.DataFrame({
-            "ema_cross": (df["trend_ema_fast"] > df["trend_ema_slow"]).astype(int),
-            "signal": df["target"].map({"buy": 1, "sell": -1}).fillna(0).astype(int),
-            "bb_width_pct": ((df["volatility_bbh"] - df["volatility_bbl"]) / df["volatility_bbm"]).fillna(0),
-            "volume_change_pct": df["volume"].pct_change().fillna(0),
-            "price_change_pct": df["close"].pct_change().fillna(0),
-            "candle_body": abs(df["close"] - df["open"]),
-            "upper_wick": df["high"] - df[["close", "open"]].max(axis=1),
-            "lower_wick": df[["close", "open"]].min(axis=1) - df["low"],
-            "volume_spike": (df["volume"] > df["volume"].rolling(20).mean() * 1.5).astype(bool),
-            "rsi_reversal": ((df["momentum_rsi"] < 30) | (df["momentum_rsi"] > 70)).astype(int),
-            "macd_divergence": df["trend_macd"] - df["trend_macd_signal"],
-            "reversal_candle": (
-                (abs(df["close"] - df["open"]) > (df["high"] - df[["close", "open"]].max(axis=1) +
-                                                  df[["close", "open"]].min(axis=1) - df["low"])) &
-                ((df["high"] - df[["close", "open"]].max(axis=1)) > abs(df["close"] - df["open"]) * 0.5)
-            ).astype(int),
-            "hour_of_day": df.index.hour,
-            "day_of_week": df.index.dayofweek,
-        })
-
-        df = pd.concat([df, new_features], axis=1).copy()
+        df = pd.concat([df, labels], axis=1).copy()
         df.dropna(inplace=True)
+        # Giữ float64: khung này được ghi vào training_dataset / buffer feature; dtype gọn chỉ áp khi nạp để train / chấm điểm
         return df
     except Exception as e:
-        print(f"❌ Lỗi khi tính chỉ báo kỹ thuật: {e}")
+        logger.exception(f"❌ Lỗi khi tính chỉ báo kỹ thuật: {e}")
         return pd.DataFrame()
 
 # ===== 5. Ghi vào bảng training_dataset =====
+# Dòng feature (index = timestamp) → record theo schema training_dataset
+def build_record(symbol: str, ts, row) -> dict:
+    return {
+        "timestamp": int(ts.timestamp() * 1000),
+        "symbol": symbol,
+        "open": float(row["open"]),
+        "high": float(row["high"]),
+        "low": float(row["low"]),
+        "close": float(row["close"]),
+        "volume": float(row["volume"]),
+        "ema_20": float(row.get("trend_ema_slow", 0)),
+        "ema_50": float(row.get("trend_ema_fast", 0)),
+        "ema_cross": int(row.get("ema_cross", 0)),
+        "rsi": float(row.get("momentum_rsi", 0)),
+        "macd": float(row.get("trend_macd", 0)),
+        "macd_signal": float(row.get("trend_macd_signal", 0)),
+        "macd_hist": float(row.get("trend_macd_diff", 0)),
+        "bb_lower": float(row.get("volatility_bbl", 0)),
+        "bb_middle": float(row.get("volatility_bbm", 0)),
+        "bb_upper": float(row.get("volatility_bbh", 0)),
+        "bb_width_pct": float(row.get("bb_width_pct", 0)),
+        "volume_change_pct": float(row.get("volume_change_pct", 0)),
+        "price_change_pct": float(row.get("price_change_pct", 0)),
+        "candle_body": float(row.get("candle_body", 0)),
+        "upper_wick": float(row.get("upper_wick", 0)),
+        "lower_wick": float(row.get("lower_wick", 0)),
+        "volume_spike": bool(row.get("volume_spike", False)),
+        "rsi_reversal": int(row.get("rsi_reversal", 0)),
+        "macd_divergence": float(row.get("macd_divergence", 0)),
+        "reversal_candle": int(row.get("reversal_candle", 0)),
+        "hour_of_day": int(row.get("hour_of_day", 0)),
+        "day_of_week": int(row.get("day_of_week", 0)),
+        "target": row.get("target", "hold"),
+        "signal": int(row.get("signal", 0)),
+        "created_at": datetime.utcnow().isoformat()
+    }
+
 def insert_training_data(symbol: str, df: pd.DataFrame):
-    count = 0
+    count = skipped = failed = backfilled = 0
+    label_cols = label_columns(df)
     for i, row in df.iterrows():
         try:
-            record = {
-                "timestamp": int(i.timestamp() * 1000),
-                "symbol": symbol,
-                "open": float(row["open"]),
-                "high": float(row["high"]),
-                "low": float(row["low"]),
-                "close": float(row["close"]),
-                "volume": float(row["volume"]),
-                "ema_20": float(row.get("trend_ema_slow", 0)),
-                "ema_50": float(row.get("trend_ema_fast", 0)),
-                "ema_cross": int(row.get("ema_cross", 0)),
-                "rsi": float(row.get("momentum_rsi", 0)),
-                "macd": float(row.get("trend_macd", 0)),
-                "macd_signal": float(row.get("trend_macd_signal", 0)),
-                "macd_hist": float(row.get("trend_macd_diff", 0)),
-                "bb_lower": float(row.get("volatility_bbl", 0)),
-                "bb_middle": float(row.get("volatility_bbm", 0)),
-                "bb_upper": float(row.get("volatility_bbh", 0)),
-                "bb_width_pct": float(row.get("bb_width_pct", 0)),
-                "volume_change_pct": float(row.get("volume_change_pct", 0)),
-                "price_change_pct": float(row.get("price_change_pct", 0)),
-                "candle_body": float(row.get("candle_body", 0)),
-                "upper_wick": float(row.get("upper_wick", 0)),
-                "lower_wick": float(row.get("lower_wick", 0)),
-                "volume_spike": bool(row.get("volume_spike", False)),
-                "rsi_reversal": int(row.get("rsi_reversal", 0)),
-                "macd_divergence": float(row.get("macd_divergence", 0)),
-                "reversal_candle": int(row.get("reversal_candle", 0)),
-                "hour_of_day": int(row.get("hour_of_day", 0)),
-                "day_of_week": int(row.get("day_of_week", 0)),
-                "target": row.get("target", "hold"),
-                "signal": int(row.get("signal", 0)),
-                "created_at": datetime.utcnow().isoformat()
-            }
+            record = build_record(symbol, i, row)
+            for col in label_cols:
+                value = int(row[col])
+                record[col] = None if value == LABEL_UNKNOWN else value
 
             existing = supabase.table("training_dataset") \
-                .select("id") \
+                .select(",".join(["id", *label_cols])) \
                 .eq("timestamp", record["timestamp"]) \
                 .eq("symbol", symbol) \
                 .execute()
             if existing.data:
-                print(f"⏭️ {symbol} | Bỏ qua {i} - đã tồn tại")
+                # Dòng cuối chuỗi được ghi khi chưa đủ nến tương lai (nhãn NULL) → bổ sung nhãn khi đã đủ
+                missing = {col: record[col] for col in label_cols
+                           if existing.data[0].get(col) is None and record[col] is not None}
+                if missing:
+                    supabase.table("training_dataset").update(missing).eq("id", existing.data[0]["id"]).execute()
+                    backfilled += 1
+                    continue
+                # Log theo từng dòng → giới hạn tần suất, tổng số nằm ở dòng tóm tắt
+                skipped += 1
+                logger.every(("exists", symbol), f"⏭️ {symbol} | Bỏ qua {i} - đã tồn tại", level=logging.DEBUG)
                 continue
 
             supabase.table("training_dataset").insert(record).execute()
             count += 1
         except Exception as e:
-            print(f"⚠️ Lỗi khi insert {symbol} tại {i}: {e}")
-    print(f"✅ {symbol}: Đã thêm {count} dòng vào training_dataset.")
+            failed += 1
+            logger.every(("insert_error", symbol), f"⚠️ Lỗi khi insert {symbol} tại {i}: {e}", level=logging.WARNING)
+    if not df.empty:
+        candle_buffers.set_features(symbol, build_record(symbol, df.index[-1], df.iloc[-1]))
+    logger.info(f"✅ {symbol}: Đã thêm {count} dòng vào training_dataset.", inserted=count, skipped=skipped,
+                backfilled=backfilled, failed=failed)
+    return count
 
 # ===== 6. Hàm chính =====
+def process_symbol(symbol: str) -> int:
+    logger.info(f"🚀 Đang xử lý: {symbol}")
+    with span("fetch"):
+        df = fetch_ohlcv(symbol)
+    if df.empty:
+        logger.warning(f"⚠️ Bỏ qua {symbol} vì không có dữ liệu")
+        return 0
+
+    with span("featurize"):
+        df_feat = generate_features(df)
+    if df_feat.empty:
+        logger.warning(f"⚠️ Bỏ qua {symbol} vì không sinh được chỉ báo")
+        return 0
+
+    with span("write"):
+        return insert_training_data(symbol, df_feat)
+
 def run():
-    symbols = get_watched_symbols()
+    symbols = filter_owned(get_watched_symbols())
     if not symbols:
-        print("❌ Không có symbol nào cần xử lý.")
-        return
+        logger.warning("❌ Không có symbol nào cần xử lý.")
+        return 0
 
-    print(f"📌 Tổng số symbol cần xử lý: {len(symbols)}")
+    logger.info(f"📌 Tổng số symbol cần xử lý: {len(symbols)}")
+    total = 0
 
     for symbol in symbols:
-        print(f"\n🚀 Đang xử lý: {symbol}")
-        df = fetch_ohlcv(symbol)
-        if df.empty:
-            print(f"⚠️ Bỏ qua {symbol} vì không có dữ liệu")
-            continue
-
-        df_feat = generate_features(df)
-        if df_feat.empty:
-            print(f"⚠️ Bỏ qua {symbol} vì không sinh được chỉ báo")
-            continue
+        with log_context(symbol=symbol):
+            total += process_symbol(symbol)
 
-        insert_training_data(symbol, df_feat)
+    return total
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    with profiled("generate_training_data"):
+        run()
\ No newline at end of file
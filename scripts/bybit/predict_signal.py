@@ -1,15 +1,26 @@
 import os
+import sys
 import pandas as pd
-from supabase import create_client, Client
 from dotenv import load_dotenv
 import joblib
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from services.db import get_client
+from services.sharding import filter_owned
+from services.candle_buffer import candle_buffers
+from services.metrics import metrics
+from services.model_manifest import load_manifest, model_features
+from services.dtype_policy import DTYPE_PARITY_CHECK, compact, check_parity
+from services.profiling import profiled, span
+from utils.logger import get_logger
+
 # ===== 1. Load ENV =====
 load_dotenv()
+logger = get_logger("bybit.predict_signal")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = get_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 # ===== 2. Cấu hình =====
 MODEL_PATH = "model/model_rf.pkl"
@@ -19,30 +30,37 @@ CANDLE_LOOKBACK = 50
 def load_model():
     try:
         model = joblib.load(MODEL_PATH)
-        print("✅ Đã load model thành công!")
+        logger.info("✅ Đã load model thành công!")
         return model
     except Exception as e:
         raise Exception(f"❌ Không load được model: {e}")
 
 # ===== 4. Lấy dữ liệu dự đoán gần nhất =====
-def fetch_latest_data(symbol):
+def fetch_latest_data(symbol, columns="*"):
+    # Dòng feature mới nhất đã có trong buffer RAM (job feature vừa ghi) → khỏi gọi Supabase
+    record = candle_buffers.latest_features(symbol)
+    if record is not None:
+        return pd.DataFrame([record])
     try:
         res = supabase.table("training_dataset")\
-            .select("*")\
+            .select(columns)\
             .eq("symbol", symbol)\
             .order("timestamp", desc=True)\
             .limit(1)\
             .execute()
         if not res.data:
-            print(f"⚠️ Không có dữ liệu mới cho {symbol}")
+            logger.warning(f"⚠️ Không có dữ liệu mới cho {symbol}")
             return None
         return pd.DataFrame(res.data)
     except Exception as e:
-        print(f"❌ Lỗi fetch dữ liệu cho {symbol}: {e}")
+        logger.error(f"❌ Lỗi fetch dữ liệu cho {symbol}: {e}")
         return None
 
 # ===== 5. Lấy 50 nến để tính toán SL/TP =====
 def fetch_candles(symbol):
+    candles = candle_buffers.candles(symbol, CANDLE_LOOKBACK, min_rows=CANDLE_LOOKBACK)
+    if candles is not None:
+        return candles
     try:
         res = supabase.table("ohlcv_data")\
             .select("timestamp, open, high, low, close")\
@@ -52,15 +70,18 @@ def fetch_candles(symbol):
             .execute()
         return pd.DataFrame(res.data[::-1])  # đảo lại theo thời gian tăng
     except Exception as e:
-        print(f"❌ Lỗi fetch candles cho {symbol}: {e}")
+        logger.error(f"❌ Lỗi fetch candles cho {symbol}: {e}")
         return pd.DataFrame()
 
 # ===== 6. Tiền xử lý =====
-def preprocess(df, model):
-    expected_features = list(model.feature_names_in_)
-    df = df[[col for col in expected_features if col in df.columns]]
-    df.fillna(0, inplace=True)
-    return df
+# features: danh sách trong manifest của model (model/model_rf.json); None → feature_names_in_ của model
+def preprocess(df, model, features=None):
+    features = features or model_features(model)
+    X = df.reindex(columns=features).fillna(0)
+    X_compact = compact(X)
+    if DTYPE_PARITY_CHECK:
+        check_parity(model, X, X_compact)
+    return X_compact
 
 # ===== 7. Dự đoán =====
 def decode_prediction(pred):
@@ -81,7 +102,22 @@ def calculate_trade_levels(candles: pd.DataFrame):
 
     return current_price, tp, sl, high, low
 
-# ===== 9. Ghi kết quả =====
+# ===== 9. Chấm điểm 1 dòng feature =====
+def score(model, df_latest: pd.DataFrame, candles: pd.DataFrame, features=None) -> dict:
+    X = preprocess(df_latest, model, features)
+    with metrics.timer("model_inference_seconds", {"model": "bybit_rf", "batch": "1"}):
+        pred = model.predict(X)[0]
+        confidence = max(model.predict_proba(X)[0]) if hasattr(model, "predict_proba") else 1.0
+    metrics.inc("model_inference_rows_total", {"model": "bybit_rf"})
+    entry, tp, sl, high, low = calculate_trade_levels(candles)
+    return {
+        "timestamp": int(df_latest.iloc[0]["timestamp"]),
+        "prediction": decode_prediction(int(round(pred))),
+        "confidence": float(confidence),
+        "entry": entry, "tp": tp, "sl": sl, "high": high, "low": low,
+    }
+
+# ===== 10. Ghi kết quả =====
 def insert_prediction(symbol, timestamp, prediction, confidence, entry, tp, sl, high, low, current_price):
     record = {
         "symbol": symbol,
@@ -106,42 +142,50 @@ def insert_prediction(symbol, timestamp, prediction, confidence, entry, tp, sl,
             .eq("timestamp", int(timestamp))\
             .execute()
         if existing.data:
-            print(f"⏭️ Prediction {symbol} tại {timestamp} đã tồn tại")
-            return
+            logger.info(f"⏭️ Prediction {symbol} tại {timestamp} đã tồn tại")
+            return False
 
         supabase.table("ai_predictions").insert(record).execute()
-        print(f"✅ Lưu {prediction} cho {symbol} @ {entry}")
+        logger.info(f"✅ Lưu {prediction} cho {symbol} @ {entry}")
+        return True
     except Exception as e:
-        print(f"❌ Insert prediction lỗi: {e}")
+        logger.error(f"❌ Insert prediction lỗi: {e}")
+        return False
 
-# ===== 10. Chạy chính =====
+# ===== 11. Chạy chính =====
 def run():
     model = load_model()
+    # Chỉ đọc các cột model thật sự dùng (theo manifest) thay vì cả dòng training_dataset
+    features = model_features(model, load_manifest(MODEL_PATH))
+    columns = ",".join(["timestamp"] + [f for f in features if f != "timestamp"]) if features else "*"
     symbols_res = supabase.table("watched_symbols").select("symbol").eq("active", True).execute()
-    symbols = [s["symbol"] for s in symbols_res.data]
-    print(f"🚀 Chạy AI cho {len(symbols)} symbols...")
+    symbols = filter_owned([s["symbol"] for s in symbols_res.data])
+    logger.info(f"🚀 Chạy AI cho {len(symbols)} symbols...")
+    inserted = 0
 
     for symbol in symbols:
-        print(f"\n🔍 Dự đoán {symbol}...")
-        df_latest = fetch_latest_data(symbol)
+        logger.info(f"🔍 Dự đoán {symbol}...")
+        with span("fetch"):
+            df_latest = fetch_latest_data(symbol, columns)
         if df_latest is None or df_latest.empty:
             continue
 
-        candles = fetch_candles(symbol)
+        with span("fetch"):
+            candles = fetch_candles(symbol)
         if candles.empty:
             continue
 
         try:
-            X = preprocess(df_latest.copy(), model)
-            pred = model.predict(X)[0]
-            confidence = max(model.predict_proba(X)[0]) if hasattr(model, "predict_proba") else 1.0
-            pred_label = decode_prediction(int(round(pred)))
-            timestamp = df_latest.iloc[0]["timestamp"]
-
-            entry, tp, sl, high, low = calculate_trade_levels(candles)
-            insert_prediction(symbol, timestamp, pred_label, confidence, entry, tp, sl, high, low, entry)
+            with span("predict"):
+                s = score(model, df_latest, candles, features)
+            with span("write"):
+                inserted += insert_prediction(symbol, s["timestamp"], s["prediction"], s["confidence"],
+                                              s["entry"], s["tp"], s["sl"], s["high"], s["low"], s["entry"])
         except Exception as e:
-            print(f"❌ Lỗi khi predict {symbol}: {e}")
+            logger.error(f"❌ Lỗi khi predict {symbol}: {e}")
+
+    return inserted
 
 if __name__ == "__main__":
-    run()
+    with profiled("predict_signal"):
+        run()
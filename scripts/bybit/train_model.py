@@ -1,22 +1,39 @@
 import os
+import pickle
+import statistics
+import time
 import pandas as pd
 import numpy as np
-from supabase import create_client, Client
+from collections import Counter
 from dotenv import load_dotenv
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.inspection import permutation_importance
 from sklearn.metrics import classification_report, accuracy_score, confusion_matrix
 import joblib
+import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from services.db import get_client
+from services.label_engine import select_label, label_columns
+from services.feature_store import FeatureStore, FEATURE_STORE_ENABLED, code_hash, feature_key, get_or_compute
+from services.model_manifest import save_manifest
+from services import dtype_policy
+from services.dtype_policy import DTYPE_POLICY, compact, compact_logged
+from services.profiling import profiled, span
+from utils.logger import get_logger
 
 # ===== 1. Load biến môi trường & kết nối Supabase =====
 load_dotenv()
+logger = get_logger("bybit.train_model")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = get_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 # ===== 2. Lấy dữ liệu huấn luyện từ Supabase =====
 def fetch_training_data(symbols=None):
-    print("📥 Đang tải dữ liệu huấn luyện từ Supabase...")
+    logger.info("📥 Đang tải dữ liệu huấn luyện từ Supabase...")
     try:
         query = supabase.table("training_dataset").select("*")
         if symbols:
@@ -24,34 +41,84 @@ def fetch_training_data(symbols=None):
         res = query.execute()
         if not res.data:
             raise Exception("❌ Không có dữ liệu training.")
-        return pd.DataFrame(res.data)
+        # float64 / int64 từ JSON → float32 / int8 / bool ngay khi nạp
+        return compact_logged(pd.DataFrame(res.data), "training_dataset")
     except Exception as e:
         raise Exception(f"❌ Lỗi khi tải dữ liệu training: {e}")
 
+# Khoảng thời gian + số dòng của training_dataset: đủ rẻ để làm key cho feature store trước khi tải dữ liệu
+def training_range(symbols=None):
+    def query(columns, **kwargs):
+        q = supabase.table("training_dataset").select(columns, **kwargs)
+        return q.in_("symbol", symbols) if symbols else q
+
+    first = query("timestamp", count="exact").order("timestamp").limit(1).execute()
+    last = query("timestamp").order("timestamp", desc=True).limit(1).execute()
+    if not first.data:
+        return None
+    return first.data[0]["timestamp"], last.data[0]["timestamp"], first.count
+
 # ===== 3. Tiền xử lý dữ liệu =====
-def preprocess(df: pd.DataFrame):
-    if 'signal' not in df.columns:
-        raise Exception("⚠️ Dữ liệu không chứa cột 'signal'.")
+# Tăng khi đổi cách tạo feature mà hash mã nguồn không bắt được (VD: đổi schema training_dataset)
+FEATURE_SPEC_VERSION = 1
 
-    drop_cols = ['id', 'symbol', 'created_at', 'target', 'signal']
-    X = df.drop(columns=drop_cols, errors='ignore')
+# Bảng training_dataset → khung số (feature + cột nhãn); phần tốn kém được cache trong feature store
+def build_feature_frame(df: pd.DataFrame) -> pd.DataFrame:
+    frame = df.drop(columns=['id', 'symbol', 'created_at', 'target'], errors='ignore')
+    frame = frame.apply(pd.to_numeric, errors='coerce')
+    return compact(frame.replace([np.inf, -np.inf], np.nan))
 
-    # Xử lý đặc trưng
-    X = X.apply(pd.to_numeric, errors='coerce')
-    X = X.replace([np.inf, -np.inf], np.nan)
-    X.dropna(inplace=True)
+# Có trong training_dataset nhưng không phải feature: timestamp chỉ tăng theo thời gian, model học thuộc giai đoạn
+NON_FEATURES = ['timestamp']
+
+# label_set=None → dùng cột 'signal' như trước; ngược lại chọn cột label_<label_set>
+def split_xy(frame: pd.DataFrame, label_set: str = None):
+    if label_set is None and 'signal' not in frame.columns:
+        raise Exception("⚠️ Dữ liệu không chứa cột 'signal'.")
+
+    X = frame.drop(columns=['signal'] + NON_FEATURES + label_columns(frame), errors='ignore')
+    X = X.dropna()
 
     # 🎯 Dữ liệu đầu ra
-    y = df.loc[X.index, 'signal'].astype(int)
+    if label_set is None:
+        y = frame.loc[X.index, 'signal'].astype(int)
+    else:
+        y = select_label(frame.loc[X.index], label_set).astype(int)
+        X = X.loc[y.index]
 
-    print(f"📊 Dữ liệu đầu vào X shape: {X.shape}")
-    print(f"🎯 Các nhãn y duy nhất: {y.unique()}")
+    logger.info(f"📊 Dữ liệu đầu vào X shape: {X.shape}")
+    logger.info(f"🎯 Các nhãn y duy nhất: {y.unique()}")
 
     return X, y
 
+def preprocess(df: pd.DataFrame, label_set: str = None):
+    return split_xy(build_feature_frame(df), label_set)
+
+# Lần train / thí nghiệm lặp lại trên cùng dữ liệu + cùng code → nạp khung feature từ store (mmap), bỏ qua fetch + featurize
+def load_feature_frame(symbols=None, store=None) -> pd.DataFrame:
+    def compute():
+        with span("fetch"):
+            df = fetch_training_data(symbols)
+        with span("featurize"):
+            return build_feature_frame(df)
+
+    if store is None and FEATURE_STORE_ENABLED:
+        store = FeatureStore()
+    if store is None:
+        return compute()
+
+    with span("fetch"):
+        date_range = training_range(symbols)
+    if date_range is None:
+        raise Exception("❌ Không có dữ liệu training.")
+    # build_feature_frame gọi compact() → hash cả module dtype_policy (hàm + bảng cột) và chính sách đang bật
+    key, params = feature_key(symbols, date_range, f"{FEATURE_SPEC_VERSION}+dtype:{DTYPE_POLICY}",
+                              code_hash(build_feature_frame, dtype_policy))
+    return get_or_compute(store, key, params, compute)
+
 # ===== 4. Huấn luyện mô hình Random Forest =====
 def train_model(X_train, y_train):
-    print("🧠 Đang huấn luyện mô hình Random Forest...")
+    logger.info("🧠 Đang huấn luyện mô hình Random Forest...")
     model = RandomForestClassifier(
         n_estimators=200,
         max_depth=10,
@@ -62,48 +129,181 @@ def train_model(X_train, y_train):
     model.fit(X_train, y_train)
     return model
 
-# ===== 5. Đánh giá mô hình =====
+# ===== 5. Chọn feature: độ quan trọng + độ ổn định giữa các fold =====
+FEATURE_SELECTION = os.getenv("FEATURE_SELECTION", "1") == "1"
+FEATURE_SELECTION_METHOD = os.getenv("FEATURE_SELECTION_METHOD", "impurity")  # impurity | permutation
+FEATURE_SELECTION_FOLDS = int(os.getenv("FEATURE_SELECTION_FOLDS", 3))
+# Mỗi fold giữ nhóm feature quan trọng nhất chiếm bấy nhiêu phần tổng importance
+FEATURE_SELECTION_COVERAGE = float(os.getenv("FEATURE_SELECTION_COVERAGE", 0.95))
+# Feature phải lọt nhóm đó ở ít nhất bấy nhiêu phần số fold mới được giữ
+FEATURE_SELECTION_STABILITY = float(os.getenv("FEATURE_SELECTION_STABILITY", 0.67))
+
+def fold_importance(X_train, y_train, X_val, y_val, method: str) -> np.ndarray:
+    model = RandomForestClassifier(
+        n_estimators=100, max_depth=10, random_state=42, n_jobs=-1, class_weight='balanced'
+    )
+    model.fit(X_train, y_train)
+    if method == "permutation":
+        result = permutation_importance(model, X_val, y_val, n_repeats=5, random_state=42, n_jobs=-1)
+        return np.clip(result.importances_mean, 0, None)
+    return model.feature_importances_
+
+def covering_set(importances: np.ndarray, names: list, coverage: float) -> set:
+    total = importances.sum()
+    if total <= 0:
+        return set(names)
+    order = np.argsort(importances)[::-1]
+    n = int(np.searchsorted(np.cumsum(importances[order]) / total, coverage)) + 1
+    return {names[i] for i in order[:n]}
+
+def select_features(X: pd.DataFrame, y: pd.Series, method: str = FEATURE_SELECTION_METHOD,
+                    folds: int = FEATURE_SELECTION_FOLDS, coverage: float = FEATURE_SELECTION_COVERAGE,
+                    stability: float = FEATURE_SELECTION_STABILITY):
+    logger.info(f"✂️ Đang chọn feature ({method}, {folds} fold)...")
+    names = list(X.columns)
+    importances, chosen = [], Counter()
+    for train_idx, val_idx in StratifiedKFold(n_splits=folds, shuffle=True, random_state=42).split(X, y):
+        imp = fold_importance(X.iloc[train_idx], y.iloc[train_idx], X.iloc[val_idx], y.iloc[val_idx], method)
+        importances.append(imp)
+        chosen.update(covering_set(imp, names, coverage))
+
+    importances = np.array(importances)
+    mean, std = importances.mean(axis=0), importances.std(axis=0)
+    # Giữ nguyên thứ tự cột gốc → model và inference dùng chung 1 thứ tự
+    selected = [n for n in names if chosen[n] / folds >= stability] or names
+    ranking = sorted(
+        ({"feature": n, "importance": round(float(mean[i]), 6), "std": round(float(std[i]), 6), "folds": chosen[n]}
+         for i, n in enumerate(names)),
+        key=lambda r: -r["importance"],
+    )
+    logger.info(f"✂️ Giữ {len(selected)}/{len(names)} feature", dropped=[n for n in names if n not in selected])
+    return selected, {
+        "method": method, "folds": folds, "coverage": coverage, "stability": stability,
+        "n_features_all": len(names), "n_features_selected": len(selected), "ranking": ranking,
+    }
+
+def model_size_mb(model) -> float:
+    return round(len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1024 / 1024, 3)
+
+def predict_latency_ms(model, X: pd.DataFrame, repeat: int = 30) -> float:
+    """Median thời gian predict_proba cho 1 dòng (đúng kiểu gọi của predict_signal)."""
+    row = X.iloc[[0]]
+    model.predict_proba(row)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        model.predict_proba(row)
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+def tradeoff_report(X_train, y_train, X_test, y_test, selected: list, reduced_model) -> dict:
+    """So model đủ feature với model rút gọn: accuracy vs kích thước / độ trễ."""
+    logger.info("⚖️ Đang train model đủ feature để so sánh...")
+    full_model = train_model(X_train, y_train)
+    report = {}
+    for name, model, cols in (("all", full_model, list(X_train.columns)), ("selected", reduced_model, selected)):
+        report[name] = {
+            "features": len(cols),
+            "accuracy": round(float(accuracy_score(y_test, model.predict(X_test[cols]))), 4),
+            "size_mb": model_size_mb(model),
+            "latency_ms": predict_latency_ms(model, X_test[cols]),
+        }
+    logger.info("⚖️ Trade-off feature:\n" + "\n".join(
+        f"  {name:9} {r['features']:>4} feature | acc {r['accuracy']:.4f} | {r['size_mb']:.2f} MB | {r['latency_ms']:.2f} ms/dòng"
+        for name, r in report.items()
+    ))
+    return report
+
+# ===== 6. Đánh giá mô hình =====
 def evaluate_model(model, X_test, y_test):
-    print("\n=== 📊 ĐÁNH GIÁ MÔ HÌNH ===")
+    logger.info("=== 📊 ĐÁNH GIÁ MÔ HÌNH ===")
     preds = model.predict(X_test)
 
-    print(classification_report(
+    report = classification_report(
         y_test, preds,
         target_names=['SELL (-1)', 'HOLD (0)', 'BUY (1)'],
         labels=[-1, 0, 1]
-    ))
+    )
+    logger.info(f"\n{report}")
 
     acc = accuracy_score(y_test, preds)
-    print(f"🎯 Accuracy: {acc:.4f}")
+    logger.info(f"🎯 Accuracy: {acc:.4f}")
 
-    print("🧩 Confusion Matrix:")
-    print(confusion_matrix(y_test, preds, labels=[-1, 0, 1]))
+    logger.info(f"🧩 Confusion Matrix:\n{confusion_matrix(y_test, preds, labels=[-1, 0, 1])}")
+    return acc
 
-# ===== 6. Lưu mô hình ra file .pkl =====
+# ===== 7. Lưu mô hình ra file .pkl =====
 def save_model(model, path="model/model_rf.pkl"):
     try:
         joblib.dump(model, path)
-        print(f"✅ Mô hình đã được lưu tại: {path}")
+        logger.info(f"✅ Mô hình đã được lưu tại: {path}")
     except Exception as e:
-        print(f"❌ Lỗi khi lưu mô hình: {e}")
+        logger.error(f"❌ Lỗi khi lưu mô hình: {e}")
 
-# ===== 7. Chạy pipeline huấn luyện =====
-def run():
-    symbols = None  # Ví dụ: ['BTCUSDT', 'ETHUSDT']
-    df = fetch_training_data(symbols)
-    print(f"📊 Tổng số dòng dữ liệu huấn luyện: {len(df)}")
-
-    X, y = preprocess(df)
+# ===== 8. Chạy pipeline huấn luyện =====
+def train_for_label_set(frame: pd.DataFrame, label_set: str = None, path="model/model_rf.pkl",
+                        select: bool = FEATURE_SELECTION, report_tradeoff: bool = False):
+    logger.info(f"🏷️ Bộ nhãn: {label_set or 'signal'}")
+    with span("featurize"):
+        X, y = split_xy(frame, label_set)
 
-    print("🔀 Đang chia dữ liệu 80/20 cho train/test...")
+    logger.info("🔀 Đang chia dữ liệu 80/20 cho train/test...")
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, stratify=y, random_state=42
     )
 
-    model = train_model(X_train, y_train)
-    evaluate_model(model, X_test, y_test)
-    save_model(model)
+    # Chọn feature chỉ trên phần train → tập test vẫn là dữ liệu model chưa thấy
+    features, selection = list(X_train.columns), None
+    if select:
+        with span("select"):
+            features, selection = select_features(X_train, y_train)
+
+    with span("train"):
+        model = train_model(X_train[features], y_train)
+    with span("evaluate"):
+        acc = evaluate_model(model, X_test[features], y_test)
+        tradeoff = tradeoff_report(X_train, y_train, X_test, y_test, features, model) \
+            if report_tradeoff and select else None
+    with span("write"):
+        save_model(model, path)
+        # Manifest: danh sách feature predict_signal dùng để chỉ lấy đúng cột cần khi chấm điểm
+        save_manifest(path, {
+            "features": features,
+            "feature_spec_version": FEATURE_SPEC_VERSION,
+            "label_set": label_set,
+            "accuracy": round(float(acc), 4),
+            "size_mb": model_size_mb(model),
+            "latency_ms": predict_latency_ms(model, X_test[features]),
+            "train_rows": len(X_train),
+            "dtype_policy": DTYPE_POLICY,
+            "dtypes": {f: str(X_train[f].dtype) for f in features},
+            "selection": selection,
+            "tradeoff": tradeoff,
+        })
+    return model
+
+def run(label_sets=None, select: bool = FEATURE_SELECTION, report_tradeoff: bool = False):
+    symbols = None  # Ví dụ: ['BTCUSDT', 'ETHUSDT']
+    frame = load_feature_frame(symbols)
+    logger.info(f"📊 Tổng số dòng dữ liệu huấn luyện: {len(frame)}")
+
+    # Nhiều bộ nhãn dùng chung 1 lần tải dữ liệu; bộ đầu tiên là model chính
+    label_sets = label_sets or [None]
+    for i, label_set in enumerate(label_sets):
+        path = "model/model_rf.pkl" if i == 0 else f"model/model_rf_{label_set}.pkl"
+        train_for_label_set(frame, label_set, path, select=select, report_tradeoff=report_tradeoff)
+
+    return len(frame)
 
-# ===== 8. Entry Point =====
+# ===== 9. Entry Point =====
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--label-set", default=os.getenv("LABEL_SET"),
+                        help="Tên bộ nhãn (VD: h3_t20) hoặc nhiều bộ cách nhau dấu phẩy")
+    parser.add_argument("--all-features", action="store_true", help="Bỏ qua bước chọn feature")
+    parser.add_argument("--tradeoff", action="store_true",
+                        help="Train thêm model đủ feature để so accuracy với kích thước / độ trễ")
+    args = parser.parse_args()
+    with profiled("train_model"):
+        run([s for s in args.label_set.split(",") if s] if args.label_set else None,
+            select=FEATURE_SELECTION and not args.all_features, report_tradeoff=args.tradeoff)
@@ -0,0 +1,170 @@
+"""
+Đo khởi động lạnh của app.py:
+- thời gian từ lúc tiến trình mới bắt đầu tới khi `GET /` trả về (nhiều lần, lấy median)
+- báo cáo import theo module (`python -X importtime`), gộp theo package gốc
+- `--rev <commit>` đo thêm 1 revision khác (git worktree tạm) để so trước/sau
+
+VD: python scripts/cold_start.py --runs 5 --rev HEAD~1 --importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_SNIPPET = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+res = app.app.test_client().get("/")
+done = time.perf_counter()
+print("COLD_START " + json.dumps({
+    "import_s": imported - started, "first_response_s": done - started, "status": res.status_code
+}))
+"""
+
+
+# ===== 1. Môi trường cho tiến trình con =====
+def child_env(local_db: bool) -> dict:
+    env = dict(os.environ)
+    # Không để luồng nền (scheduler, realtime) chạy trong lúc đo
+    env.update({"SCHEDULER_ENABLED": "0", "REALTIME_REFRESH": "0", "SHARDING_ENABLED": "0"})
+    if local_db:
+        # Revision cũ import script gọi sys.exit() khi thiếu biến Supabase → dùng DB local để đo được
+        env["SUPABASE_BACKEND"] = "local"
+        env.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.gettempdir(), "cold_start.db"))
+    return env
+
+
+# ===== 2. Đo thời gian tới response đầu tiên =====
+def measure_once(cwd: str, env: dict) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", CHILD_SNIPPET], cwd=cwd, env=env,
+                          capture_output=True, text=True, timeout=600)
+    wall = time.perf_counter() - started
+    line = next((l for l in proc.stdout.splitlines() if l.startswith("COLD_START ")), None)
+    if line is None:
+        raise RuntimeError(f"Tiến trình con lỗi (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+    return {**json.loads(line[len("COLD_START "):]), "process_s": wall}
+
+
+def measure(cwd: str, env: dict, runs: int) -> dict:
+    samples = [measure_once(cwd, env) for _ in range(runs)]
+    return {
+        key: round(statistics.median(s[key] for s in samples), 4)
+        for key in ("import_s", "first_response_s", "process_s")
+    }
+
+
+# ===== 3. Báo cáo import theo module =====
+def import_report(cwd: str, env: dict, top: int) -> dict:
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=cwd, env=env,
+                          capture_output=True, text=True, timeout=600)
+    modules = []
+    for line in proc.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules.append((name.rstrip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+
+    by_package = defaultdict(int)
+    for name, self_us, _ in modules:
+        by_package[name.strip().split(".")[0]] += self_us
+
+    return {
+        "total_s": round(sum(m[1] for m in modules) / 1e6, 4),
+        "top_cumulative": [
+            {"module": name.strip(), "cumulative_s": round(cum / 1e6, 4), "self_s": round(self_us / 1e6, 4)}
+            for name, self_us, cum in sorted(modules, key=lambda m: -m[2])[:top]
+        ],
+        "by_package": [
+            {"package": pkg, "self_s": round(us / 1e6, 4)}
+            for pkg, us in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]
+        ],
+    }
+
+
+def print_import_report(label: str, report: dict):
+    print(f"\n📦 Import ({label}): tổng {report['total_s']}s")
+    print("   Theo package gốc (self):")
+    for row in report["by_package"]:
+        print(f"     {row['self_s']:>8.4f}s  {row['package']}")
+    print("   Module tốn nhất (cumulative):")
+    for row in report["top_cumulative"]:
+        print(f"     {row['cumulative_s']:>8.4f}s  {row['module']}")
+
+
+# ===== 4. Revision khác qua git worktree tạm =====
+class Worktree:
+    def __init__(self, rev: str):
+        self.rev = rev
+        self.path = tempfile.mkdtemp(prefix="cold_start_")
+
+    def __enter__(self):
+        subprocess.run(["git", "worktree", "add", "--detach", self.path, self.rev],
+                       cwd=ROOT_DIR, check=True, capture_output=True)
+        # Model không nằm trong git → dùng chung file của cây hiện tại
+        model_dir = os.path.join(ROOT_DIR, "model")
+        if os.path.isdir(model_dir) and not os.path.exists(os.path.join(self.path, "model")):
+            os.symlink(model_dir, os.path.join(self.path, "model"))
+        return self.path
+
+    def __exit__(self, *exc):
+        subprocess.run(["git", "worktree", "remove", "--force", self.path], cwd=ROOT_DIR, capture_output=True)
+
+
+# ===== 5. Chạy =====
+def main():
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động lạnh của app.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rev", help="Đo thêm revision này để so sánh (VD: HEAD~1)")
+    parser.add_argument("--importtime", action="store_true", help="In báo cáo import theo module")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--real-db", action="store_true", help="Dùng Supabase thật thay cho DB local")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args()
+
+    env = child_env(local_db=not args.real_db)
+    targets = [("hiện tại", ROOT_DIR, None)]
+    if args.rev:
+        targets.append((args.rev, None, args.rev))
+
+    results = {}
+    for label, cwd, rev in targets:
+        if rev is not None:
+            with Worktree(rev) as path:
+                results[label] = {"cold_start": measure(path, env, args.runs)}
+                if args.importtime:
+                    results[label]["imports"] = import_report(path, env, args.top)
+        else:
+            results[label] = {"cold_start": measure(cwd, env, args.runs)}
+            if args.importtime:
+                results[label]["imports"] = import_report(cwd, env, args.top)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"\n🥶 Khởi động lạnh (median {args.runs} lần):")
+    print(f"   {'':12} {'import app':>12} {'GET / đầu tiên':>16} {'cả tiến trình':>15}")
+    for label, r in results.items():
+        c = r["cold_start"]
+        print(f"   {label:12} {c['import_s']:>11.3f}s {c['first_response_s']:>15.3f}s {c['process_s']:>14.3f}s")
+    for label, r in results.items():
+        if "imports" in r:
+            print_import_report(label, r["imports"])
+
+
+if __name__ == "__main__":
+    main()
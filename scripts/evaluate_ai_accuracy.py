@@ -1,22 +1,26 @@
+import logging
 import os
 import sys
 import pandas as pd
-from datetime import datetime
 from dotenv import load_dotenv
-from supabase import create_client, Client
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.db import get_client, has_credentials
+from utils.logger import get_logger
 
 # ✅ Cho in tiếng Việt trên terminal
 sys.stdout.reconfigure(encoding='utf-8')
 load_dotenv()
+logger = get_logger("evaluate_ai_accuracy")
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    print("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
+if not has_credentials():
+    logger.error("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
     sys.exit(1)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = get_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 # ✅ Lấy tín hiệu đã gán nhãn
 def fetch_labeled_signals() -> pd.DataFrame:
@@ -32,7 +36,7 @@ def fetch_labeled_signals() -> pd.DataFrame:
         else:
             return pd.DataFrame()
     except Exception as e:
-        print(f"❌ Lỗi khi lấy tín hiệu đã gán label: {e}")
+        logger.error(f"❌ Lỗi khi lấy tín hiệu đã gán label: {e}")
         return pd.DataFrame()
 
 # ✅ Tính accuracy theo từng ngày + index
@@ -45,7 +49,8 @@ def evaluate_accuracy(df: pd.DataFrame) -> list:
         correct = group["label_win"].sum()
         accuracy = round(correct / total, 4) if total > 0 else 0.0
 
-        print(f"📅 {signal_date.date()} | {index_code}: {correct}/{total} đúng → accuracy = {accuracy}")
+        # Theo từng nhóm ngày × index → DEBUG, mặc định không ghi
+        logger.debug(f"📅 {signal_date.date()} | {index_code}: {correct}/{total} đúng → accuracy = {accuracy}")
 
         results.append({
             "date": signal_date.strftime("%Y-%m-%d"),
@@ -59,6 +64,7 @@ def evaluate_accuracy(df: pd.DataFrame) -> list:
 
 # ✅ Insert hoặc update log nếu đã có
 def insert_accuracy_logs(logs: list):
+    updated = inserted = failed = 0
     for log in logs:
         try:
             existing = supabase.table("ai_accuracy_logs") \
@@ -77,25 +83,31 @@ def insert_accuracy_logs(logs: list):
                     }) \
                     .eq("id", existing.data[0]["id"]) \
                     .execute()
-                print(f"🔁 Đã cập nhật log: {log['index_code']} - {log['date']}")
+                updated += 1
+                logger.debug(f"🔁 Đã cập nhật log: {log['index_code']} - {log['date']}")
             else:
                 # 🆕 Insert mới
                 supabase.table("ai_accuracy_logs").insert(log).execute()
-                print(f"🆕 Đã insert mới log: {log['index_code']} - {log['date']}")
+                inserted += 1
+                logger.debug(f"🆕 Đã insert mới log: {log['index_code']} - {log['date']}")
 
         except Exception as e:
-            print(f"❌ Lỗi khi insert/update log {log['index_code']} - {log['date']}: {e}")
+            failed += 1
+            logger.every("write_error", f"❌ Lỗi khi insert/update log {log['index_code']} - {log['date']}: {e}",
+                         level=logging.ERROR)
+    logger.info(f"📝 Accuracy log: {inserted} mới, {updated} cập nhật, {failed} lỗi")
 
 # ✅ Hàm chính
 def main():
-    print("🚀 Bắt đầu đánh giá độ chính xác tín hiệu AI...")
+    logger.info("🚀 Bắt đầu đánh giá độ chính xác tín hiệu AI...")
     df = fetch_labeled_signals()
     if df.empty:
-        print("⚠️ Không có dữ liệu tín hiệu đã gán label.")
-        return
+        logger.warning("⚠️ Không có dữ liệu tín hiệu đã gán label.")
+        return 0
 
     logs = evaluate_accuracy(df)
     insert_accuracy_logs(logs)
+    return len(logs)
 
 if __name__ == "__main__":
     main()
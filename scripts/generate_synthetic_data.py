@@ -0,0 +1,204 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.local_db import LocalClient, DEFAULT_PATH
+
+# ===== 1. Cấu hình =====
+CANDLE_INTERVAL = "5"
+CANDLE_MS = 5 * 60 * 1000
+INSERT_CHUNK = 5000
+
+# Chỉ mục cho các truy vấn nóng (giống index trên Supabase thật)
+INDEXES = [
+    ("ohlcv_data", ("symbol", "timestamp")),
+    ("training_dataset", ("symbol", "timestamp")),
+    ("ai_predictions", ("symbol", "timestamp")),
+    ("ai_signals", ("date",)),
+    ("ai_signals", ("user_id", "date")),
+    ("ai_market_signals", ("index_code", "date")),
+    ("vnindex_data", ("date",)),
+    ("vn30_data", ("date",)),
+    ("trading_logs", ("prediction_id",)),
+    ("portfolio_snapshots", ("user_id",)),
+]
+
+# ===== 2. Sinh chuỗi giá =====
+def random_walk(rng, n: int, start: float, vol: float) -> np.ndarray:
+    """Chuỗi giá GBM, không âm."""
+    returns = rng.normal(0.0, vol, n)
+    return start * np.exp(np.cumsum(returns))
+
+def synth_ohlcv(rng, n: int, start_price: float = 100.0, vol: float = 0.004, end_ms: int = None) -> pd.DataFrame:
+    """n nến 5 phút liên tiếp, nến cuối đóng trước `end_ms`."""
+    end_ms = end_ms or int(datetime.utcnow().timestamp() * 1000) // CANDLE_MS * CANDLE_MS
+    close = random_walk(rng, n, start_price, vol)
+    open_ = np.concatenate([[start_price], close[:-1]])
+    spread = np.abs(rng.normal(0, vol, n)) * close
+    return pd.DataFrame({
+        "timestamp": end_ms - CANDLE_MS * np.arange(n, 0, -1),
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "volume": rng.lognormal(10, 0.5, n),
+    })
+
+def business_days(days: int, end: datetime = None) -> pd.DatetimeIndex:
+    end = end or datetime.utcnow()
+    return pd.bdate_range(end=end.date(), periods=days)
+
+def synth_index(rng, days: int, start_price: float) -> pd.DataFrame:
+    dates = business_days(days)
+    close = random_walk(rng, days, start_price, 0.01)
+    open_ = np.concatenate([[start_price], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.005, days)) * close
+    return pd.DataFrame({
+        "date": dates.strftime("%Y-%m-%d"),
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "volume": rng.lognormal(18, 0.3, days),
+        "foreign_buy_value": rng.lognormal(20, 0.5, days),
+        "foreign_sell_value": rng.lognormal(20, 0.5, days),
+    })
+
+def synth_stock_features(rng, symbol: str, days: int) -> pd.DataFrame:
+    """Các cột đầu vào model VN (model.pkl) cho 1 mã."""
+    dates = business_days(days)
+    close = pd.Series(random_walk(rng, days, rng.uniform(10, 100), 0.02))
+    ma20 = close.rolling(20, min_periods=1).mean()
+    std20 = close.rolling(20, min_periods=1).std().fillna(0)
+    delta = close.diff()
+    gain = delta.clip(lower=0).rolling(14, min_periods=1).mean()
+    loss = (-delta.clip(upper=0)).rolling(14, min_periods=1).mean()
+    rsi = (100 - 100 / (1 + gain / loss.replace(0, np.nan))).fillna(50)
+    return pd.DataFrame({
+        "symbol": symbol,
+        "date": dates.strftime("%Y-%m-%d"),
+        "close": close.round(2),
+        "volume": rng.lognormal(13, 0.5, days).round(),
+        "ma20": ma20.round(2),
+        "rsi": rsi.round(2),
+        "bb_upper": (ma20 + 2 * std20).round(2),
+        "bb_lower": (ma20 - 2 * std20).round(2),
+        "foreign_buy_value": rng.lognormal(15, 1, days).round(),
+        "foreign_sell_value": rng.lognormal(15, 1, days).round(),
+    })
+
+def synth_signals(rng, users: int, stocks: int, days: int, pending_days: int) -> pd.DataFrame:
+    """ai_signals cho mỗi user × mã × ngày; `pending_days` ngày cuối chưa có dự đoán."""
+    frames = []
+    for s in range(stocks):
+        base = synth_stock_features(rng, f"VN{s:03d}", days)
+        for u in range(users):
+            frames.append(base.assign(user_id=f"user-{u:04d}"))
+    df = pd.concat(frames, ignore_index=True)
+
+    prob = rng.uniform(0, 1, len(df)).round(4)
+    last_dates = set(sorted(df["date"].unique())[-pending_days:]) if pending_days else set()
+    pending = df["date"].isin(last_dates).to_numpy()
+    df["ai_predicted_probability"] = np.where(pending, np.nan, prob)
+    df["ai_recommendation"] = np.where(pending, None, np.where(prob > 0.7, "MUA", np.where(prob < 0.3, "BÁN", "GIỮ")))
+    df["label_win"] = np.where(pending, None, rng.integers(0, 2, len(df)))
+    return df
+
+def synth_predictions(rng, symbol: str, candles: pd.DataFrame, every: int = 12) -> pd.DataFrame:
+    picked = candles.iloc[::every]
+    price = picked["close"].to_numpy()
+    side = rng.choice(["BUY", "SELL", "HOLD"], len(picked), p=[0.4, 0.4, 0.2])
+    move = rng.uniform(0.003, 0.02, len(picked))
+    sign = np.where(side == "SELL", -1, 1)
+    return pd.DataFrame({
+        "symbol": symbol,
+        "timestamp": picked["timestamp"].to_numpy(),
+        "prediction": side,
+        "confidence": rng.uniform(0.4, 1.0, len(picked)).round(4),
+        "model_name": "synthetic",
+        "entry_price": price,
+        "tp": price * (1 + sign * move),
+        "sl": price * (1 - sign * move),
+        "high": picked["high"].to_numpy(),
+        "low": picked["low"].to_numpy(),
+        "current_price": price,
+        "executed": False,
+        "created_at": datetime.utcnow().isoformat(),
+    })
+
+# ===== 3. Ghi vào DB local =====
+def records(df: pd.DataFrame) -> list:
+    df = df.astype(object).where(pd.notna(df), None)
+    return df.to_dict(orient="records")
+
+def insert_frame(client, table: str, df: pd.DataFrame) -> int:
+    rows = records(df)
+    for start in range(0, len(rows), INSERT_CHUNK):
+        client.table(table).insert(rows[start:start + INSERT_CHUNK]).execute()
+    return len(rows)
+
+def generate(client, symbols: int = 20, candles: int = 2000, index_days: int = 500,
+             stocks: int = 30, users: int = 10, signal_days: int = 60, pending_days: int = 1,
+             seed: int = 42) -> dict:
+    rng = np.random.default_rng(seed)
+    counts = {}
+
+    watched = pd.DataFrame({
+        "symbol": [f"SYN{i:03d}USDT" for i in range(symbols)],
+        "interval": CANDLE_INTERVAL,
+        "candle_limit": 100,
+        "active": True,
+    })
+    counts["watched_symbols"] = insert_frame(client, "watched_symbols", watched)
+
+    ohlcv, predictions = [], []
+    for symbol in watched["symbol"]:
+        df = synth_ohlcv(rng, candles, start_price=rng.uniform(0.5, 50000))
+        ohlcv.append(df.assign(symbol=symbol))
+        predictions.append(synth_predictions(rng, symbol, df))
+    counts["ohlcv_data"] = insert_frame(client, "ohlcv_data", pd.concat(ohlcv, ignore_index=True))
+    counts["ai_predictions"] = insert_frame(client, "ai_predictions", pd.concat(predictions, ignore_index=True))
+
+    counts["vnindex_data"] = insert_frame(client, "vnindex_data", synth_index(rng, index_days, 1200))
+    counts["vn30_data"] = insert_frame(client, "vn30_data", synth_index(rng, index_days, 1300))
+    counts["ai_signals"] = insert_frame(
+        client, "ai_signals", synth_signals(rng, users, stocks, signal_days, pending_days)
+    )
+
+    for table, columns in INDEXES:
+        client.create_index(table, *columns)
+    return counts
+
+# ===== 4. Chạy trực tiếp =====
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu giả cho DB local (SUPABASE_BACKEND=local)")
+    parser.add_argument("--db", default=os.getenv("LOCAL_DB_PATH", DEFAULT_PATH))
+    parser.add_argument("--symbols", type=int, default=20, help="Số coin Bybit")
+    parser.add_argument("--candles", type=int, default=2000, help="Số nến 5 phút mỗi coin")
+    parser.add_argument("--index-days", type=int, default=500, help="Số phiên VNINDEX/VN30")
+    parser.add_argument("--stocks", type=int, default=30, help="Số mã VN trong ai_signals")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--signal-days", type=int, default=60)
+    parser.add_argument("--pending-days", type=int, default=1, help="Số ngày cuối chưa có dự đoán")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="Xoá file DB cũ trước khi sinh")
+    args = parser.parse_args()
+
+    if args.reset:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    started = datetime.utcnow()
+    counts = generate(
+        LocalClient(args.db), args.symbols, args.candles, args.index_days,
+        args.stocks, args.users, args.signal_days, args.pending_days, args.seed,
+    )
+    for table, n in counts.items():
+        print(f"✅ {table}: {n} dòng")
+    print(f"🎯 Xong sau {(datetime.utcnow() - started).total_seconds():.1f}s → {args.db}")
+    print(f"👉 Chạy script với: SUPABASE_BACKEND=local LOCAL_DB_PATH={args.db}")
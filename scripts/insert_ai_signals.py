@@ -1,22 +1,27 @@
+import logging
 import os
 import sys
 import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
-from supabase import create_client, Client
 import math
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.db import get_client, has_credentials
+from utils.logger import get_logger
+
 sys.stdout.reconfigure(encoding='utf-8')
 
 load_dotenv()
+logger = get_logger("insert_ai_signals")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    print("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
+if not has_credentials():
+    logger.error("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
     sys.exit(1)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = get_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 def compute_rsi(prices: pd.Series, period: int = 14) -> float:
     delta = prices.diff()
@@ -39,7 +44,7 @@ def fetch_index_data(index_code: str) -> pd.DataFrame:
         else:
             return pd.DataFrame()
     except Exception as e:
-        print(f"❌ Lỗi khi tải dữ liệu {index_code}: {e}")
+        logger.error(f"❌ Lỗi khi tải dữ liệu {index_code}: {e}")
         return pd.DataFrame()
 
 def infer_market_sentiment(df: pd.DataFrame) -> str:
@@ -196,7 +201,8 @@ def generate_signal(df: pd.DataFrame, index_code: str, date: datetime) -> dict:
 def sanitize_signal(signal: dict) -> dict:
     for k, v in signal.items():
         if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
-            print(f"⚠️ Field '{k}' có giá trị không hợp lệ: {v} → set None")
+            logger.every(("invalid_field", k), f"⚠️ Field '{k}' có giá trị không hợp lệ: {v} → set None",
+                         level=logging.WARNING)
             signal[k] = None
     return signal
 
@@ -209,23 +215,26 @@ def insert_signal(signal: dict):
             .execute()
 
         if existing.data and len(existing.data) > 0:
-            print(f"⚠️ Đã tồn tại: {signal['index_code']} ngày {signal['date']}")
-            return
+            logger.every("exists", f"⚠️ Đã tồn tại: {signal['index_code']} ngày {signal['date']}", level=logging.DEBUG)
+            return False
 
         res = supabase.table("ai_market_signals").insert(signal).execute()
         if not res.data:
-            print(f"❌ Insert thất bại! Response: {res}")
-        else:
-            print(f"✅ Đã insert {signal['index_code']} {signal['date']} ({signal['signal_type']}, score {signal['confidence_score']})")
+            logger.error(f"❌ Insert thất bại! Response: {res}")
+            return False
+        logger.debug(f"✅ Đã insert {signal['index_code']} {signal['date']} ({signal['signal_type']}, score {signal['confidence_score']})")
+        return True
     except Exception as e:
-        print(f"❌ Lỗi khi insert: {e}")
+        logger.error(f"❌ Lỗi khi insert: {e}")
+        return False
 
 def main():
-    print("🚀 Bắt đầu sinh tín hiệu AI từ dữ liệu lịch sử...")
+    logger.info("🚀 Bắt đầu sinh tín hiệu AI từ dữ liệu lịch sử...")
+    inserted = 0
     for index_code in ["VNINDEX", "VN30"]:
         df = fetch_index_data(index_code)
         if df.empty or len(df) < 20:
-            print(f"⚠️ Không đủ dữ liệu cho {index_code}")
+            logger.warning(f"⚠️ Không đủ dữ liệu cho {index_code}")
             continue
 
         for i in range(14, len(df)):
@@ -233,9 +242,11 @@ def main():
             date = sub_df.iloc[-1]["date"]
             try:
                 signal = generate_signal(sub_df, index_code, date)
-                insert_signal(sanitize_signal(signal))
+                inserted += insert_signal(sanitize_signal(signal))
             except Exception as e:
-                print(f"❌ Lỗi xử lý {index_code} ngày {date.date()}: {e}")
+                logger.every("generate_error", f"❌ Lỗi xử lý {index_code} ngày {date.date()}: {e}", level=logging.ERROR)
+    logger.info(f"✅ Đã insert {inserted} tín hiệu mới.")
+    return inserted
 
 if __name__ == "__main__":
     main()
@@ -1,23 +1,28 @@
+import logging
 import os
 import sys
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
-from supabase import create_client, Client
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.db import get_client, has_credentials
+from utils.logger import get_logger
 
 # ✅ Cho in tiếng Việt terminal
 sys.stdout.reconfigure(encoding='utf-8')
 
 # ✅ Load biến môi trường
 load_dotenv()
+logger = get_logger("label_ai_signals")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    print("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
+if not has_credentials():
+    logger.error("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY trong .env")
     sys.exit(1)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = get_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 # ✅ Lấy các tín hiệu chưa gán nhãn
 def fetch_unlabeled_signals():
@@ -28,7 +33,7 @@ def fetch_unlabeled_signals():
             .execute()
         return pd.DataFrame(res.data) if res.data else pd.DataFrame()
     except Exception as e:
-        print(f"❌ Lỗi khi lấy tín hiệu chưa gán label: {e}")
+        logger.error(f"❌ Lỗi khi lấy tín hiệu chưa gán label: {e}")
         return pd.DataFrame()
 
 # ✅ Lấy dữ liệu thị trường sau ngày tín hiệu
@@ -47,7 +52,7 @@ def fetch_market_data(index_code: str, from_date: str, days_after: int = 3):
         df["date"] = pd.to_datetime(df["date"])
         return df.sort_values("date").reset_index(drop=True)
     except Exception as e:
-        print(f"❌ Lỗi khi lấy giá {index_code} - {from_date}: {e}")
+        logger.error(f"❌ Lỗi khi lấy giá {index_code} - {from_date}: {e}")
         return pd.DataFrame()
 
 # ✅ Cập nhật nhãn thắng/thua
@@ -58,21 +63,23 @@ def update_label(signal_id: str, label_win: bool):
             .eq("id", signal_id) \
             .execute()
         if res.data:
-            print(f"✅ Gắn {signal_id}: label_win = {label_win}")
-        else:
-            print(f"⚠️ Không cập nhật được {signal_id}")
+            logger.debug(f"✅ Gắn {signal_id}: label_win = {label_win}")
+            return True
+        logger.warning(f"⚠️ Không cập nhật được {signal_id}")
     except Exception as e:
-        print(f"❌ Lỗi update label: {e}")
+        logger.error(f"❌ Lỗi update label: {e}")
+    return False
 
 # ✅ Gắn nhãn cho từng tín hiệu
 def process_signals():
-    print("🚀 Bắt đầu gắn label_win cho tín hiệu AI...")
+    logger.info("🚀 Bắt đầu gắn label_win cho tín hiệu AI...")
     df_signals = fetch_unlabeled_signals()
 
     if df_signals.empty:
-        print("✅ Không có tín hiệu nào cần gắn label.")
-        return
+        logger.info("✅ Không có tín hiệu nào cần gắn label.")
+        return 0
 
+    labeled = 0
     for _, row in df_signals.iterrows():
         index_code = row["index_code"]
         signal_date = row["date"]
@@ -84,13 +91,14 @@ def process_signals():
 
         # ⏳ Bỏ qua nếu chưa đủ 3 ngày
         if (datetime.now() - signal_date).days < 3:
-            print(f"⏳ Bỏ qua {index_code} {signal_date.date()} vì chưa đủ 3 ngày")
+            logger.every("not_ready", f"⏳ Bỏ qua {index_code} {signal_date.date()} vì chưa đủ 3 ngày")
             continue
 
         market_data = fetch_market_data(index_code, signal_date.strftime("%Y-%m-%d"))
 
         if len(market_data) < 2:
-            print(f"⚠️ Không đủ dữ liệu để đánh giá {index_code} ngày {signal_date.date()}")
+            logger.every("no_data", f"⚠️ Không đủ dữ liệu để đánh giá {index_code} ngày {signal_date.date()}",
+                         level=logging.WARNING)
             continue
 
         current_close = market_data.iloc[0]["close"]
@@ -106,14 +114,17 @@ def process_signals():
         else:  # đi ngang
             label_win = abs(pct_change) < threshold
 
-        # 🧠 Log chi tiết
-        print(
+        # 🧠 Log chi tiết: theo từng tín hiệu → chỉ lấy mẫu
+        logger.sample(
             f"🧠 {index_code} {signal_date.date()} ({signal_type}) | Giá: {current_close:.2f} → {future_close:.2f} | "
             f"Thay đổi: {pct_change*100:.2f}% → {'✅ Win' if label_win else '❌ Fail'}"
         )
 
         # ✅ Cập nhật label
-        update_label(signal_id, label_win)
+        labeled += update_label(signal_id, label_win)
+
+    logger.info(f"✅ Đã gắn nhãn {labeled}/{len(df_signals)} tín hiệu.")
+    return labeled
 
 if __name__ == "__main__":
     process_signals()
@@ -1,8 +1,15 @@
+import os
 import sys
 import json
+import hashlib
+import argparse
+import numpy as np
 import pandas as pd
 import traceback
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.optimize_service import compute_weights, METHODS
+
 REQUIRED_COLS = {"symbol", "date", "ai_predicted_probability", "ai_recommendation"}
 
 def read_input():
@@ -33,22 +40,37 @@ def validate_and_prepare(df: pd.DataFrame) -> pd.DataFrame:
 def get_latest_signals(df: pd.DataFrame) -> pd.DataFrame:
     latest = df["date"].max()
     df_latest = df[df["date"] == latest].copy()
-    df_latest = df_latest.sort_values(by="ai_predicted_probability", ascending=False)
+    df_latest = df_latest.sort_values(by="ai_predicted_probability", ascending=False, kind="mergesort")
     df_latest = df_latest.drop_duplicates(subset="symbol", keep="first")
     return df_latest
 
-def allocate_portfolio(df: pd.DataFrame) -> list:
+def expected_returns(prob: np.ndarray, cov: np.ndarray) -> np.ndarray:
+    # Quan điểm lợi suất từ AI: (2p - 1) × độ biến động của mã
+    return (2 * prob - 1) * np.sqrt(np.clip(np.diag(cov), 0, None))
+
+def allocate_portfolio(df: pd.DataFrame, method: str = "proportional", cov: pd.DataFrame = None) -> list:
     # 🔁 Chọn các mã có xác suất dự đoán thắng cao
     buy_df = df[df["ai_predicted_probability"] >= 0.7].copy()
 
     if not buy_df.empty:
+        symbols = buy_df["symbol"].tolist()
+        use_cov = (
+            method != "proportional" and cov is not None
+            and len(symbols) > 1 and set(symbols) <= set(cov.index)
+        )
         total = buy_df["ai_predicted_probability"].sum()
-        if total > 0:
-            buy_df["allocation"] = buy_df["ai_predicted_probability"] / total
+        if use_cov:
+            sub_cov = cov.loc[symbols, symbols].to_numpy()
+            prob = buy_df["ai_predicted_probability"].to_numpy(dtype=float)
+            buy_df["allocation"] = compute_weights(expected_returns(prob, sub_cov), sub_cov, method)
+            print(f"✅ Có mã xác suất cao → Phân bổ theo {method} (covariance)", file=sys.stderr)
         else:
-            buy_df["allocation"] = 1.0 / len(buy_df)
+            if total > 0:
+                buy_df["allocation"] = buy_df["ai_predicted_probability"] / total
+            else:
+                buy_df["allocation"] = 1.0 / len(buy_df)
+            print("✅ Có mã xác suất cao → Phân bổ theo xác suất", file=sys.stderr)
         buy_df["recommendation"] = "BUY"
-        print("✅ Có mã xác suất cao → Phân bổ theo xác suất", file=sys.stderr)
         return buy_df[["symbol", "ai_predicted_probability", "recommendation", "allocation"]] \
             .rename(columns={"ai_predicted_probability": "probability"}) \
             .to_dict(orient="records")
@@ -62,17 +84,81 @@ def allocate_portfolio(df: pd.DataFrame) -> list:
         .rename(columns={"ai_predicted_probability": "probability"}) \
         .to_dict(orient="records")
 
-def main():
-    try:
-        df = read_input()
-        df = validate_and_prepare(df)
-        df = get_latest_signals(df)
+# ===== Phiên bản vector hoá theo nhóm user (dùng cho batch toàn bộ user) =====
+def get_latest_signals_grouped(df: pd.DataFrame) -> pd.DataFrame:
+    latest = df.groupby("user_id")["date"].transform("max")
+    df_latest = df[df["date"] == latest]
+    df_latest = df_latest.sort_values(
+        by=["user_id", "ai_predicted_probability"], ascending=[True, False], kind="mergesort"
+    )
+    return df_latest.drop_duplicates(subset=["user_id", "symbol"], keep="first")
+
+def allocate_portfolio_grouped(df: pd.DataFrame) -> pd.DataFrame:
+    """Giống allocate_portfolio (proportional) nhưng tính cho mọi user cùng lúc."""
+    df = df.copy()
+    prob = df["ai_predicted_probability"]
+    is_buy = prob >= 0.7
+    user = df["user_id"]
+
+    has_buy = is_buy.groupby(user).transform("any")
+    rank = df.groupby("user_id").cumcount()
+    selected = (has_buy & is_buy) | (~has_buy & (rank < 3))
+    df = df[selected].copy()
+    has_buy = has_buy[selected]
+
+    buy_prob = df["ai_predicted_probability"].where(has_buy, 0.0)
+    buy_total = buy_prob.groupby(df["user_id"]).transform("sum")
+    count = df.groupby("user_id")["symbol"].transform("size")
+
+    df["recommendation"] = np.where(has_buy, "BUY", "WATCH")
+    df["allocation"] = np.where(
+        has_buy & (buy_total > 0),
+        df["ai_predicted_probability"] / buy_total.where(buy_total > 0, 1.0),
+        1.0 / count
+    )
+    return df.rename(columns={"ai_predicted_probability": "probability"})
 
-        if df.empty:
-            print(json.dumps({"message": "⚠️ Không có dữ liệu hợp lệ để tối ưu"}))
-            return
+def portfolio_etag(payload: dict) -> str:
+    body = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()
 
-        result = allocate_portfolio(df)
+def build_portfolio(records: list, method: str = "proportional", risk_store=None):
+    """
+    Tối ưu danh mục từ list các dòng ai_signals (gọi trực tiếp trong tiến trình).
+    Trả về list phân bổ, hoặc dict {"message": ...} nếu không có dữ liệu hợp lệ.
+    """
+    df = validate_and_prepare(pd.DataFrame(records, columns=None if records else list(REQUIRED_COLS)))
+    df = get_latest_signals(df)
+
+    if df.empty:
+        return {"message": "⚠️ Không có dữ liệu hợp lệ để tối ưu"}
+
+    cov = None
+    if method != "proportional" and risk_store is not None:
+        buy_symbols = df.loc[df["ai_predicted_probability"] >= 0.7, "symbol"].tolist()
+        if len(buy_symbols) > 1:
+            cov = risk_store.covariance(buy_symbols, df["date"].max().strftime("%Y-%m-%d"))
+
+    return allocate_portfolio(df, method, cov)
+
+def load_risk_store():
+    from dotenv import load_dotenv
+    from services.db import get_client
+    from services.risk_model import RiskModelStore, supabase_close_loader
+
+    load_dotenv()
+    supabase = get_client()
+    return RiskModelStore(supabase_close_loader(supabase))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--method", default="proportional", choices=METHODS)
+    args = parser.parse_args()
+
+    try:
+        records = read_input().to_dict(orient="records")
+        risk_store = load_risk_store() if args.method != "proportional" else None
+        result = build_portfolio(records, args.method, risk_store)
         print(json.dumps(result, ensure_ascii=False))
 
     except Exception as e:
@@ -1,25 +1,35 @@
 import os
 import sys
 import json
+import time
+import argparse
 import joblib
 import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from supabase import create_client, Client
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.db import get_client, has_credentials
+from services.metrics import metrics, batch_size_bucket
+from services.dtype_policy import DTYPE_PARITY_CHECK, compact, compact_logged, check_parity
+from utils.logger import get_logger
+
 # 🔐 Load biến môi trường từ .env
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
+logger = get_logger("predict_all")
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    print("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY", file=sys.stderr)
+if not has_credentials():
+    logger.error("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY")
     sys.exit(1)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = get_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 MODEL_PATH = Path("model") / "model.pkl"
 REQUIRED_COLUMNS = [
@@ -28,7 +38,7 @@ REQUIRED_COLUMNS = [
 ]
 
 def fetch_ai_input_data() -> pd.DataFrame:
-    print("📡 Lấy dữ liệu chưa dự đoán từ bảng ai_signals...", file=sys.stderr)
+    logger.info("📡 Lấy dữ liệu chưa dự đoán từ bảng ai_signals...")
     try:
         res = supabase.table("ai_signals") \
             .select("*") \
@@ -37,8 +47,8 @@ def fetch_ai_input_data() -> pd.DataFrame:
     except Exception as e:
         raise RuntimeError(f"❌ Lỗi truy vấn Supabase: {e}")
 
-    df = pd.DataFrame(res.data or [])
-    print(f"📊 Tổng dòng cần dự đoán: {len(df)}", file=sys.stderr)
+    df = compact_logged(pd.DataFrame(res.data or []), "ai_signals")
+    logger.info(f"📊 Tổng dòng cần dự đoán: {len(df)}")
     return df
 
 def classify_recommendation(p: float) -> str:
@@ -49,27 +59,37 @@ def classify_recommendation(p: float) -> str:
     else:
         return "WATCH"
 
-def predict(df: pd.DataFrame) -> pd.DataFrame:
+def load_model():
     if not MODEL_PATH.exists():
         raise FileNotFoundError(f"❌ Không tìm thấy mô hình tại: {MODEL_PATH}")
+    return joblib.load(MODEL_PATH)
 
-    model = joblib.load(MODEL_PATH)
+def predict(df: pd.DataFrame, model=None) -> pd.DataFrame:
+    if model is None:
+        model = load_model()
 
     # Bổ sung các cột thiếu
     for col in REQUIRED_COLUMNS:
         if col not in df.columns:
-            print(f"⚠️ Thiếu cột {col} → tạo với giá trị 0", file=sys.stderr)
+            logger.warning(f"⚠️ Thiếu cột {col} → tạo với giá trị 0")
             df[col] = 0
 
     X = df[REQUIRED_COLUMNS].fillna(0)
-    probs = model.predict_proba(X)
+    # XGBoost so ngưỡng trên float32 → ép sẵn không đổi kết quả, bớt 1 lần copy float64 → float32 bên trong
+    X_compact = compact(X)
+    if DTYPE_PARITY_CHECK:
+        check_parity(model, X, X_compact)
+    X = X_compact
+    with metrics.timer("model_inference_seconds", {"model": "vn", "batch": batch_size_bucket(len(X))}):
+        probs = model.predict_proba(X)
+    metrics.inc("model_inference_rows_total", {"model": "vn"}, len(X))
 
     df["ai_predicted_probability"] = probs[:, 1]
     df["ai_recommendation"] = df["ai_predicted_probability"].apply(classify_recommendation)
     return df
 
 def save_results(df: pd.DataFrame):
-    print(f"💾 Ghi {len(df)} dòng kết quả lên Supabase...", file=sys.stderr)
+    logger.info(f"💾 Ghi {len(df)} dòng kết quả lên Supabase...")
 
     cols = ["user_id", "symbol", "date", "ai_predicted_probability", "ai_recommendation"]
     df = df[cols].copy()
@@ -82,11 +102,109 @@ def save_results(df: pd.DataFrame):
     except Exception as e:
         raise RuntimeError(f"❌ Lỗi ghi kết quả về Supabase: {e}")
 
+# ===== Chế độ streaming: phân trang theo id, chấm điểm & ghi từng khối =====
+CHUNK_SIZE = int(os.getenv("PREDICT_ALL_CHUNK_SIZE", 500))
+MAX_IN_FLIGHT = int(os.getenv("PREDICT_ALL_MAX_IN_FLIGHT", 3))
+CHECKPOINT_PATH = Path(os.getenv("PREDICT_ALL_CHECKPOINT", ".cache/predict_all.checkpoint"))
+STREAM_COLUMNS = ", ".join(["id", "user_id", "symbol", "date"] + REQUIRED_COLUMNS)
+
+def fetch_pending_page(after_id=None, limit: int = CHUNK_SIZE) -> list:
+    query = supabase.table("ai_signals") \
+        .select(STREAM_COLUMNS) \
+        .is_("ai_predicted_probability", "null")
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    res = query.order("id").limit(limit).execute()
+    return res.data or []
+
+def read_checkpoint():
+    try:
+        return json.loads(CHECKPOINT_PATH.read_text())["last_id"]
+    except Exception:
+        return None
+
+def write_checkpoint(last_id):
+    CHECKPOINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CHECKPOINT_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"last_id": last_id, "updated_at": datetime.utcnow().isoformat()}))
+    os.replace(tmp, CHECKPOINT_PATH)
+
+def run_streaming(chunk_size: int = CHUNK_SIZE, max_in_flight: int = MAX_IN_FLIGHT) -> int:
+    """
+    Fetch trang kế tiếp, chấm điểm trang hiện tại và ghi các trang trước chạy chồng lên nhau.
+    Số request ghi đang chạy bị chặn bởi max_in_flight; checkpoint chỉ tiến khi
+    các khối trước đó đã ghi xong theo đúng thứ tự → dừng giữa chừng có thể chạy tiếp.
+    """
+    model = load_model()
+    last_id = read_checkpoint()
+    if last_id is not None:
+        logger.info(f"♻️ Tiếp tục từ checkpoint id > {last_id}")
+
+    total = 0
+    started = time.perf_counter()
+    in_flight = deque()
+
+    def drain_one():
+        future, page_last, n = in_flight.popleft()
+        future.result()
+        write_checkpoint(page_last)
+        return n
+
+    with ThreadPoolExecutor(max_workers=max_in_flight + 1) as pool:
+        next_page = pool.submit(fetch_pending_page, last_id, chunk_size)
+        while True:
+            rows = next_page.result()
+            if not rows:
+                break
+
+            page_last = rows[-1]["id"]
+            next_page = pool.submit(fetch_pending_page, page_last, chunk_size)
+
+            scored = predict(pd.DataFrame(rows), model)
+
+            while len(in_flight) >= max_in_flight:
+                total += drain_one()
+            in_flight.append((pool.submit(save_results, scored), page_last, len(scored)))
+
+            elapsed = time.perf_counter() - started
+            # Mỗi trang 1 dòng tiến độ → giới hạn tần suất
+            logger.every("progress", f"⏩ Đã chấm {total + sum(n for _, _, n in in_flight)} dòng "
+                         f"({(total / elapsed) if elapsed > 0 else 0:.0f} dòng/s đã ghi)")
+
+        while in_flight:
+            total += drain_one()
+
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed if elapsed > 0 else 0.0
+    logger.info(f"🏁 Streaming xong {total} dòng trong {elapsed:.2f}s ({rate:.0f} dòng/s)")
+
+    # Chạy hết → lần sau bắt đầu lại từ đầu
+    CHECKPOINT_PATH.unlink(missing_ok=True)
+    return total
+
+def main_streaming():
+    try:
+        started = time.perf_counter()
+        count = run_streaming()
+        elapsed = time.perf_counter() - started
+        print(json.dumps({
+            "message": "✅ Dự đoán thành công" if count else "✅ Không cần dự đoán",
+            "count": count,
+            "rows_per_second": round(count / elapsed, 1) if elapsed > 0 else 0.0
+        }))
+    except Exception as e:
+        import traceback
+        print(json.dumps({
+            "error": str(e),
+            "trace": traceback.format_exc()
+        }), file=sys.stderr)
+        sys.exit(1)
+
 def main():
     try:
         df = fetch_ai_input_data()
         if df.empty:
-            print("✅ Không có dòng nào cần dự đoán hôm nay.", file=sys.stderr)
+            logger.info("✅ Không có dòng nào cần dự đoán hôm nay.")
             print(json.dumps({ "message": "✅ Không cần dự đoán", "count": 0 }))
             return
 
@@ -107,4 +225,11 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true",
+                        default=os.getenv("PREDICT_ALL_STREAM") == "1",
+                        help="Phân trang + ghi theo khối thay vì tải toàn bộ vào bộ nhớ")
+    if parser.parse_args().stream:
+        main_streaming()
+    else:
+        main()
@@ -0,0 +1,197 @@
+"""
+Replay traffic đã capture (services/traffic_capture) vào server local để đo tải theo đúng tỉ lệ request thật.
+- `--rate` req/s theo lịch cố định (open-loop): latency tính từ thời điểm lẽ ra phải gửi,
+  nên server chậm làm latency tăng chứ không làm giảm tải (tránh coordinated omission)
+- `--rate 0`: gửi nhanh nhất có thể với `--concurrency` luồng
+- `--users`: ánh xạ userId ẩn danh sang user có dữ liệu thật / giả (giữ nguyên tỉ lệ user lặp lại)
+Báo cáo: throughput, tỉ lệ lỗi, p50/p90/p95/p99/max theo từng route.
+
+VD: python scripts/replay_traffic.py --rate 50 --concurrency 16 --duration 60
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.traffic_capture import TRAFFIC_CAPTURE_PATH, USER_ID_KEYS, load
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+# ===== 1. Chuẩn bị request =====
+def remap_users(value, users):
+    """userId ẩn danh → 1 user trong `users` (cố định theo mã băm để user lặp lại vẫn lặp lại)."""
+    if isinstance(value, dict):
+        return {
+            k: (users[int(hashlib.sha1(str(v).encode()).hexdigest(), 16) % len(users)]
+                if k in USER_ID_KEYS and v is not None else remap_users(v, users))
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [remap_users(v, users) for v in value]
+    return value
+
+
+def build_requests(entries, target: str, users=None):
+    prepared = []
+    for e in entries:
+        body = e.get("body")
+        if users and body is not None:
+            body = remap_users(body, users)
+        prepared.append({
+            "route": e["path"].split("?")[0],
+            "method": e.get("method", "POST"),
+            "url": target.rstrip("/") + e["path"],
+            "headers": e.get("headers") or {"Content-Type": "application/json"},
+            "data": json.dumps(body).encode("utf-8") if body is not None else None,
+        })
+    return prepared
+
+
+# ===== 2. Gửi =====
+def send(req: dict, timeout: float) -> tuple:
+    """Trả về (status, lỗi). status None = lỗi kết nối / timeout."""
+    http_req = urllib.request.Request(req["url"], data=req["data"], headers=req["headers"], method=req["method"])
+    try:
+        with urllib.request.urlopen(http_req, timeout=timeout) as res:
+            res.read()
+            return res.status, None
+    except urllib.error.HTTPError as e:
+        # 304 (ETag của /portfolio) không phải lỗi
+        return e.code, None if e.code == 304 else f"HTTP {e.code}"
+    except Exception as e:
+        return None, type(e).__name__
+
+
+def replay(requests_, rate: float, concurrency: int, duration: float, limit: int, timeout: float):
+    results = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration if duration else None
+    started = time.perf_counter()
+
+    def one(i, req):
+        intended = started + i / rate if rate else None
+        if intended is not None:
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sent = time.perf_counter()
+        status, error = send(req, timeout)
+        done = time.perf_counter()
+        with lock:
+            results.append({
+                "route": req["route"],
+                "status": status,
+                "error": error,
+                "latency_ms": (done - (intended if intended is not None else sent)) * 1000,
+                "service_ms": (done - sent) * 1000,
+            })
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        i = 0
+        while (limit is None or i < limit) and (stop_at is None or time.perf_counter() < stop_at):
+            if rate and duration and i / rate >= duration:
+                break
+            req = requests_[i % len(requests_)]
+            if rate:
+                # Không xếp hàng quá xa lịch gửi → hàng đợi của pool không phình
+                ahead = started + i / rate - time.perf_counter()
+                if ahead > 1.0:
+                    time.sleep(ahead - 1.0)
+            pool.submit(one, i, req)
+            i += 1
+            if limit is None and stop_at is None and i >= len(requests_):
+                break
+    return results, time.perf_counter() - started
+
+
+# ===== 3. Báo cáo =====
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def summarize(results, elapsed: float) -> dict:
+    def stats(rows):
+        latencies = sorted(r["latency_ms"] for r in rows)
+        errors = sum(1 for r in rows if r["error"])
+        return {
+            "n": len(rows),
+            "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+            **{f"p{p}_ms": round(percentile(latencies, p), 2) for p in PERCENTILES if latencies},
+            "max_ms": round(latencies[-1], 2) if latencies else None,
+        }
+
+    by_route = defaultdict(list)
+    for r in results:
+        by_route[r["route"]].append(r)
+    return {
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else None,
+        **stats(results),
+        "status": dict(Counter(str(r["status"]) for r in results)),
+        "errors": dict(Counter(r["error"] for r in results if r["error"])),
+        "routes": {route: stats(rows) for route, rows in sorted(by_route.items())},
+    }
+
+
+def print_report(report: dict):
+    print(f"\n🚦 Replay {report['requests']} request trong {report['elapsed_s']}s "
+          f"→ {report['throughput_rps']} req/s | lỗi {report['error_rate'] * 100:.2f}%")
+    print(f"   status: {report['status']}")
+    if report["errors"]:
+        print(f"   lỗi: {report['errors']}")
+    print(f"   {'route':24} {'n':>7} {'lỗi %':>7} " + " ".join(f"{'p' + str(p):>9}" for p in PERCENTILES) + f" {'max':>9}")
+    for route, s in [("(tất cả)", report)] + list(report["routes"].items()):
+        cols = " ".join(f"{s.get(f'p{p}_ms', 0):>7.1f}ms" for p in PERCENTILES)
+        print(f"   {route:24} {s['n']:>7} {s['error_rate'] * 100:>6.2f}% {cols} {s['max_ms'] or 0:>7.1f}ms")
+
+
+# ===== 4. Chạy =====
+def main():
+    parser = argparse.ArgumentParser(description="Replay traffic đã capture để đo tải")
+    parser.add_argument("--file", default=TRAFFIC_CAPTURE_PATH)
+    parser.add_argument("--target", default="http://localhost:5000")
+    parser.add_argument("--rate", type=float, default=0, help="req/s (0 = nhanh nhất có thể)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, help="Giây; hết file thì quay lại từ đầu")
+    parser.add_argument("--limit", type=int, help="Số request tối đa")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--routes", help="Chỉ replay các route này, VD: /predict,/portfolio")
+    parser.add_argument("--users", help="Danh sách userId thay cho userId ẩn danh (phân tách bởi dấu phẩy)")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args()
+
+    entries = load(args.file)
+    if args.routes:
+        routes = set(args.routes.split(","))
+        entries = [e for e in entries if e["path"].split("?")[0] in routes]
+    if not entries:
+        print(f"❌ Không có request nào trong {args.file}")
+        sys.exit(1)
+
+    users = args.users.split(",") if args.users else None
+    prepared = build_requests(entries, args.target, users)
+    mix = Counter(r["route"] for r in prepared)
+    print(f"📂 {len(prepared)} request từ {args.file}: {dict(mix)}")
+
+    results, elapsed = replay(prepared, args.rate, args.concurrency, args.duration, args.limit, args.timeout)
+    report = summarize(results, elapsed)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
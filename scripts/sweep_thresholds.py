@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.sweep_service import precompute_bybit, precompute_vn, run_sweep, LABEL_PARAMS
+from scripts.bybit.backtest import fetch_table, load_snapshot, PREDICTION_COLUMNS, CANDLE_COLUMNS
+
+# ===== 1. Cấu hình =====
+sys.stdout.reconfigure(encoding='utf-8')
+load_dotenv()
+
+# Lưới mặc định bao quanh các hằng số đang dùng trong code
+DEFAULT_BYBIT_GRID = {
+    "confidence_threshold": [0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9],   # ai_execute_signals.CONFIDENCE_THRESHOLD
+    "time_window_minutes": [15, 30, 45, 60, 120],                           # ai_execute_signals.TIME_WINDOW_MINUTES
+    # Nhãn không đổi lệnh mô phỏng → báo cáo thành cột label_acc_h<n>_t<x>, không nhân thêm dòng
+    "label_horizon": [1, 3, 6, 12],                                         # generate_features: close.shift(-3)
+    "label_threshold": [0.001, 0.002, 0.003, 0.005],                        # generate_features: ±0.2%
+}
+DEFAULT_VN_GRID = {
+    "buy_cutoff": [0.6, 0.65, 0.7, 0.75, 0.8, 0.85],                        # /predict 0.7, classify_recommendation 0.75
+    "sell_cutoff": [0.2, 0.25, 0.3, 0.35, 0.4, 0.45],                       # /predict 0.3, classify_recommendation 0.4
+}
+
+def parse_list(value: str, cast=float):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+# ===== 2. Tải dữ liệu =====
+def get_client():
+    from services.db import get_client as db_client
+    return db_client()
+
+def load_vn_signals(snapshot_dir=None) -> pd.DataFrame:
+    if snapshot_dir:
+        return pd.read_parquet(os.path.join(snapshot_dir, "ai_signals.parquet"))
+
+    supabase = get_client()
+    rows, start, page = [], 0, 1000
+    while True:
+        res = supabase.table("ai_signals") \
+            .select("ai_predicted_probability, label_win") \
+            .not_.is_("ai_predicted_probability", "null") \
+            .not_.is_("label_win", "null") \
+            .order("id") \
+            .range(start, start + page - 1) \
+            .execute()
+        data = res.data or []
+        rows.extend(data)
+        if len(data) < page:
+            break
+        start += page
+    return pd.DataFrame(rows)
+
+def load_bybit(snapshot_dir=None):
+    if snapshot_dir:
+        return load_snapshot(snapshot_dir)
+    supabase = get_client()
+    predictions = fetch_table(supabase, "ai_predictions", PREDICTION_COLUMNS)
+    candles = fetch_table(supabase, "ohlcv_data", CANDLE_COLUMNS)
+    return predictions, candles
+
+# ===== 3. Chạy chính =====
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Quét lưới ngưỡng chiến lược song song")
+    parser.add_argument("kind", choices=["bybit", "vn"], help="Bộ ngưỡng cần quét")
+    parser.add_argument("--snapshot", help="Thư mục snapshot Parquet (chạy offline)")
+    parser.add_argument("--workers", type=int, default=None, help="Số process (mặc định = số CPU)")
+    parser.add_argument("--top", type=int, default=20, help="Số dòng đầu của bảng xếp hạng")
+    parser.add_argument("--sort-by", help="Cột xếp hạng")
+    parser.add_argument("--out", help="Ghi toàn bộ bảng xếp hạng ra CSV")
+    parser.add_argument("--hold-horizon", type=int, default=288, help="Số nến tối đa giữ lệnh khi backtest")
+    parser.add_argument("--confidence", help="VD: 0.6,0.7,0.8")
+    parser.add_argument("--window", help="VD: 30,45,60")
+    parser.add_argument("--label-horizon", help="VD: 3,6")
+    parser.add_argument("--label-threshold", help="VD: 0.002,0.003")
+    parser.add_argument("--buy-cutoff", help="VD: 0.7,0.75")
+    parser.add_argument("--sell-cutoff", help="VD: 0.3,0.4")
+    return parser.parse_args(argv)
+
+def build_grid(args) -> dict:
+    if args.kind == "bybit":
+        grid = dict(DEFAULT_BYBIT_GRID)
+        if args.confidence:
+            grid["confidence_threshold"] = parse_list(args.confidence)
+        if args.window:
+            grid["time_window_minutes"] = parse_list(args.window)
+        if args.label_horizon:
+            grid["label_horizon"] = parse_list(args.label_horizon, int)
+        if args.label_threshold:
+            grid["label_threshold"] = parse_list(args.label_threshold)
+        return grid
+
+    grid = dict(DEFAULT_VN_GRID)
+    if args.buy_cutoff:
+        grid["buy_cutoff"] = parse_list(args.buy_cutoff)
+    if args.sell_cutoff:
+        grid["sell_cutoff"] = parse_list(args.sell_cutoff)
+    return grid
+
+def main(argv=None):
+    args = parse_args(argv)
+    grid = build_grid(args)
+    n_points = 1
+    for key, values in grid.items():
+        if args.kind != "bybit" or key not in LABEL_PARAMS:
+            n_points *= len(values)
+    print(f"🧮 Quét {n_points} tổ hợp tham số ({args.kind})...")
+
+    started = time.perf_counter()
+    if args.kind == "bybit":
+        predictions, candles = load_bybit(args.snapshot)
+        print(f"📊 {len(predictions)} tín hiệu | {len(candles)} nến")
+        if "created_at" not in predictions.columns and "time_window_minutes" in grid:
+            # Snapshot cũ không có created_at → mọi time_window cho cùng kết quả, bỏ trục này thay vì nhân bản dòng
+            print("⚠️ Snapshot không có cột created_at → bỏ qua lưới time_window_minutes.")
+            grid.pop("time_window_minutes")
+        data = precompute_bybit(predictions, candles, grid["label_horizon"], args.hold_horizon)
+    else:
+        signals = load_vn_signals(args.snapshot)
+        print(f"📊 {len(signals)} tín hiệu đã có xác suất + nhãn")
+        data = precompute_vn(signals)
+    print(f"⚙️ Tiền xử lý xong sau {time.perf_counter() - started:.2f}s")
+
+    if data.empty:
+        print("⚠️ Không có dữ liệu để quét.")
+        return pd.DataFrame()
+
+    started = time.perf_counter()
+    table = run_sweep(args.kind, data, grid, workers=args.workers, sort_by=args.sort_by)
+    print(f"⚡ Đánh giá {len(table)} tổ hợp sau {time.perf_counter() - started:.2f}s\n")
+
+    print(table.head(args.top).to_string())
+
+    if args.out:
+        table.to_csv(args.out)
+        print(f"\n💾 Đã ghi bảng xếp hạng vào {args.out}")
+    return table
+
+if __name__ == "__main__":
+    main()
@@ -3,40 +3,44 @@ import sys
 import pandas as pd
 import xgboost as xgb
 import joblib
-from supabase import create_client, Client
 from dotenv import load_dotenv
 from sklearn.metrics import classification_report, confusion_matrix
 from sklearn.model_selection import train_test_split
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.db import get_client, has_credentials
+from utils.logger import get_logger
+
 # ✅ Unicode cho Windows terminal
 sys.stdout.reconfigure(encoding='utf-8')
 
 # ✅ Load biến môi trường
 load_dotenv()
+logger = get_logger("train_ai_model")
 
 # 🔐 Kiểm tra biến môi trường
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    print("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY")
+if not has_credentials():
+    logger.error("❌ Thiếu SUPABASE_URL hoặc SUPABASE_SERVICE_ROLE_KEY")
     sys.exit(1)
 
 # 🔗 Kết nối Supabase
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = get_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 def fetch_data():
-    print("📥 Đang tải dữ liệu từ Supabase...")
+    logger.info("📥 Đang tải dữ liệu từ Supabase...")
     try:
         res = supabase.table("ai_signals").select("*").execute()
         if not res.data:
-            print("⚠️ Không có dữ liệu trả về.")
+            logger.warning("⚠️ Không có dữ liệu trả về.")
             return pd.DataFrame()
         df = pd.DataFrame(res.data)
-        print(f"📊 Tổng số dòng tải về: {len(df)}")
+        logger.info(f"📊 Tổng số dòng tải về: {len(df)}", rows=len(df))
         return df
     except Exception as e:
-        print(f"❌ Lỗi khi tải dữ liệu: {e}")
+        logger.error(f"❌ Lỗi khi tải dữ liệu: {e}")
         return pd.DataFrame()
 
 def preprocess(df):
@@ -47,7 +51,7 @@ def preprocess(df):
 
     for col in expected:
         if col not in df.columns:
-            print(f"⚠️ Thiếu cột {col} → tạo với giá trị 0")
+            logger.warning(f"⚠️ Thiếu cột {col} → tạo với giá trị 0")
             df[col] = 0
 
     df = df[expected].copy()
@@ -58,12 +62,12 @@ def preprocess(df):
     df = df.dropna()
 
     label_counts = df["label_win"].value_counts()
-    print(f"📊 Phân phối nhãn:\n{label_counts}")
+    logger.info(f"📊 Phân phối nhãn:\n{label_counts}")
     if len(label_counts) < 2:
-        print("❌ label_win không đủ đa dạng (chỉ có 1 loại nhãn).")
+        logger.error("❌ label_win không đủ đa dạng (chỉ có 1 loại nhãn).")
         return pd.DataFrame()
 
-    print(f"✅ Dữ liệu sau xử lý: {len(df)} dòng")
+    logger.info(f"✅ Dữ liệu sau xử lý: {len(df)} dòng", rows=len(df))
     return df
 
 def train_model(df):
@@ -85,10 +89,8 @@ def train_model(df):
     model.fit(X_train, y_train)
     y_pred = model.predict(X_test)
 
-    print("📋 Classification Report:")
-    print(classification_report(y_test, y_pred))
-    print("🧾 Confusion Matrix:")
-    print(confusion_matrix(y_test, y_pred))
+    logger.info(f"📋 Classification Report:\n{classification_report(y_test, y_pred)}")
+    logger.info(f"🧾 Confusion Matrix:\n{confusion_matrix(y_test, y_pred)}")
 
     return model
 
@@ -96,19 +98,19 @@ def save_model(model):
     os.makedirs("model", exist_ok=True)
     path = os.path.join("model", "model.pkl")
     joblib.dump(model, path)
-    print(f"💾 Mô hình đã lưu tại: {path}")
+    logger.info(f"💾 Mô hình đã lưu tại: {path}")
 
 def main():
     df = fetch_data()
     df = preprocess(df)
 
     if df.empty:
-        print("❌ Không đủ dữ liệu để huấn luyện mô hình.")
+        logger.error("❌ Không đủ dữ liệu để huấn luyện mô hình.")
         return
 
     model = train_model(df)
     save_model(model)
-    print("🎉 Huấn luyện và lưu mô hình thành công!")
+    logger.info("🎉 Huấn luyện và lưu mô hình thành công!")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+
+# Mã kết quả của một lệnh
+OUTCOME_TP = 1
+OUTCOME_SL = -1
+OUTCOME_TIMEOUT = 0
+
+SIDE_MAP = {"BUY": 1, "SELL": -1}
+
+# Giới hạn số ô (lệnh × nến) cho mỗi khối để bộ nhớ luôn bị chặn
+MAX_CELLS_PER_CHUNK = 4_000_000
+
+
+def first_touch(highs, lows, start_idx, end_idx, tp, sl, side, horizon):
+    """
+    Tìm nến đầu tiên chạm TP hoặc SL cho từng lệnh, vector hoá trên mảng NumPy.
+
+    highs/lows: mảng giá của toàn bộ nến (đã sắp theo symbol, timestamp)
+    start_idx: chỉ số nến đầu tiên được xét cho mỗi lệnh
+    end_idx:   chỉ số (không bao gồm) hết dữ liệu của symbol tương ứng
+    side: 1 = BUY, -1 = SELL
+
+    Trả về (exit_idx, outcome). Nếu cùng một nến chạm cả TP và SL thì tính SL
+    (giả định bảo thủ vì không biết thứ tự trong nến).
+    """
+    n = len(start_idx)
+    exit_idx = np.empty(n, dtype=np.int64)
+    outcome = np.empty(n, dtype=np.int8)
+    if n == 0:
+        return exit_idx, outcome
+
+    step = max(1, MAX_CELLS_PER_CHUNK // max(horizon, 1))
+    offsets = np.arange(horizon, dtype=np.int64)
+
+    for lo in range(0, n, step):
+        hi_ = min(n, lo + step)
+        s = start_idx[lo:hi_]
+        e = end_idx[lo:hi_]
+        idx = s[:, None] + offsets[None, :]
+        valid = idx < e[:, None]
+        idx = np.minimum(idx, len(highs) - 1)
+
+        h = highs[idx]
+        l = lows[idx]
+        is_buy = (side[lo:hi_] == 1)[:, None]
+        t = tp[lo:hi_, None]
+        st = sl[lo:hi_, None]
+
+        tp_hit = np.where(is_buy, h >= t, l <= t) & valid
+        sl_hit = np.where(is_buy, l <= st, h >= st) & valid
+
+        no_hit = horizon + 1
+        first_tp = np.where(tp_hit.any(axis=1), tp_hit.argmax(axis=1), no_hit)
+        first_sl = np.where(sl_hit.any(axis=1), sl_hit.argmax(axis=1), no_hit)
+
+        # Lệnh không chạm gì: thoát ở nến hợp lệ cuối cùng của cửa sổ
+        last_valid = np.maximum(valid.sum(axis=1) - 1, 0)
+
+        out = np.full(hi_ - lo, OUTCOME_TIMEOUT, dtype=np.int8)
+        out[first_tp < first_sl] = OUTCOME_TP
+        out[(first_sl <= first_tp) & (first_sl != no_hit)] = OUTCOME_SL
+
+        offset = np.where(out == OUTCOME_TP, first_tp,
+                          np.where(out == OUTCOME_SL, first_sl, last_valid))
+        exit_idx[lo:hi_] = s + offset
+        outcome[lo:hi_] = out
+
+    return exit_idx, outcome
+
+
+def prepare_candles(candles: pd.DataFrame):
+    """Sắp nến theo (symbol, timestamp) và trả về mảng + vị trí từng symbol."""
+    candles = candles[["symbol", "timestamp", "high", "low", "close"]] \
+        .drop_duplicates(subset=["symbol", "timestamp"]) \
+        .sort_values(["symbol", "timestamp"], kind="mergesort") \
+        .reset_index(drop=True)
+
+    symbols = candles["symbol"].to_numpy()
+    bounds = {}
+    if len(symbols):
+        change = np.flatnonzero(symbols[1:] != symbols[:-1]) + 1
+        starts = np.concatenate([[0], change])
+        ends = np.concatenate([change, [len(symbols)]])
+        bounds = {symbols[s]: (int(s), int(e)) for s, e in zip(starts, ends)}
+
+    arrays = {
+        "timestamp": candles["timestamp"].to_numpy(dtype=np.int64),
+        "high": candles["high"].to_numpy(dtype=np.float64),
+        "low": candles["low"].to_numpy(dtype=np.float64),
+        "close": candles["close"].to_numpy(dtype=np.float64),
+    }
+    return arrays, bounds
+
+
+def run_backtest(predictions: pd.DataFrame, candles: pd.DataFrame,
+                 confidence_threshold: float = 0.75, horizon: int = 288,
+                 fee_rate: float = 0.0006) -> pd.DataFrame:
+    """
+    Phát lại ai_predictions trên nến lịch sử.
+
+    Vào lệnh tại giá đóng cửa của nến tín hiệu (entry_price nếu có),
+    xét tối đa `horizon` nến kế tiếp, thoát tại TP/SL hoặc giá đóng cửa cuối cửa sổ.
+    Trả về DataFrame các lệnh với pnl_pct đã trừ phí 2 chiều.
+    """
+    columns = ["symbol", "model_name", "side", "confidence", "entry_ts", "exit_ts",
+               "entry_price", "exit_price", "tp", "sl", "outcome", "bars_held", "pnl_pct"]
+
+    if predictions.empty or candles.empty:
+        return pd.DataFrame(columns=columns)
+
+    preds = predictions.copy()
+    preds["side"] = preds["prediction"].astype(str).str.upper().map(SIDE_MAP)
+    preds["confidence"] = pd.to_numeric(preds["confidence"], errors="coerce")
+    preds = preds[preds["side"].notna() & (preds["confidence"] >= confidence_threshold)]
+    if "model_name" not in preds.columns:
+        preds["model_name"] = "AI"
+    preds["model_name"] = preds["model_name"].fillna("AI")
+
+    arrays, bounds = prepare_candles(candles)
+    ts = arrays["timestamp"]
+
+    frames = []
+    for symbol, group in preds.groupby("symbol", sort=False):
+        if symbol not in bounds:
+            continue
+        s, e = bounds[symbol]
+        sym_ts = ts[s:e]
+
+        pred_ts = pd.to_numeric(group["timestamp"], errors="coerce").to_numpy(dtype=np.float64)
+        signal_pos = np.searchsorted(sym_ts, pred_ts, side="right") - 1
+        ok = (signal_pos >= 0) & (signal_pos < len(sym_ts) - 1)
+        if not ok.any():
+            continue
+
+        g = group[ok]
+        signal_idx = s + signal_pos[ok]
+
+        close_at_signal = arrays["close"][signal_idx]
+        entry = pd.to_numeric(g["entry_price"], errors="coerce").to_numpy(dtype=np.float64) \
+            if "entry_price" in g.columns else np.full(len(g), np.nan)
+        entry = np.where(np.isfinite(entry) & (entry > 0), entry, close_at_signal)
+        tp = pd.to_numeric(g["tp"], errors="coerce").to_numpy(dtype=np.float64)
+        sl = pd.to_numeric(g["sl"], errors="coerce").to_numpy(dtype=np.float64)
+        side = g["side"].to_numpy(dtype=np.int8)
+
+        # TP/SL thiếu → không bao giờ chạm, lệnh thoát theo thời gian
+        tp = np.where(np.isfinite(tp), tp, np.where(side == 1, np.inf, -np.inf))
+        sl = np.where(np.isfinite(sl), sl, np.where(side == 1, -np.inf, np.inf))
+
+        start_idx = signal_idx + 1
+        end_idx = np.full(len(start_idx), e, dtype=np.int64)
+        exit_idx, outcome = first_touch(
+            arrays["high"], arrays["low"], start_idx, end_idx, tp, sl, side, horizon
+        )
+
+        exit_price = np.where(outcome == OUTCOME_TP, tp,
+                              np.where(outcome == OUTCOME_SL, sl, arrays["close"][exit_idx]))
+        pnl = side * (exit_price - entry) / entry - 2 * fee_rate
+
+        frames.append(pd.DataFrame({
+            "symbol": symbol,
+            "model_name": g["model_name"].to_numpy(),
+            "side": side,
+            "confidence": g["confidence"].to_numpy(),
+            "entry_ts": ts[signal_idx],
+            "exit_ts": ts[exit_idx],
+            "entry_price": entry,
+            "exit_price": exit_price,
+            "tp": tp,
+            "sl": sl,
+            "outcome": outcome,
+            "bars_held": exit_idx - signal_idx,
+            "pnl_pct": pnl,
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def max_drawdown(pnl: np.ndarray) -> float:
+    """Drawdown lớn nhất của đường vốn cộng dồn (đơn vị: % vốn)."""
+    if len(pnl) == 0:
+        return 0.0
+    equity = np.cumsum(pnl)
+    peak = np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:]
+    return float((peak - equity).max())
+
+
+def summarize(trades: pd.DataFrame, by: str = "symbol") -> pd.DataFrame:
+    """PnL, win rate, drawdown và exposure theo nhóm (symbol hoặc model_name)."""
+    columns = [by, "trades", "win_rate", "total_pnl_pct", "avg_pnl_pct",
+               "max_drawdown_pct", "exposure", "tp_hits", "sl_hits", "timeouts"]
+    if trades.empty:
+        return pd.DataFrame(columns=columns)
+
+    rows = []
+    for key, g in trades.sort_values("exit_ts").groupby(by, sort=True):
+        pnl = g["pnl_pct"].to_numpy()
+        span = g["exit_ts"].max() - g["entry_ts"].min()
+        held = (g["exit_ts"] - g["entry_ts"]).sum()
+        rows.append({
+            by: key,
+            "trades": len(g),
+            "win_rate": round(float((pnl > 0).mean()), 4),
+            "total_pnl_pct": round(float(pnl.sum() * 100), 4),
+            "avg_pnl_pct": round(float(pnl.mean() * 100), 4),
+            "max_drawdown_pct": round(max_drawdown(pnl) * 100, 4),
+            # Tỉ lệ thời gian có vị thế mở (có thể > 1 nếu các lệnh chồng nhau)
+            "exposure": round(float(held / span), 4) if span > 0 else 0.0,
+            "tp_hits": int((g["outcome"] == OUTCOME_TP).sum()),
+            "sl_hits": int((g["outcome"] == OUTCOME_SL).sum()),
+            "timeouts": int((g["outcome"] == OUTCOME_TIMEOUT).sum()),
+        })
+    return pd.DataFrame(rows, columns=columns) \
+        .sort_values("total_pnl_pct", ascending=False) \
+        .reset_index(drop=True)
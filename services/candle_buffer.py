@@ -0,0 +1,175 @@
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import get_logger
+
+logger = get_logger("candle_buffer")
+
+CANDLE_COLUMNS = ["open", "high", "low", "close", "volume"]
+DEFAULT_CAPACITY = int(os.getenv("CANDLE_BUFFER_SIZE", 200))
+
+
+class CandleRing:
+    """Vòng đệm cố định `capacity` nến của 1 symbol: timestamp int64 + OHLCV float64, ghi đè nến cũ nhất."""
+
+    __slots__ = ("capacity", "_ts", "_values", "_head", "_size", "features", "features_ts")
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._ts = np.zeros(capacity, dtype=np.int64)
+        self._values = np.zeros((capacity, len(CANDLE_COLUMNS)), dtype=np.float64)
+        self._head = 0  # vị trí ghi kế tiếp
+        self._size = 0
+        self.features = None
+        self.features_ts = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def last_ts(self):
+        return int(self._ts[(self._head - 1) % self.capacity]) if self._size else None
+
+    def append(self, ts: int, values) -> bool:
+        """Thêm 1 nến. Trùng nến cuối → ghi đè; cũ hơn nến cuối → bỏ qua."""
+        last = self.last_ts
+        if last is not None and ts < last:
+            return False
+        if last is not None and ts == last:
+            self._values[(self._head - 1) % self.capacity] = values
+            return True
+        self._ts[self._head] = ts
+        self._values[self._head] = values
+        self._head = (self._head + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        return True
+
+    def _order(self, n=None):
+        n = self._size if n is None else min(n, self._size)
+        return (np.arange(self._head - n, self._head)) % self.capacity
+
+    def frame(self, n: int = None) -> pd.DataFrame:
+        idx = self._order(n)
+        df = pd.DataFrame(self._values[idx], columns=CANDLE_COLUMNS)
+        df.insert(0, "timestamp", self._ts[idx])
+        return df
+
+    def nbytes(self) -> int:
+        size = self._ts.nbytes + self._values.nbytes
+        if self.features is not None:
+            size += sys.getsizeof(self.features) + sum(sys.getsizeof(v) for v in self.features.values())
+        return size
+
+
+class CandleBufferStore:
+    """
+    Nến gần nhất + dòng feature mới nhất của từng symbol, giữ trong tiến trình server.
+    Job đồng bộ nến và job sinh feature ghi vào; dự đoán đọc ra không cần gọi Supabase.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._rings = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _ring(self, symbol: str) -> CandleRing:
+        ring = self._rings.get(symbol)
+        if ring is None:
+            ring = self._rings.setdefault(symbol, CandleRing(self.capacity))
+        return ring
+
+    # ===== Ghi =====
+    def add_candles(self, symbol: str, rows) -> int:
+        """rows: các bộ (timestamp, open, high, low, close, volume), thứ tự bất kỳ."""
+        rows = sorted(((int(r[0]), [float(x) for x in r[1:6]]) for r in rows), key=lambda r: r[0])
+        with self._lock:
+            ring = self._ring(symbol)
+            return sum(ring.append(ts, values) for ts, values in rows)
+
+    def set_features(self, symbol: str, record: dict):
+        with self._lock:
+            ring = self._ring(symbol)
+            ts = int(record["timestamp"])
+            if ring.features_ts is None or ts >= ring.features_ts:
+                ring.features, ring.features_ts = dict(record), ts
+
+    # ===== Đọc =====
+    def candles(self, symbol: str, n: int = None, min_rows: int = 1):
+        """DataFrame nến tăng dần theo thời gian, hoặc None nếu buffer chưa đủ `min_rows` nến."""
+        with self._lock:
+            ring = self._rings.get(symbol)
+            if ring is None or len(ring) < min_rows:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return ring.frame(n)
+
+    def latest_features(self, symbol: str):
+        with self._lock:
+            ring = self._rings.get(symbol)
+            if ring is None or ring.features is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(ring.features)
+
+    def symbols(self) -> list:
+        with self._lock:
+            return sorted(self._rings)
+
+    # ===== Khởi động lạnh: nạp lại từ DB =====
+    def rehydrate(self, supabase, symbols) -> dict:
+        loaded = {}
+        for symbol in symbols:
+            try:
+                res = supabase.table("ohlcv_data") \
+                    .select("timestamp, open, high, low, close, volume") \
+                    .eq("symbol", symbol) \
+                    .order("timestamp", desc=True) \
+                    .limit(self.capacity) \
+                    .execute()
+                rows = [(r["timestamp"], *(r[c] for c in CANDLE_COLUMNS)) for r in res.data or []]
+                loaded[symbol] = self.add_candles(symbol, rows)
+
+                latest = supabase.table("training_dataset") \
+                    .select("*") \
+                    .eq("symbol", symbol) \
+                    .order("timestamp", desc=True) \
+                    .limit(1) \
+                    .execute()
+                if latest.data:
+                    self.set_features(symbol, latest.data[0])
+            except Exception as e:
+                logger.warning(f"⚠️ Không nạp được buffer cho {symbol}: {e}")
+        logger.info(f"♻️ Đã nạp buffer cho {len(loaded)} symbol ({sum(loaded.values())} nến)")
+        return loaded
+
+    def memory(self) -> dict:
+        with self._lock:
+            per_symbol = {
+                symbol: {
+                    "candles": len(ring),
+                    "has_features": ring.features is not None,
+                    "last_ts": ring.last_ts,
+                    "bytes": ring.nbytes(),
+                }
+                for symbol, ring in sorted(self._rings.items())
+            }
+        return {
+            "capacity": self.capacity,
+            "symbols": len(per_symbol),
+            "total_bytes": sum(v["bytes"] for v in per_symbol.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "per_symbol": per_symbol,
+        }
+
+
+# Dùng chung trong tiến trình: job đồng bộ, job feature và endpoint dự đoán cùng đọc/ghi
+candle_buffers = CandleBufferStore()
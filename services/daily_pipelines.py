@@ -0,0 +1,162 @@
+import os
+import sys
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.pipeline import Pipeline, Stage, print_summary
+from services.profiling import profiled
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BYBIT_MODEL_PATH = os.path.join(ROOT_DIR, "model", "model_rf.pkl")
+
+_client = None
+
+
+def _supabase():
+    global _client
+    if _client is None:
+        from dotenv import load_dotenv
+        from services.db import get_client
+
+        load_dotenv()
+        _client = get_client()
+    return _client
+
+
+# ===== Fingerprint: truy vấn rẻ mô tả dữ liệu đầu vào của từng bước =====
+def _latest(table, column):
+    res = _supabase().table(table).select(column).order(column, desc=True).limit(1).execute()
+    return res.data[0][column] if res.data else None
+
+
+def _count(query):
+    return query.limit(1).execute().count
+
+
+def _table_fingerprint(table, column):
+    count = _count(_supabase().table(table).select(column, count="exact"))
+    return f"{table}:{count}:{_latest(table, column)}"
+
+
+def fp_insert_signals():
+    return "|".join([_table_fingerprint("vnindex_data", "date"), _table_fingerprint("vn30_data", "date")])
+
+
+def fp_label_signals():
+    # Tín hiệu đủ 3 ngày mới được gắn nhãn → phụ thuộc cả ngày hiện tại
+    unlabeled = _count(_supabase().table("ai_market_signals").select("id", count="exact").is_("label_win", None))
+    return f"unlabeled:{unlabeled}:{date.today().isoformat()}"
+
+
+def fp_evaluate_accuracy():
+    labeled = _count(_supabase().table("ai_market_signals").select("id", count="exact").not_.is_("label_win", None))
+    return f"labeled:{labeled}"
+
+
+def fp_generate_training():
+    return _table_fingerprint("ohlcv_data", "timestamp")
+
+
+def fp_train_model():
+    return _table_fingerprint("training_dataset", "timestamp")
+
+
+def fp_predict_signal():
+    mtime = os.path.getmtime(BYBIT_MODEL_PATH) if os.path.isfile(BYBIT_MODEL_PATH) else None
+    return f"model:{mtime}|{_table_fingerprint('training_dataset', 'timestamp')}"
+
+
+# ===== Các bước: import lười để module script chỉ nạp khi thật sự chạy =====
+def stage_insert_signals():
+    from scripts import insert_ai_signals
+    return insert_ai_signals.main()
+
+
+def stage_label_signals():
+    from scripts import label_ai_signals
+    return label_ai_signals.process_signals()
+
+
+def stage_evaluate_accuracy():
+    from scripts import evaluate_ai_accuracy
+    return evaluate_ai_accuracy.main()
+
+
+def stage_generate_training():
+    from scripts.bybit import generate_training_data
+    return generate_training_data.run()
+
+
+def stage_train_model():
+    from scripts.bybit import train_model
+    return train_model.run()
+
+
+def stage_predict_signal():
+    from scripts.bybit import predict_signal
+    return predict_signal.run()
+
+
+def stage_execute_signals():
+    from scripts.bybit import ai_execute_signals
+    return ai_execute_signals.execute_signals_batch()
+
+
+def vn_stages(prefix=""):
+    return [
+        Stage(f"{prefix}insert", stage_insert_signals, fingerprint=fp_insert_signals,
+              description="Tạo tín hiệu mới"),
+        Stage(f"{prefix}label", stage_label_signals, deps=[f"{prefix}insert"],
+              fingerprint=fp_label_signals, description="Gắn nhãn thắng/thua"),
+        Stage(f"{prefix}evaluate", stage_evaluate_accuracy, deps=[f"{prefix}label"],
+              fingerprint=fp_evaluate_accuracy, description="Đánh giá độ chính xác AI"),
+    ]
+
+
+def bybit_stages(prefix=""):
+    return [
+        Stage(f"{prefix}generate", stage_generate_training, fingerprint=fp_generate_training,
+              description="📊 Sinh dữ liệu training"),
+        Stage(f"{prefix}train", stage_train_model, deps=[f"{prefix}generate"],
+              fingerprint=fp_train_model, description="🤖 Huấn luyện mô hình"),
+        Stage(f"{prefix}predict", stage_predict_signal, deps=[f"{prefix}train"],
+              fingerprint=fp_predict_signal, description="🔮 Dự đoán tín hiệu"),
+        # Luôn chạy: phụ thuộc cửa sổ thời gian TIME_WINDOW_MINUTES
+        Stage(f"{prefix}execute", stage_execute_signals, deps=[f"{prefix}predict"],
+              description="💥 Ghi tín hiệu vào bảng"),
+    ]
+
+
+def build_vn_pipeline():
+    return Pipeline("vn_daily", vn_stages())
+
+
+def build_bybit_pipeline():
+    return Pipeline("bybit_daily", bybit_stages())
+
+
+def build_all_pipeline():
+    # Hai nhánh VN và Bybit độc lập → chạy song song
+    return Pipeline("all_daily", vn_stages("vn.") + bybit_stages("bybit."))
+
+
+PIPELINES = {
+    "vn": build_vn_pipeline,
+    "bybit": build_bybit_pipeline,
+    "all": build_all_pipeline,
+}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chạy pipeline AI hàng ngày")
+    parser.add_argument("pipeline", choices=list(PIPELINES))
+    parser.add_argument("--force", action="store_true", help="Chạy mọi bước kể cả khi input không đổi")
+    parser.add_argument("--trace-memory", action="store_true", help="Đo đỉnh bộ nhớ từng bước bằng tracemalloc")
+    args = parser.parse_args()
+
+    with profiled(f"pipeline.{args.pipeline}"):
+        summary = PIPELINES[args.pipeline]().run(force=args.force, trace_memory=args.trace_memory or None)
+    print_summary(summary)
+    sys.exit(0 if summary["success"] else 1)
@@ -0,0 +1,40 @@
+import os
+
+# SUPABASE_BACKEND=local → dùng file SQLite (services/local_db.py) thay cho Supabase, chạy offline
+BACKEND_ENV = "SUPABASE_BACKEND"
+LOCAL_DB_PATH_ENV = "LOCAL_DB_PATH"
+
+_local_clients = {}
+
+
+def backend() -> str:
+    return os.getenv(BACKEND_ENV, "supabase").lower()
+
+
+def is_local() -> bool:
+    return backend() == "local"
+
+
+def has_credentials() -> bool:
+    """Bản local không cần URL/key; Supabase thật cần đủ cả hai."""
+    return is_local() or bool(os.getenv("SUPABASE_URL") and os.getenv("SUPABASE_SERVICE_ROLE_KEY"))
+
+
+def get_client(url: str = None, key: str = None):
+    """Thay cho `create_client(url, key)` trong mọi script; mọi `.execute()` được đo vào /metrics."""
+    from services.metrics import InstrumentedClient
+
+    if is_local():
+        from services.local_db import LocalClient, DEFAULT_PATH
+
+        path = os.getenv(LOCAL_DB_PATH_ENV, DEFAULT_PATH)
+        # 1 kết nối cho mỗi file trong tiến trình → các module dùng chung dữ liệu vừa ghi
+        if path not in _local_clients:
+            _local_clients[path] = InstrumentedClient(LocalClient(path))
+        return _local_clients[path]
+
+    from supabase import create_client
+
+    return InstrumentedClient(
+        create_client(url or os.getenv("SUPABASE_URL"), key or os.getenv("SUPABASE_SERVICE_ROLE_KEY"))
+    )
@@ -0,0 +1,76 @@
+"""
+Chính sách dtype gọn cho feature khi nạp để train / chấm điểm (dữ liệu lưu trong DB vẫn giữ độ chính xác gốc):
+- float64 → float32; cờ 0/1 (volume_spike) → bool; số nguyên nhỏ (hour_of_day, day_of_week, cờ, nhãn) → int8
+- số nguyên khác → kiểu nguyên nhỏ nhất vừa giá trị (timestamp ms vẫn là int64); cột chuỗi giữ nguyên
+- cột còn NaN thì không ép sang bool / int (NaN cần cho dropna phía sau) → float32
+Model cây (RandomForest, XGBoost) vốn so sánh ngưỡng trên float32 nên kết quả không đổi; `check_parity` để xác nhận.
+DTYPE_POLICY=off để giữ nguyên dtype cũ.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import get_logger
+
+logger = get_logger("dtype_policy")
+
+DTYPE_POLICY = os.getenv("DTYPE_POLICY", "compact")  # compact | off
+DTYPE_PARITY_CHECK = os.getenv("DTYPE_PARITY_CHECK", "0") == "1"
+DTYPE_PARITY_ATOL = float(os.getenv("DTYPE_PARITY_ATOL", 1e-6))
+
+BOOL_COLUMNS = {"volume_spike"}
+INT8_COLUMNS = {"ema_cross", "rsi_reversal", "reversal_candle", "hour_of_day", "day_of_week", "signal"}
+INT8_PREFIXES = ("label_",)
+
+
+def _is_int8_column(name) -> bool:
+    return name in INT8_COLUMNS or str(name).startswith(INT8_PREFIXES)
+
+
+def compact_series(s: pd.Series) -> pd.Series:
+    dtype = s.dtype
+    if dtype == object or isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(dtype):
+        return s
+    has_nan = pd.api.types.is_float_dtype(dtype) and s.isna().any()
+
+    if s.name in BOOL_COLUMNS and not has_nan:
+        return s.astype(bool)
+    if _is_int8_column(s.name) and not has_nan and len(s) and s.min() >= -128 and s.max() <= 127:
+        return s.astype(np.int8)
+    if pd.api.types.is_bool_dtype(dtype):
+        return s
+    if pd.api.types.is_integer_dtype(dtype):
+        return pd.to_numeric(s, downcast="integer")
+    if pd.api.types.is_float_dtype(dtype) and dtype != np.float32:
+        return s.astype(np.float32)
+    return s
+
+
+def compact(df: pd.DataFrame, policy: str = None) -> pd.DataFrame:
+    """Bản DataFrame với dtype gọn theo chính sách; index / thứ tự cột giữ nguyên."""
+    if (policy or DTYPE_POLICY) == "off" or df.empty or not df.columns.is_unique:
+        return df
+    return pd.DataFrame({name: compact_series(df[name]) for name in df.columns}, index=df.index)
+
+
+def memory_mb(df: pd.DataFrame) -> float:
+    return round(df.memory_usage(deep=True).sum() / 1024 / 1024, 3)
+
+
+def compact_logged(df: pd.DataFrame, what: str) -> pd.DataFrame:
+    """compact() + 1 dòng log bộ nhớ trước / sau."""
+    before = memory_mb(df)
+    out = compact(df)
+    if out is not df:
+        logger.info(f"🗜️ {what}: {before} MB → {memory_mb(out)} MB", rows=len(df))
+    return out
+
+
+def check_parity(model, X_reference: pd.DataFrame, X_compact: pd.DataFrame, atol: float = DTYPE_PARITY_ATOL) -> float:
+    """Chênh lệch predict_proba lớn nhất giữa dữ liệu gốc và dữ liệu đã gọn; vượt atol thì cảnh báo."""
+    diff = float(np.max(np.abs(model.predict_proba(X_reference) - model.predict_proba(X_compact)))) \
+        if len(X_reference) else 0.0
+    if diff > atol:
+        logger.warning(f"⚠️ dtype gọn làm lệch xác suất tối đa {diff:.2e} (> {atol:.0e})", rows=len(X_reference))
+    return diff
@@ -0,0 +1,227 @@
+"""
+Feature store trên đĩa cho ma trận huấn luyện:
+- key = hash(tập symbol, khoảng thời gian + số dòng, phiên bản spec feature, hash mã nguồn hàm featurize)
+  → dữ liệu hoặc code đổi thì tự ra key mới, không cần xoá cache bằng tay
+- mỗi entry là 1 thư mục: mỗi cột 1 file .npy + manifest.json (tên cột, dtype, số dòng, dung lượng, lần dùng cuối)
+- nạp bằng np.load(mmap_mode="r") → không copy, chỉ đọc trang nào thật sự dùng
+- vượt FEATURE_STORE_MAX_MB thì xoá entry lâu không dùng nhất (LRU theo last_access trong manifest)
+"""
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import get_logger
+
+logger = get_logger("feature_store")
+
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", ".cache/feature_store")
+FEATURE_STORE_MAX_MB = float(os.getenv("FEATURE_STORE_MAX_MB", 2048))
+FEATURE_STORE_ENABLED = os.getenv("FEATURE_STORE_ENABLED", "1") == "1"
+
+MANIFEST = "manifest.json"
+INDEX_FILE = "__index__.npy"
+
+
+def code_hash(*fns) -> str:
+    """Hash mã nguồn các hàm (hoặc cả module) tạo feature: sửa code → key mới."""
+    h = hashlib.sha1()
+    for fn in fns:
+        try:
+            h.update(inspect.getsource(fn).encode("utf-8"))
+        except (OSError, TypeError):
+            h.update(f"{getattr(fn, '__module__', '')}.{getattr(fn, '__qualname__', fn)}".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def feature_key(symbols, date_range, spec_version, code: str) -> tuple:
+    """(key, params): params lưu vào manifest để biết entry được tạo từ đâu."""
+    params = {
+        "symbols": sorted(symbols) if symbols else None,  # None = mọi symbol
+        "date_range": list(date_range) if date_range else None,
+        "spec_version": spec_version,
+        "code_hash": code,
+    }
+    key = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:24]
+    return key, params
+
+
+class FeatureStore:
+    def __init__(self, root: str = FEATURE_STORE_DIR, max_mb: float = FEATURE_STORE_MAX_MB):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    @staticmethod
+    def _read_manifest(path: str):
+        try:
+            with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_manifest(path: str, manifest: dict):
+        tmp = os.path.join(path, MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(path, MANIFEST))
+
+    # ===== Đọc =====
+    def get(self, key: str):
+        """DataFrame có các cột trỏ thẳng vào file mmap (chỉ đọc), hoặc None nếu chưa có."""
+        path = self._dir(key)
+        manifest = self._read_manifest(path)
+        if manifest is None:
+            self.stats["misses"] += 1
+            return None
+
+        try:
+            columns = {c["name"]: np.load(os.path.join(path, c["file"]), mmap_mode="r") for c in manifest["columns"]}
+            index = np.load(os.path.join(path, INDEX_FILE), mmap_mode="r") if manifest.get("has_index") else None
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Entry {key} hỏng, bỏ qua: {e}")
+            self.stats["misses"] += 1
+            return None
+
+        # copy=False: pandas giữ mỗi cột là 1 block riêng trỏ vào mmap thay vì gộp (copy) thành ma trận 2D
+        frame = pd.DataFrame(columns, index=pd.Index(index, name=manifest.get("index_name")) if index is not None else None,
+                             copy=False)
+        with self._lock:
+            manifest["last_access"] = time.time()
+            self._write_manifest(path, manifest)
+        self.stats["hits"] += 1
+        logger.info(f"📦 Feature store hit {key}: {manifest['rows']} dòng × {len(columns)} cột", key=key)
+        return frame
+
+    def manifest(self, key: str):
+        return self._read_manifest(self._dir(key))
+
+    # ===== Ghi =====
+    def put(self, key: str, frame: pd.DataFrame, params: dict = None) -> dict:
+        """Ghi frame (chỉ cột số / bool) vào thư mục tạm rồi rename → không bao giờ thấy entry ghi dở."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._dir(f".tmp-{key}-{os.getpid()}-{threading.get_ident()}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        columns, total = [], 0
+        for i, name in enumerate(frame.columns):
+            values = frame[name].to_numpy()
+            if values.dtype == object:
+                raise TypeError(f"Cột {name} kiểu object, feature store chỉ nhận cột số / bool")
+            file = f"c{i:04d}.npy"
+            np.save(os.path.join(tmp, file), np.ascontiguousarray(values))
+            size = os.path.getsize(os.path.join(tmp, file))
+            columns.append({"name": str(name), "dtype": str(values.dtype), "file": file, "bytes": size})
+            total += size
+
+        has_index = not isinstance(frame.index, pd.RangeIndex)
+        if has_index:
+            np.save(os.path.join(tmp, INDEX_FILE), frame.index.to_numpy())
+            total += os.path.getsize(os.path.join(tmp, INDEX_FILE))
+
+        now = time.time()
+        manifest = {
+            "key": key,
+            "params": params or {},
+            "rows": len(frame),
+            "columns": columns,
+            "has_index": has_index,
+            "index_name": frame.index.name,
+            "bytes": total,
+            "created_at": now,
+            "last_access": now,
+        }
+        self._write_manifest(tmp, manifest)
+
+        final = self._dir(key)
+        with self._lock:
+            shutil.rmtree(final, ignore_errors=True)
+            os.replace(tmp, final)
+        self.stats["writes"] += 1
+        logger.info(f"💾 Feature store lưu {key}: {len(frame)} dòng, {total / 1024 / 1024:.1f} MB", key=key)
+        self.evict(keep=key)
+        return manifest
+
+    # ===== Dọn theo dung lượng =====
+    def entries(self) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for name in os.listdir(self.root):
+            if name.startswith(".tmp-"):
+                continue
+            manifest = self._read_manifest(self._dir(name))
+            if manifest is not None:
+                found.append(manifest)
+        return found
+
+    def evict(self, keep: str = None) -> list:
+        """Xoá entry có last_access cũ nhất cho tới khi tổng dung lượng <= ngân sách."""
+        with self._lock:
+            entries = sorted(self.entries(), key=lambda m: m.get("last_access", 0))
+            total = sum(m["bytes"] for m in entries)
+            removed = []
+            for m in entries:
+                if total <= self.max_bytes:
+                    break
+                if m["key"] == keep:
+                    continue
+                # File đang được mmap vẫn đọc được sau khi xoá (POSIX) → an toàn với lần train đang chạy
+                shutil.rmtree(self._dir(m["key"]), ignore_errors=True)
+                total -= m["bytes"]
+                removed.append(m["key"])
+            self.stats["evictions"] += len(removed)
+        if removed:
+            logger.info(f"🧹 Feature store xoá {len(removed)} entry cũ (LRU)", removed=removed)
+        return removed
+
+    def usage(self) -> dict:
+        entries = self.entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(m["bytes"] for m in entries),
+            "max_bytes": self.max_bytes,
+            **self.stats,
+        }
+
+
+def get_or_compute(store, key: str, params: dict, compute):
+    """Có trong store → trả về bản mmap; chưa có → compute() rồi lưu lại (store=None: luôn compute)."""
+    if store is not None:
+        frame = store.get(key)
+        if frame is not None:
+            return frame
+    frame = compute()
+    if store is not None and not frame.empty:
+        try:
+            store.put(key, frame, params)
+        except Exception as e:
+            logger.warning(f"⚠️ Không lưu được feature store {key}: {e}")
+    return frame
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Xem / dọn feature store")
+    parser.add_argument("command", choices=["usage", "evict"])
+    args = parser.parse_args()
+
+    store = FeatureStore()
+    if args.command == "evict":
+        store.evict()
+    print(json.dumps(store.usage(), indent=2))
+    for m in sorted(store.entries(), key=lambda m: -m.get("last_access", 0)):
+        print(f" - {m['key']} | {m['rows']} dòng × {len(m['columns'])} cột | {m['bytes'] / 1024 / 1024:.1f} MB | {m['params']}")
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# Tên bộ nhãn → (số nến nhìn trước, ngưỡng lợi suất)
+# "h3_t20" = close.shift(-3) so với ±0.2% → chính là target hiện tại của generate_features
+LABEL_SETS = {
+    "h1_t10": (1, 0.001),
+    "h3_t20": (3, 0.002),
+    "h3_t30": (3, 0.003),
+    "h6_t30": (6, 0.003),
+    "h12_t50": (12, 0.005),
+    "h24_t80": (24, 0.008),
+}
+DEFAULT_LABEL_SET = "h3_t20"
+
+# Giá trị int8 cho các dòng chưa đủ nến tương lai để gán nhãn
+LABEL_UNKNOWN = -128
+LABEL_PREFIX = "label_"
+
+
+def label_column(name: str) -> str:
+    return f"{LABEL_PREFIX}{name}"
+
+
+def label_columns(df: pd.DataFrame) -> list:
+    return [c for c in df.columns if c.startswith(LABEL_PREFIX)]
+
+
+def forward_returns(close, horizons) -> np.ndarray:
+    """Ma trận lợi suất tương lai (n_dòng × n_horizon); NaN khi vượt quá dữ liệu."""
+    close = np.asarray(close, dtype=np.float64)
+    horizons = np.asarray(horizons, dtype=np.int64)
+    n = len(close)
+
+    idx = np.arange(n)[:, None] + horizons[None, :]
+    valid = idx < n
+    future = close[np.minimum(idx, max(n - 1, 0))]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fwd = future / close[:, None] - 1.0
+    fwd[~valid] = np.nan
+    return fwd
+
+
+def build_labels(close, label_sets: dict = None) -> pd.DataFrame:
+    """
+    Tính toàn bộ nhãn buy(1)/sell(-1)/hold(0) cho nhiều horizon + ngưỡng trong 1 lượt vector hoá.
+    Trả về DataFrame các cột int8 `label_<tên>`; dòng chưa đủ dữ liệu = LABEL_UNKNOWN.
+    """
+    label_sets = label_sets or LABEL_SETS
+    names = list(label_sets.keys())
+    horizons = sorted({h for h, _ in label_sets.values()})
+    h_pos = {h: i for i, h in enumerate(horizons)}
+
+    fwd = forward_returns(close, horizons)
+    cols = np.array([h_pos[label_sets[n][0]] for n in names], dtype=np.int64)
+    thr = np.array([label_sets[n][1] for n in names], dtype=np.float64)
+
+    r = fwd[:, cols]
+    labels = np.where(r > thr, 1, np.where(r < -thr, -1, 0)).astype(np.int8)
+    labels[np.isnan(r)] = LABEL_UNKNOWN
+
+    index = close.index if isinstance(close, pd.Series) else None
+    return pd.DataFrame(labels, columns=[label_column(n) for n in names], index=index)
+
+
+def select_label(df: pd.DataFrame, name: str) -> pd.Series:
+    """Lấy cột nhãn theo tên bộ nhãn, bỏ các dòng chưa có nhãn."""
+    col = label_column(name)
+    if col not in df.columns:
+        raise KeyError(f"⚠️ Không có bộ nhãn '{name}' (cột {col}) trong dữ liệu.")
+    y = pd.to_numeric(df[col], errors="coerce").fillna(LABEL_UNKNOWN).astype(np.int8)
+    return y[y != LABEL_UNKNOWN]
@@ -0,0 +1,369 @@
+"""
+Bản thay thế Supabase chạy offline: hiện thực phần PostgREST mà các script đang dùng
+(select/eq/neq/gt/gte/lt/lte/in_/is_/not_/order/limit/range/insert/upsert/update/delete)
+trên 1 file SQLite. Bảng và cột được tạo tự động khi ghi lần đầu → không cần migration.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+DEFAULT_PATH = os.path.join(".cache", "local_supabase.db")
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _to_sql(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if hasattr(value, "item"):  # numpy scalar
+        return value.item()
+    return value
+
+
+class APIResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+    def __repr__(self):
+        return f"APIResponse(data={len(self.data) if isinstance(self.data, list) else self.data!r}, count={self.count})"
+
+
+class LocalClient:
+    """Tương đương `create_client(...)`: `client.table(name)` trả về query builder."""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.RLock()
+        self._columns = {}
+
+    def table(self, name: str):
+        return LocalQuery(self, name)
+
+    # ===== Schema động =====
+    def columns(self, table: str) -> list:
+        cols = self._columns.get(table)
+        if cols is None:
+            rows = self._conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+            cols = [r["name"] for r in rows]
+            if cols:
+                self._columns[table] = cols
+        return cols
+
+    def ensure_table(self, table: str, columns, first_id=None):
+        with self._lock:
+            existing = self.columns(table)
+            if not existing:
+                # Dòng đầu tự mang id không phải số (vd uuid của trading_logs) → cột id không ép kiểu;
+                # còn lại id tự tăng như bigserial của Supabase. Bên trong luôn định danh dòng bằng rowid.
+                id_column = "id PRIMARY KEY" if first_id is not None and not isinstance(first_id, int) \
+                    else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+                self._conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table)} ({id_column})")
+                self._columns.pop(table, None)
+                existing = self.columns(table)
+            for col in columns:
+                if col not in existing:
+                    try:
+                        self._conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(col)}")
+                    except sqlite3.OperationalError as e:
+                        # Tiến trình khác vừa thêm cột này
+                        if "duplicate column" not in str(e):
+                            raise
+                    existing.append(col)
+
+    def create_index(self, table: str, *columns, unique: bool = False):
+        self.ensure_table(table, columns)
+        name = f"idx_{table}_{'_'.join(columns)}"
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        with self._lock:
+            self._conn.execute(
+                f"CREATE {kind} IF NOT EXISTS {_quote(name)} ON {_quote(table)} "
+                f"({', '.join(_quote(c) for c in columns)})"
+            )
+
+    def execute(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def executemany(self, sql: str, rows):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(sql, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+class _Not:
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, op):
+        method = getattr(self._query, op)
+
+        def negated(*args, **kwargs):
+            self._query._negate_next = True
+            return method(*args, **kwargs)
+
+        return negated
+
+
+class LocalQuery:
+    _OPS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+    def __init__(self, client: LocalClient, table: str):
+        self.client = client
+        self.table_name = table
+        self._action = "select"
+        self._columns = "*"
+        self._count = None
+        self._payload = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+        self._filters = []  # (cột, sql, params)
+        self._orders = []
+        self._limit = None
+        self._offset = None
+        self._single = None
+        self._negate_next = False
+
+    # ===== Hành động =====
+    def select(self, columns: str = "*", count: str = None):
+        self._action, self._columns, self._count = "select", columns, count
+        return self
+
+    def insert(self, rows, **kwargs):
+        self._action, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id", ignore_duplicates: bool = False, **kwargs):
+        self._action, self._payload = "upsert", rows
+        self._on_conflict = [c.strip() for c in (on_conflict or "id").split(",")]
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: dict, **kwargs):
+        self._action, self._payload = "update", values
+        return self
+
+    def delete(self, **kwargs):
+        self._action = "delete"
+        return self
+
+    # ===== Bộ lọc =====
+    @property
+    def not_(self):
+        return _Not(self)
+
+    def _add(self, column, sql, params=()):
+        negate, self._negate_next = self._negate_next, False
+        self._filters.append((column, f"NOT ({sql})" if negate else sql, list(params)))
+        return self
+
+    def _cmp(self, op, column, value):
+        return self._add(column, f"{_quote(column)} {self._OPS[op]} ?", [_to_sql(value)])
+
+    def eq(self, column, value):
+        return self._cmp("eq", column, value)
+
+    def neq(self, column, value):
+        return self._cmp("neq", column, value)
+
+    def gt(self, column, value):
+        return self._cmp("gt", column, value)
+
+    def gte(self, column, value):
+        return self._cmp("gte", column, value)
+
+    def lt(self, column, value):
+        return self._cmp("lt", column, value)
+
+    def lte(self, column, value):
+        return self._cmp("lte", column, value)
+
+    def in_(self, column, values):
+        values = [_to_sql(v) for v in values]
+        if not values:
+            return self._add(column, "0")
+        return self._add(column, f"{_quote(column)} IN ({', '.join('?' * len(values))})", values)
+
+    def is_(self, column, value):
+        if value is None or str(value).lower() == "null":
+            return self._add(column, f"{_quote(column)} IS NULL")
+        return self._add(column, f"{_quote(column)} IS ?", [_to_sql(str(value).lower() == "true")])
+
+    def like(self, column, pattern):
+        return self._add(column, f"{_quote(column)} LIKE ?", [pattern])
+
+    def ilike(self, column, pattern):
+        return self._add(column, f"LOWER({_quote(column)}) LIKE LOWER(?)", [pattern])
+
+    def filter(self, column, operator, value):
+        if operator in self._OPS:
+            return self._cmp(operator, column, value)
+        if operator == "is":
+            return self.is_(column, value)
+        if operator == "in":
+            return self.in_(column, [v.strip() for v in str(value).strip("()").split(",")])
+        raise ValueError(f"Toán tử chưa hỗ trợ: {operator}")
+
+    # ===== Sắp xếp / phân trang =====
+    def order(self, column, desc: bool = False, **kwargs):
+        self._orders.append((column, desc))
+        return self
+
+    def limit(self, size: int, **kwargs):
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def single(self):
+        self._single, self._limit = "single", 1
+        return self
+
+    def maybe_single(self):
+        self._single, self._limit = "maybe", 1
+        return self
+
+    # ===== Thực thi =====
+    def _where(self):
+        if not self._filters:
+            return "", []
+        params = [p for _, _, ps in self._filters for p in ps]
+        return " WHERE " + " AND ".join(sql for _, sql, _ in self._filters), params
+
+    def _referenced(self):
+        cols = [c for c, _, _ in self._filters] + [c for c, _ in self._orders]
+        if self._columns.strip() != "*":
+            cols += [c.strip() for c in self._columns.split(",")]
+        return cols
+
+    def execute(self) -> APIResponse:
+        client, table = self.client, self.table_name
+        if self._action in ("insert", "upsert"):
+            return self._write()
+
+        if not client.columns(table):
+            return APIResponse(None if self._single == "maybe" else [], 0 if self._count else None)
+        client.ensure_table(table, self._referenced())
+        where, params = self._where()
+
+        if self._action == "update":
+            values = {k: _to_sql(v) for k, v in self._payload.items()}
+            client.ensure_table(table, values)
+            found = client.execute(f"SELECT rowid AS _rowid FROM {_quote(table)}{where}", params)
+            ids = [r["_rowid"] for r in found]
+            if ids:
+                sets = ", ".join(f"{_quote(k)} = ?" for k in values)
+                client.execute(
+                    f"UPDATE {_quote(table)} SET {sets} WHERE rowid IN ({', '.join('?' * len(ids))})",
+                    list(values.values()) + ids,
+                )
+            return APIResponse(self._fetch_ids(ids))
+
+        if self._action == "delete":
+            rows = [dict(r) for r in client.execute(f"SELECT * FROM {_quote(table)}{where}", params)]
+            client.execute(f"DELETE FROM {_quote(table)}{where}", params)
+            return APIResponse(rows)
+
+        cols = "*" if self._columns.strip() == "*" else ", ".join(
+            _quote(c.strip()) for c in self._columns.split(",")
+        )
+        sql = f"SELECT {cols} FROM {_quote(table)}{where}"
+        if self._orders:
+            sql += " ORDER BY " + ", ".join(
+                f"{_quote(c)} IS NULL, {_quote(c)} {'DESC' if d else 'ASC'}" for c, d in self._orders
+            )
+        if self._limit is not None:
+            sql += f" LIMIT {int(self._limit)}"
+            if self._offset:
+                sql += f" OFFSET {int(self._offset)}"
+        data = [dict(r) for r in client.execute(sql, params)]
+
+        count = None
+        if self._count:
+            count = client.execute(f"SELECT COUNT(*) AS n FROM {_quote(table)}{where}", params)[0]["n"]
+        if self._single:
+            if not data and self._single == "single":
+                raise Exception(f"Không có dòng nào trong {table}")
+            return APIResponse(data[0] if data else None, count)
+        return APIResponse(data, count)
+
+    def _fetch_ids(self, ids):
+        if not ids:
+            return []
+        rows = self.client.execute(
+            f"SELECT * FROM {_quote(self.table_name)} WHERE rowid IN ({', '.join('?' * len(ids))})", ids
+        )
+        return [dict(r) for r in rows]
+
+    def _write(self) -> APIResponse:
+        client, table = self.client, self.table_name
+        rows = self._payload if isinstance(self._payload, list) else [self._payload]
+        rows = [{k: _to_sql(v) for k, v in row.items()} for row in rows]
+        if not rows:
+            return APIResponse([])
+        client.ensure_table(table, {k for row in rows for k in row}, first_id=rows[0].get("id"))
+
+        with client._lock:
+            client._conn.execute("BEGIN")
+            try:
+                ids = self._write_rows(rows)
+                client._conn.execute("COMMIT")
+            except Exception:
+                client._conn.execute("ROLLBACK")
+                raise
+        return APIResponse(self._fetch_ids(ids))
+
+    def _write_rows(self, rows) -> list:
+        client, table = self.client, self.table_name
+        ids = []
+        for row in rows:
+            existing = None
+            if self._action == "upsert":
+                conflict = self._on_conflict
+                if all(c in row for c in conflict):
+                    found = client.execute(
+                        f"SELECT rowid AS _rowid FROM {_quote(table)} WHERE "
+                        + " AND ".join(f"{_quote(c)} IS ?" for c in conflict),
+                        [row[c] for c in conflict],
+                    )
+                    existing = found[0]["_rowid"] if found else None
+
+            if existing is not None:
+                if self._ignore_duplicates:
+                    continue
+                values = {k: v for k, v in row.items() if k != "id"}
+                if values:
+                    client.execute(
+                        f"UPDATE {_quote(table)} SET {', '.join(f'{_quote(k)} = ?' for k in values)} WHERE rowid = ?",
+                        list(values.values()) + [existing],
+                    )
+                ids.append(existing)
+                continue
+
+            cols = list(row)
+            cur = client._conn.execute(
+                f"INSERT INTO {_quote(table)} ({', '.join(_quote(c) for c in cols)}) "
+                f"VALUES ({', '.join('?' * len(cols))})",
+                [row[c] for c in cols],
+            )
+            ids.append(cur.lastrowid)
+        return ids
@@ -0,0 +1,254 @@
+"""
+Metrics kiểu Prometheus, chi phí thấp cho hot path:
+- mỗi thread ghi vào shard riêng (threading.local) → không lock khi inc/observe
+- chỉ lúc đọc /metrics mới gộp các shard; shard của thread đã kết thúc được gộp vào 1 shard "retired"
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket mặc định (giây) cho latency HTTP / DB / model
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Bucket cho job dài (pipeline, scheduler)
+JOB_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+# Giữ tối đa bấy nhiêu shard trước khi dọn shard của thread đã chết (Flask tạo thread mỗi request)
+MAX_SHARDS = 64
+
+
+def _key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def batch_size_bucket(n: int) -> str:
+    """Gom kích thước batch thành vài nhóm để không bùng nổ số label."""
+    if n <= 1:
+        return "1"
+    for upper in (10, 100, 1000):
+        if n <= upper:
+            return f"<={upper}"
+    return ">1000"
+
+
+class _Shard:
+    __slots__ = ("counters", "histograms", "thread")
+
+    def __init__(self, thread=None):
+        self.counters = {}
+        self.histograms = {}
+        self.thread = thread
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()  # chỉ dùng khi tạo/gộp shard và đọc
+        self._meta = {}  # tên → (loại, mô tả, buckets)
+        self._gauges = {}
+
+    # ===== Khai báo =====
+    def counter(self, name: str, help_text: str):
+        self._meta[name] = ("counter", help_text, None)
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ("histogram", help_text, tuple(buckets))
+
+    def gauge(self, name: str, help_text: str):
+        self._meta[name] = ("gauge", help_text, None)
+
+    # ===== Ghi (không lock) =====
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard(threading.current_thread())
+            with self._lock:
+                if len(self._shards) >= MAX_SHARDS:
+                    self._retire_dead()
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def inc(self, name: str, labels: dict = None, value: float = 1):
+        counters = self._shard().counters
+        key = (name, _key(labels))
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict = None):
+        buckets = self._meta[name][2]
+        histograms = self._shard().histograms
+        key = (name, _key(labels))
+        h = histograms.get(key)
+        if h is None:
+            # [đếm theo từng bucket..., +Inf, tổng, số lần]
+            h = histograms[key] = [0] * (len(buckets) + 3)
+        h[bisect.bisect_left(buckets, value)] += 1
+        h[-2] += value
+        h[-1] += 1
+
+    def set_gauge(self, name: str, value: float, labels: dict = None):
+        self._gauges[(name, _key(labels))] = value
+
+    def set_info(self, name: str, labels: dict, owner: str = "model"):
+        """Gauge kiểu *_info: xoá series cũ cùng `owner` (VD: phiên bản model trước) rồi đặt = 1."""
+        with self._lock:
+            for key in [k for k in self._gauges if k[0] == name and (owner, labels.get(owner)) in k[1]]:
+                del self._gauges[key]
+            self._gauges[(name, _key(labels))] = 1
+
+    @contextmanager
+    def timer(self, name: str, labels: dict = None, counter: str = None):
+        """Đo thời gian khối lệnh; nếu có `counter` thì đếm kèm status ok/error."""
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, labels)
+            if counter:
+                self.inc(counter, {**(labels or {}), "status": status})
+
+    # ===== Đọc =====
+    def _retire_dead(self):
+        alive = []
+        for shard in self._shards:
+            if shard.thread is not None and not shard.thread.is_alive():
+                self._merge(self._retired, shard)
+            else:
+                alive.append(shard)
+        self._shards = alive
+
+    @staticmethod
+    def _merge(target: _Shard, shard: _Shard):
+        for key, value in dict(shard.counters).items():
+            target.counters[key] = target.counters.get(key, 0) + value
+        for key, h in dict(shard.histograms).items():
+            t = target.histograms.get(key)
+            if t is None:
+                target.histograms[key] = list(h)
+            else:
+                for i, v in enumerate(h):
+                    t[i] += v
+
+    def collect(self) -> _Shard:
+        total = _Shard()
+        with self._lock:
+            self._retire_dead()
+            self._merge(total, self._retired)
+            for shard in self._shards:
+                self._merge(total, shard)
+        return total
+
+    def render(self) -> str:
+        """Định dạng text exposition của Prometheus (version 0.0.4)."""
+        total = self.collect()
+        by_name = {}
+        for (name, labels), value in total.counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for (name, labels), h in total.histograms.items():
+            by_name.setdefault(name, []).append((labels, h))
+        for (name, labels), value in dict(self._gauges).items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text, buckets = self._meta.get(name, ("untyped", "", None))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(by_name[name], key=lambda x: x[0]):
+                if kind == "histogram":
+                    cumulative = 0
+                    for upper, count in zip(list(buckets) + ["+Inf"], value[:-2]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_fmt(labels + (('le', _num(upper)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_fmt(labels)} {_num(value[-2])}")
+                    lines.append(f"{name}_count{_fmt(labels)} {value[-1]}")
+                else:
+                    lines.append(f"{name}{_fmt(labels)} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _num(value) -> str:
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _fmt(labels) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+# ===== Registry dùng chung trong tiến trình =====
+metrics = MetricsRegistry()
+
+metrics.counter("http_requests_total", "Số request HTTP theo route, method, status")
+metrics.histogram("http_request_duration_seconds", "Thời gian xử lý request HTTP")
+metrics.histogram("model_inference_seconds", "Thời gian predict của model theo kích thước batch")
+metrics.counter("model_inference_rows_total", "Số dòng đã chấm điểm")
+metrics.gauge("model_info", "Phiên bản model đang nạp (giá trị luôn là 1)")
+metrics.counter("supabase_requests_total", "Số lần gọi Supabase theo bảng, thao tác, status")
+metrics.histogram("supabase_request_duration_seconds", "Thời gian gọi Supabase")
+metrics.counter("bybit_requests_total", "Số lần gọi API Bybit theo endpoint, status")
+metrics.histogram("bybit_request_duration_seconds", "Thời gian gọi API Bybit")
+metrics.counter("pipeline_stage_runs_total", "Số lần chạy bước pipeline theo status")
+metrics.histogram("pipeline_stage_duration_seconds", "Thời gian chạy bước pipeline", JOB_BUCKETS)
+metrics.counter("scheduler_job_runs_total", "Số lần chạy job của scheduler theo status")
+metrics.histogram("scheduler_job_duration_seconds", "Thời gian chạy job của scheduler", JOB_BUCKETS)
+metrics.gauge("streams_open", "Số stream tiến độ pipeline (SSE/NDJSON) đang mở")
+metrics.counter("stream_log_lines_dropped_total", "Số dòng log bị bỏ vì client stream đọc chậm")
+
+
+# ===== Bọc client Supabase để đo mọi lần .execute() =====
+_ACTIONS = ("select", "insert", "upsert", "update", "delete")
+
+
+class InstrumentedQuery:
+    __slots__ = ("_query", "_table", "_op")
+
+    def __init__(self, query, table, op="select"):
+        self._query = query
+        self._table = table
+        self._op = op
+
+    def __getattr__(self, attr):
+        target = getattr(self._query, attr)
+        if attr == "not_":
+            return InstrumentedQuery(target, self._table, self._op)
+        if not callable(target):
+            return target
+
+        def call(*args, **kwargs):
+            result = target(*args, **kwargs)
+            op = attr if attr in _ACTIONS else self._op
+            if hasattr(result, "execute"):
+                return InstrumentedQuery(result, self._table, op)
+            return result
+
+        return call
+
+    def execute(self):
+        labels = {"table": self._table, "op": self._op}
+        with metrics.timer("supabase_request_duration_seconds", labels, counter="supabase_requests_total"):
+            return self._query.execute()
+
+
+class InstrumentedClient:
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str):
+        return InstrumentedQuery(self._client.table(name), name)
+
+    def __getattr__(self, attr):
+        return getattr(self._client, attr)
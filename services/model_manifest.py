@@ -0,0 +1,46 @@
+"""
+Manifest đi kèm file model (model/model_rf.pkl → model/model_rf.json):
+danh sách feature đã chọn (đúng thứ tự lúc train), kết quả chọn feature, độ chính xác, kích thước / độ trễ.
+Inference đọc danh sách feature từ đây để chỉ lấy đúng các cột cần.
+"""
+import json
+import os
+import time
+
+from utils.logger import get_logger
+
+logger = get_logger("model_manifest")
+
+
+def manifest_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + ".json"
+
+
+def save_manifest(model_path: str, manifest: dict) -> str:
+    path = manifest_path(model_path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**manifest, "model_path": model_path, "saved_at": time.time()}, f,
+                  ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp, path)
+    return path
+
+
+def load_manifest(model_path: str):
+    try:
+        with open(manifest_path(model_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def model_features(model, manifest: dict = None) -> list:
+    """Feature theo manifest; manifest cũ không khớp model đang nạp → tin model (feature_names_in_)."""
+    trained = list(getattr(model, "feature_names_in_", []))
+    features = (manifest or {}).get("features")
+    if features and trained and features != trained:
+        logger.warning("⚠️ Manifest không khớp feature của model, dùng feature_names_in_", manifest=len(features),
+                       model=len(trained))
+        return trained
+    return features or trained
@@ -1,10 +1,70 @@
 import numpy as np
 import pandas as pd
 
-def optimize_portfolio(data=None):
+METHODS = ("proportional", "mean_variance", "risk_parity", "max_sharpe")
+
+def project_to_simplex(v: np.ndarray) -> np.ndarray:
+    """Chiếu vector lên tập {w >= 0, Σw = 1} (Duchi et al. 2008)."""
+    u = np.sort(v)[::-1]
+    css = np.cumsum(u) - 1
+    rho = np.nonzero(u - css / (np.arange(len(v)) + 1) > 0)[0][-1]
+    theta = css[rho] / (rho + 1)
+    return np.maximum(v - theta, 0)
+
+def mean_variance_weights(mu: np.ndarray, cov: np.ndarray, risk_aversion: float = 5.0,
+                          iterations: int = 500) -> np.ndarray:
+    """max μᵀw − (λ/2)·wᵀΣw, chỉ mua (w >= 0, Σw = 1), giải bằng projected gradient."""
+    n = len(mu)
+    w = np.full(n, 1.0 / n)
+    lipschitz = risk_aversion * float(np.linalg.eigvalsh(cov).max())
+    step = 1.0 / lipschitz if lipschitz > 0 else 1.0
+    for _ in range(iterations):
+        w_next = project_to_simplex(w + step * (mu - risk_aversion * cov @ w))
+        if np.abs(w_next - w).max() < 1e-10:
+            w = w_next
+            break
+        w = w_next
+    return w
+
+def risk_parity_weights(cov: np.ndarray, iterations: int = 500, tol: float = 1e-10) -> np.ndarray:
+    """Mỗi mã đóng góp rủi ro bằng nhau: w_i·(Σw)_i như nhau."""
+    vol = np.sqrt(np.clip(np.diag(cov), 1e-18, None))
+    w = (1 / vol) / (1 / vol).sum()
+    for _ in range(iterations):
+        rc = w * (cov @ w)
+        if rc.max() - rc.min() < tol:
+            break
+        w = w * np.sqrt(rc.mean() / np.clip(rc, 1e-18, None))
+        w /= w.sum()
+    return w
+
+def max_sharpe_weights(mu: np.ndarray, cov: np.ndarray) -> np.ndarray:
+    """Danh mục tiếp tuyến w ∝ Σ⁻¹μ, bỏ vị thế âm (không bán khống)."""
+    raw = np.linalg.solve(cov + 1e-12 * np.eye(len(mu)), mu)
+    raw = np.clip(raw, 0, None)
+    if raw.sum() <= 0:
+        return np.full(len(mu), 1.0 / len(mu))
+    return raw / raw.sum()
+
+def compute_weights(mu, cov=None, method: str = "proportional") -> np.ndarray:
+    mu = np.asarray(mu, dtype=np.float64)
+    if method == "proportional" or cov is None:
+        return mu / np.sum(mu)
+
+    cov = np.asarray(cov, dtype=np.float64)
+    if method == "mean_variance":
+        return mean_variance_weights(mu, cov)
+    if method == "risk_parity":
+        return risk_parity_weights(cov)
+    if method == "max_sharpe":
+        return max_sharpe_weights(mu, cov)
+    raise ValueError(f"Phương pháp không hỗ trợ: {method} (chọn 1 trong {', '.join(METHODS)})")
+
+def optimize_portfolio(data=None, method: str = "proportional", cov: pd.DataFrame = None):
     """
     Hàm tối ưu hóa danh mục đầu tư dựa trên dữ liệu lợi suất.
     Nếu không có `data`, sẽ random giả định.
+    `method` khác "proportional" cần `cov` (DataFrame covariance theo symbol).
     """
 
     try:
@@ -17,8 +77,10 @@ def optimize_portfolio(data=None):
             symbols = list(data.keys())
             returns = np.array(list(data.values()))
 
+        cov_matrix = cov.loc[symbols, symbols].to_numpy() if cov is not None else None
+
         # Normalize thành trọng số
-        weights = returns / np.sum(returns)
+        weights = compute_weights(returns, cov_matrix, method)
 
         result = [
             {"symbol": symbol, "weight": round(float(weight), 4)}
@@ -27,6 +89,7 @@ def optimize_portfolio(data=None):
 
         return {
             "status": "success",
+            "method": method,
             "portfolio": result
         }
 
@@ -0,0 +1,304 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from services import profiling
+from services.metrics import metrics
+from utils.logger import get_logger, log_context, capture
+
+PIPELINE_STATE_PATH = os.getenv("PIPELINE_STATE_PATH", ".cache/pipeline_state.json")
+# keep_stdout=False (stream log qua on_event): mỗi bước chỉ giữ bấy nhiêu đoạn log cuối trong summary
+STDOUT_TAIL_CHUNKS = 200
+# tracemalloc làm chậm mọi phép cấp phát của cả tiến trình (kể cả /predict chạy song song) → mặc định tắt
+PIPELINE_TRACE_MEMORY = os.getenv("PIPELINE_TRACE_MEMORY", "0") == "1"
+
+STATUS_SUCCESS = "success"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+STATUS_BLOCKED = "blocked"
+
+logger = get_logger("pipeline")
+
+
+class Stage:
+    """
+    Một bước của pipeline: hàm import được + danh sách bước phụ thuộc.
+    `fingerprint()` trả về chuỗi mô tả dữ liệu đầu vào (None = luôn chạy);
+    nếu không đổi so với lần chạy thành công trước thì bước được bỏ qua.
+    `fn()` có thể trả về số dòng đã xử lý (int) hoặc dict có khoá "rows".
+    """
+
+    def __init__(self, name, fn, deps=(), fingerprint=None, description=None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.fingerprint = fingerprint
+        self.description = description or name
+
+
+# ===== Định tuyến stdout theo luồng: mỗi bước chạy song song có log riêng =====
+class _ThreadRoutedStdout(io.TextIOBase):
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
+
+    def write(self, text):
+        sink = getattr(self.local, "sink", None)
+        if sink is not None:
+            sink(text)
+        return self.original.write(text)
+
+    def flush(self):
+        self.original.flush()
+
+    def reconfigure(self, *args, **kwargs):
+        # Các script gọi sys.stdout.reconfigure(encoding='utf-8') khi import
+        if hasattr(self.original, "reconfigure"):
+            self.original.reconfigure(*args, **kwargs)
+
+    @property
+    def encoding(self):
+        return getattr(self.original, "encoding", "utf-8")
+
+
+_stdout_lock = threading.Lock()
+_stdout_users = 0
+_stdout_proxy = None
+
+
+def _acquire_stdout():
+    global _stdout_users, _stdout_proxy
+    with _stdout_lock:
+        if _stdout_users == 0:
+            _stdout_proxy = _ThreadRoutedStdout(sys.stdout)
+            sys.stdout = _stdout_proxy
+        _stdout_users += 1
+        return _stdout_proxy
+
+
+def _release_stdout():
+    global _stdout_users, _stdout_proxy
+    with _stdout_lock:
+        _stdout_users -= 1
+        if _stdout_users == 0 and _stdout_proxy is not None:
+            if sys.stdout is _stdout_proxy:
+                sys.stdout = _stdout_proxy.original
+            _stdout_proxy = None
+
+
+# ===== Lưu fingerprint của lần chạy thành công gần nhất =====
+_state_lock = threading.Lock()
+
+
+def load_state(path: str = PIPELINE_STATE_PATH) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_state(state: dict, path: str = PIPELINE_STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+class Pipeline:
+    """
+    DAG các Stage. Các nhánh độc lập chạy song song trên thread pool;
+    bước lỗi sẽ chặn mọi bước phụ thuộc vào nó.
+    Với mỗi bước ghi lại: wall time, CPU time (của luồng chạy bước), số dòng, bộ nhớ đỉnh.
+    """
+
+    def __init__(self, name, stages, state_path: str = PIPELINE_STATE_PATH):
+        self.name = name
+        self.stages = {s.name: s for s in stages}
+        self.state_path = state_path
+        for s in stages:
+            for d in s.deps:
+                if d not in self.stages:
+                    raise ValueError(f"Bước {s.name} phụ thuộc bước không tồn tại: {d}")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline {self.name} có vòng lặp tại bước {name}")
+            visiting.add(name)
+            for d in self.stages[name].deps:
+                visit(d)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def _run_stage(self, stage, force, state, on_event, session=None, run_id=None, keep_stdout=True):
+        emit = on_event or (lambda event: None)
+        result = {
+            "step": stage.name,
+            "description": stage.description,
+            "status": None,
+            "rows": None,
+            "wall_s": 0.0,
+            "cpu_s": 0.0,
+            "peak_mem_mb": None,
+            "fingerprint": None,
+            "stdout": "",
+            "error": None,
+        }
+
+        try:
+            fp = stage.fingerprint() if stage.fingerprint else None
+        except Exception as e:
+            logger.warning(f"⚠️ Không tính được fingerprint cho {stage.name}: {e}", extra={"run_id": run_id, "stage": stage.name})
+            fp = None
+        result["fingerprint"] = fp
+
+        key = f"{self.name}.{stage.name}"
+        if not force and fp is not None and state.get(key) == fp:
+            result["status"] = STATUS_SKIPPED
+            metrics.inc("pipeline_stage_runs_total", {"pipeline": self.name, "stage": stage.name, "status": STATUS_SKIPPED})
+            emit({"type": "stage_skipped", "pipeline": self.name, "step": stage.name})
+            return result
+
+        emit({"type": "stage_start", "pipeline": self.name, "step": stage.name,
+              "description": stage.description})
+
+        chunks = [] if keep_stdout else deque(maxlen=STDOUT_TAIL_CHUNKS)
+
+        def sink(text):
+            chunks.append(text)
+            emit({"type": "log", "pipeline": self.name, "step": stage.name, "text": text})
+
+        proxy = _acquire_stdout()
+        proxy.local.sink = sink
+        mem_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            # Đang profile (request HTTP / PROFILE=...) → luồng worker tham gia session; tóm tắt in vào log của bước
+            # Log của script (utils.logger) đi qua hàng đợi → gom lại theo run_id + stage vào stdout của bước
+            with log_context(run_id=run_id, stage=stage.name), capture(run_id, stage.name, sink), \
+                    profiling.attach(session), profiling.profiled(key) as prof, profiling.span(stage.name):
+                output = stage.fn()
+            if prof is not None and prof.result is not None:
+                result["profile"] = prof.result["files"]
+            if isinstance(output, dict):
+                result["rows"] = output.get("rows")
+            elif isinstance(output, int) and not isinstance(output, bool):
+                result["rows"] = output
+            result["status"] = STATUS_SUCCESS
+        except (Exception, SystemExit) as e:
+            result["status"] = STATUS_FAILED
+            result["error"] = f"{type(e).__name__}: {e}"
+            sink(traceback.format_exc())
+        finally:
+            result["wall_s"] = round(time.perf_counter() - wall_start, 4)
+            result["cpu_s"] = round(time.thread_time() - cpu_start, 4)
+            if tracemalloc.is_tracing():
+                # Đỉnh bộ nhớ Python/NumPy toàn tiến trình (không riêng bước này) trong lúc bước chạy
+                peak = tracemalloc.get_traced_memory()[1]
+                result["peak_mem_mb"] = round(max(peak - mem_before, 0) / 1024 / 1024, 2)
+            proxy.local.sink = None
+            _release_stdout()
+
+        result["stdout"] = "".join(chunks).strip()
+
+        if result["status"] == STATUS_SUCCESS and fp is not None:
+            with _state_lock:
+                state[key] = fp
+                save_state(state, self.state_path)
+
+        labels = {"pipeline": self.name, "stage": stage.name}
+        metrics.observe("pipeline_stage_duration_seconds", result["wall_s"], labels)
+        metrics.inc("pipeline_stage_runs_total", {**labels, "status": result["status"]})
+
+        emit({"type": "stage_end", "pipeline": self.name, "step": stage.name,
+              **{k: v for k, v in result.items() if k not in ("stdout", "step")}})
+        return result
+
+    def run(self, force: bool = False, max_workers: int = 4, on_event=None,
+            trace_memory: bool = None, keep_stdout: bool = True) -> dict:
+        trace_memory = PIPELINE_TRACE_MEMORY if trace_memory is None else trace_memory
+        state = load_state(self.state_path)
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+
+        session = profiling.current()
+        run_id = uuid.uuid4().hex[:12]
+        started_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+
+        if on_event:
+            on_event({"type": "pipeline_start", "pipeline": self.name, "run_id": run_id, "steps": list(self.stages)})
+        wall_start = time.perf_counter()
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                while pending or running:
+                    for name, stage in list(pending.items()):
+                        dep_status = [results[d]["status"] if d in results else None for d in stage.deps]
+                        if any(s in (STATUS_FAILED, STATUS_BLOCKED) for s in dep_status):
+                            results[name] = {"step": name, "description": stage.description,
+                                             "status": STATUS_BLOCKED, "stdout": "",
+                                             "error": "Bước phụ thuộc bị lỗi"}
+                            del pending[name]
+                        elif all(s in (STATUS_SUCCESS, STATUS_SKIPPED) for s in dep_status):
+                            if trace_memory and tracemalloc.is_tracing() and not running:
+                                tracemalloc.reset_peak()
+                            running[pool.submit(self._run_stage, stage, force, state, on_event,
+                                                 session, run_id, keep_stdout)] = name
+                            del pending[name]
+
+                    if not running:
+                        continue
+                    done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[running.pop(future)] = future.result()
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        ordered = [results[name] for name in self.stages]
+        summary = {
+            "pipeline": self.name,
+            "run_id": run_id,
+            "success": all(r["status"] in (STATUS_SUCCESS, STATUS_SKIPPED) for r in ordered),
+            "wall_s": round(time.perf_counter() - wall_start, 4),
+            "steps": ordered,
+        }
+        if on_event:
+            on_event({"type": "pipeline_end", "pipeline": self.name,
+                      "success": summary["success"], "wall_s": summary["wall_s"]})
+        return summary
+
+
+def print_summary(summary: dict):
+    print(f"\n📋 TỔNG KẾT PIPELINE {summary['pipeline']} ({summary['wall_s']}s):")
+    icons = {STATUS_SUCCESS: "✅", STATUS_SKIPPED: "⏭️", STATUS_FAILED: "❌", STATUS_BLOCKED: "🛑"}
+    for r in summary["steps"]:
+        line = f" - {icons.get(r['status'], '?')} {r['description']}: {r['status']}"
+        if r["status"] == STATUS_SUCCESS:
+            line += f" | wall {r['wall_s']}s | cpu {r['cpu_s']}s | rows {r['rows']} | peak {r['peak_mem_mb']} MB"
+        elif r.get("error"):
+            line += f" | {r['error']}"
+        print(line)
@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+class PortfolioStore:
+    """
+    Bản đồ user_id → danh mục đã tính sẵn (kết quả batch_portfolio).
+    Đọc O(1); cả bản đồ được thay thế nguyên khối sau mỗi lần batch.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self.refreshed_at = None
+        self.last_duration = None
+
+    def get(self, user_id):
+        return self._data.get(user_id)
+
+    def replace_all(self, entries: dict, duration: float = None):
+        with self._lock:
+            self._data = dict(entries)
+            self.refreshed_at = time.time()
+            self.last_duration = duration
+
+    def load_if_empty(self, entries: dict) -> bool:
+        """Nạp từ portfolio_snapshots lúc khởi động; batch đã chạy trong tiến trình này thì giữ kết quả mới hơn."""
+        with self._lock:
+            if self.refreshed_at is not None:
+                return False
+            self._data = dict(entries)
+            self.refreshed_at = time.time()
+            return True
+
+    def put(self, user_id, entry: dict):
+        with self._lock:
+            self._data[user_id] = entry
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._data),
+            "refreshed_at": self.refreshed_at,
+            "last_duration_s": round(self.last_duration, 4) if self.last_duration else None,
+        }
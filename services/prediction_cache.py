@@ -0,0 +1,83 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def feature_key(features, model_version) -> str:
+    """
+    Hash chuẩn hoá của vector đặc trưng + phiên bản model.
+    Giá trị được ép về float và làm tròn để 1.0 / "1" / 1 cho cùng một key.
+    """
+    payload = json.dumps(
+        [model_version, [round(float(v), 10) for v in features]],
+        separators=(",", ":")
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class PredictionCache:
+    """
+    Cache LRU + TTL trong tiến trình cho kết quả /predict.
+    Thread-safe, có thống kê hit/miss.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600):
+        self.max_size = max(0, int(max_size))
+        self.ttl_seconds = float(ttl_seconds)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
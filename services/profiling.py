@@ -0,0 +1,285 @@
+"""
+Profiling theo yêu cầu, tắt thì không tốn gì:
+- HTTP: header `X-Profile: 1|sample|cprofile` hoặc query `?profile=...`
+- Script / pipeline: biến môi trường PROFILE=1|sample|cprofile
+- `span("fetch")` đánh dấu các giai đoạn (fetch, featurize, predict, write); khi không profile chỉ tốn 1 lần đọc ContextVar
+
+Chế độ "sample": luồng nền lấy stack của các luồng đang được profile mỗi PROFILE_INTERVAL_MS
+→ file .folded (collapsed stack) mở thẳng bằng flamegraph.pl / speedscope.
+Chế độ "cprofile": đếm chính xác số lần gọi → file .prof (snakeviz / flameprof).
+"""
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+
+MODES = ("sample", "cprofile")
+DEFAULT_MODE = "sample"
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".cache/profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", 25))
+
+_current = ContextVar("profile_session", default=None)
+_NULL = nullcontext()
+
+
+def parse_mode(flag):
+    """'1'/'true' → chế độ mặc định; 'sample'/'cprofile' giữ nguyên; còn lại → None (tắt)."""
+    flag = (flag or "").strip().lower()
+    if flag in MODES:
+        return flag
+    if flag in ("1", "true", "yes", "on"):
+        return DEFAULT_MODE
+    return None
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    def __init__(self, name: str, mode: str = DEFAULT_MODE, interval_ms: float = PROFILE_INTERVAL_MS):
+        if mode not in MODES:
+            raise ValueError(f"Chế độ profile không hợp lệ: {mode}")
+        self.name = name
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self.result = None
+        self.warnings = []
+        self._lock = threading.Lock()
+        self._threads = {}        # thread id → số lần attach đang mở
+        self._span_stacks = {}    # thread id → danh sách span đang mở
+        self._spans = {}          # tên span → [số lần, tổng giây]
+        self._samples = Counter()  # collapsed stack → số mẫu
+        self._n_samples = 0
+        self._ticks = 0
+        self._period = self.interval
+        self._profiles = {}       # thread id → cProfile.Profile
+        self._done_profiles = []
+        self._stop = threading.Event()
+        self._sampler = None
+        self._root = None
+        self._started = None
+
+    # ===== Bật / tắt =====
+    def start(self):
+        self._started = time.perf_counter()
+        if self.mode == "sample":
+            self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.name}", daemon=True)
+            self._sampler.start()
+        self._root = self.attach()
+        self._root.__enter__()
+        return self
+
+    def stop(self) -> dict:
+        if self.result is not None:
+            return self.result
+        if self._root is not None:
+            self._root.__exit__(None, None, None)
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        wall = time.perf_counter() - (self._started or time.perf_counter())
+        self.result = self.report(wall)
+        self.result["files"] = self.write()
+        return self.result
+
+    @contextmanager
+    def attach(self):
+        """Profile luồng hiện tại cho tới khi thoát khối (dùng cho luồng worker của pipeline)."""
+        tid = threading.get_ident()
+        previous = _current.get()
+        _current.set(self)
+        with self._lock:
+            first = self._threads.get(tid, 0) == 0
+            self._threads[tid] = self._threads.get(tid, 0) + 1
+        profile = None
+        if first and self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                self._profiles[tid] = profile
+            except ValueError as e:
+                # Python 3.12+: chỉ 1 profiler hoạt động cùng lúc trong tiến trình
+                profile = None
+                self.warnings.append(f"Không bật được cProfile cho luồng {threading.current_thread().name}: {e}")
+        try:
+            yield self
+        finally:
+            if profile is not None:
+                profile.disable()
+                with self._lock:
+                    self._done_profiles.append(self._profiles.pop(tid))
+            with self._lock:
+                self._threads[tid] -= 1
+                if self._threads[tid] == 0:
+                    del self._threads[tid]
+            _current.set(previous)
+
+    @contextmanager
+    def span(self, name: str):
+        tid = threading.get_ident()
+        stack = self._span_stacks.setdefault(tid, [])
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            with self._lock:
+                entry = self._spans.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+
+    # ===== Lấy mẫu stack =====
+    def _sample_loop(self):
+        own = threading.get_ident()
+        started = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            self._ticks += 1
+            # Chu kỳ thực tế dài hơn interval khi các luồng giữ GIL → quy đổi mẫu ra giây theo chu kỳ đo được
+            self._period = (time.perf_counter() - started) / self._ticks
+            frames = sys._current_frames()
+            with self._lock:
+                tids = [tid for tid in self._threads if tid != own]
+            for tid in tids:
+                frame = frames.get(tid)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                # Span đang mở được chèn làm gốc của stack → flamegraph tách theo giai đoạn
+                spans = [f"[{s}]" for s in tuple(self._span_stacks.get(tid, ()))]
+                self._samples[";".join(spans + stack)] += 1
+                self._n_samples += 1
+
+    # ===== Báo cáo =====
+    def _top_sampled(self, n: int) -> list:
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self._samples.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+        return [
+            {"function": label, "calls": None,
+             "self_s": round(self_counts[label] * self._period, 4),
+             "total_s": round(count * self._period, 4)}
+            for label, count in total_counts.most_common(n)
+        ]
+
+    def _stats(self):
+        if not self._done_profiles:
+            return None
+        stats = pstats.Stats(self._done_profiles[0])
+        for profile in self._done_profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def _top_cprofile(self, n: int) -> list:
+        stats = self._stats()
+        if stats is None:
+            return []
+        rows = sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:n]
+        return [
+            {"function": f"{func} ({os.path.basename(file)}:{line})", "calls": nc,
+             "self_s": round(tt, 4), "total_s": round(ct, 4)}
+            for (file, line, func), (cc, nc, tt, ct, callers) in rows
+        ]
+
+    def report(self, wall: float, top: int = PROFILE_TOP) -> dict:
+        return {
+            "name": self.name,
+            "mode": self.mode,
+            "wall_s": round(wall, 4),
+            "samples": self._n_samples if self.mode == "sample" else None,
+            "spans": {k: {"count": c, "total_s": round(t, 4)} for k, (c, t) in self._spans.items()},
+            "top": self._top_sampled(top) if self.mode == "sample" else self._top_cprofile(top),
+            "warnings": list(self.warnings),
+        }
+
+    def write(self, directory: str = PROFILE_DIR) -> dict:
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        base = os.path.join(directory, f"{stamp}_{re.sub(r'[^A-Za-z0-9_.-]+', '_', self.name)}")
+        files = {"summary": base + ".txt"}
+
+        if self.mode == "sample":
+            files["folded"] = base + ".folded"
+            with open(files["folded"], "w", encoding="utf-8") as f:
+                for stack, count in self._samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        else:
+            stats = self._stats()
+            if stats is not None:
+                files["prof"] = base + ".prof"
+                stats.dump_stats(files["prof"])
+
+        with open(files["summary"], "w", encoding="utf-8") as f:
+            f.write(format_report(self.result or self.report(0)) + "\n")
+        return files
+
+
+def format_report(report: dict) -> str:
+    lines = [f"🔬 Profile {report['name']} ({report['mode']}, {report['wall_s']}s"
+             + (f", {report['samples']} mẫu)" if report.get("samples") is not None else ")")]
+    if report["spans"]:
+        lines.append("⏱️ Giai đoạn:")
+        for name, s in sorted(report["spans"].items(), key=lambda kv: -kv[1]["total_s"]):
+            lines.append(f"   - {name}: {s['total_s']}s ({s['count']} lần)")
+    if report["top"]:
+        lines.append(f"🔥 Top {len(report['top'])} hàm theo thời gian tích luỹ:")
+        for row in report["top"]:
+            calls = f" | {row['calls']} lần gọi" if row["calls"] is not None else ""
+            lines.append(f"   {row['total_s']:>9.4f}s tổng | {row['self_s']:>9.4f}s riêng{calls} | {row['function']}")
+    for w in report.get("warnings") or []:
+        lines.append(f"⚠️ {w}")
+    for kind, path in (report.get("files") or {}).items():
+        lines.append(f"💾 {kind}: {path}")
+    return "\n".join(lines)
+
+
+# ===== API dùng trong code =====
+def current():
+    return _current.get()
+
+
+def span(name: str):
+    """Đánh dấu 1 giai đoạn; không profile thì trả về context rỗng dùng chung."""
+    session = _current.get()
+    return _NULL if session is None else session.span(name)
+
+
+def attach(session):
+    """Cho luồng worker tham gia session của luồng gọi (ContextVar không tự truyền sang thread pool)."""
+    return _NULL if session is None else session.attach()
+
+
+@contextmanager
+def profiled(name: str, mode: str = None):
+    """
+    Profile khối lệnh nếu `mode` (hoặc biến PROFILE) bật; in tóm tắt ra stdout (log của job).
+    Đang nằm trong 1 session khác thì dùng luôn session đó.
+    """
+    outer = _current.get()
+    mode = mode or parse_mode(os.getenv("PROFILE"))
+    if outer is not None or mode is None:
+        yield outer
+        return
+
+    session = ProfileSession(name, mode).start()
+    try:
+        yield session
+    finally:
+        print(format_report(session.stop()))
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import pandas as pd
+
+from services.scheduler import INTERVAL_SECONDS
+from services.candle_buffer import candle_buffers
+from services.metrics import metrics
+from utils.logger import get_logger
+
+logger = get_logger("realtime_refresh")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BYBIT_MODEL_PATH = os.path.join(ROOT_DIR, "model", "model_rf.pkl")
+
+
+class ReloadingModel:
+    """Model RF nạp 1 lần, tự nạp lại khi file model đổi (sau job train hàng ngày)."""
+
+    def __init__(self, path: str = BYBIT_MODEL_PATH):
+        self.path = path
+        self._model = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        mtime = os.path.getmtime(self.path)
+        with self._lock:
+            if self._model is None or mtime != self._mtime:
+                self._model = joblib.load(self.path)
+                self._mtime = mtime
+                metrics.set_info("model_info", {"model": "bybit_rf", "version": str(int(mtime))})
+                logger.info(f"✅ Đã nạp model {self.path}")
+            return self._model
+
+
+class CandleRefresher:
+    """
+    Nến mới của 1 symbol → tính feature cho nến vừa đóng → chấm điểm bằng model đã nạp → ghi ai_predictions.
+    - chạy ở thread nền, không chặn vòng đồng bộ nến
+    - mỗi symbol có tối đa 1 lượt đang chờ; sự kiện đến khi đã có lượt chờ thì gộp lại
+    - không huấn luyện lại, chỉ dùng model đang nạp
+    """
+
+    def __init__(self, model: ReloadingModel = None, max_workers: int = 2, warmup: int = None):
+        self.model = model or ReloadingModel()
+        self.warmup = warmup
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="candle-refresh")
+        self._queued = set()
+        self._lock = threading.Lock()
+        self.counters = {"events": 0, "coalesced": 0, "inserted": 0, "duplicates": 0, "skipped": 0, "errors": 0}
+        self.recent = deque(maxlen=50)
+
+    # ===== Nhận sự kiện từ save_to_supabase =====
+    def on_candles(self, symbol: str, interval, timestamps: list):
+        with self._lock:
+            self.counters["events"] += 1
+            if symbol in self._queued:
+                self.counters["coalesced"] += 1
+                return
+            self._queued.add(symbol)
+        self._executor.submit(self._run, symbol, interval)
+
+    def _run(self, symbol, interval):
+        with self._lock:
+            # Bỏ khỏi hàng chờ trước khi đọc DB → nến đến trong lúc đang chạy sẽ tạo lượt mới
+            self._queued.discard(symbol)
+        started = time.time()
+        try:
+            result = self.refresh(symbol, interval)
+        except Exception as e:
+            result = {"symbol": symbol, "status": "error", "error": str(e)}
+            logger.exception(f"❌ Realtime {symbol} lỗi: {e}")
+
+        result["duration_s"] = round(time.time() - started, 3)
+        with self._lock:
+            key = {"inserted": "inserted", "duplicate": "duplicates", "error": "errors"}.get(result["status"], "skipped")
+            self.counters[key] += 1
+            self.recent.appendleft(result)
+        return result
+
+    # ===== Tính feature + chấm điểm cho nến mới nhất =====
+    def fetch_recent_candles(self, supabase, symbol: str, limit: int) -> pd.DataFrame:
+        res = supabase.table("ohlcv_data") \
+            .select("timestamp, open, high, low, close, volume") \
+            .eq("symbol", symbol) \
+            .order("timestamp", desc=True) \
+            .limit(limit) \
+            .execute()
+        return pd.DataFrame(res.data[::-1])
+
+    def refresh(self, symbol: str, interval=None) -> dict:
+        from scripts.bybit import generate_training_data, predict_signal
+
+        warmup = self.warmup or generate_training_data.FEATURE_WARMUP
+        # Buffer đủ nến (vừa được job đồng bộ ghi) → khỏi đọc lại ohlcv_data
+        candles = candle_buffers.candles(symbol, warmup, min_rows=min(warmup, candle_buffers.capacity))
+        if candles is None:
+            candles = self.fetch_recent_candles(predict_signal.supabase, symbol, warmup)
+        if len(candles) < predict_signal.CANDLE_LOOKBACK:
+            return {"symbol": symbol, "status": "insufficient", "candles": len(candles)}
+
+        df = candles.set_index(pd.to_datetime(candles["timestamp"], unit="ms")).drop(columns=["timestamp"])
+        features = generate_training_data.compute_features(df)
+        record = generate_training_data.build_record(symbol, features.index[-1], features.iloc[-1])
+        candle_buffers.set_features(symbol, record)
+
+        s = predict_signal.score(self.model.get(), pd.DataFrame([record]), candles.tail(predict_signal.CANDLE_LOOKBACK))
+        inserted = predict_signal.insert_prediction(
+            symbol, s["timestamp"], s["prediction"], s["confidence"],
+            s["entry"], s["tp"], s["sl"], s["high"], s["low"], s["entry"]
+        )
+
+        # Độ trễ tính từ lúc nến đóng tới khi dự đoán được ghi
+        period = INTERVAL_SECONDS.get(str(interval)) if interval is not None else None
+        latency = time.time() - (record["timestamp"] / 1000 + period) if period else None
+        return {
+            "symbol": symbol,
+            "status": "inserted" if inserted else "duplicate",
+            "timestamp": record["timestamp"],
+            "prediction": s["prediction"],
+            "confidence": round(s["confidence"], 4),
+            "latency_s": round(latency, 3) if latency is not None else None,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model_path": self.model.path,
+                "queued": sorted(self._queued),
+                "counters": dict(self.counters),
+                "recent": list(self.recent),
+            }
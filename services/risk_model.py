@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import get_logger
+
+logger = get_logger("risk_model")
+
+RISK_MODEL_CACHE_DIR = os.getenv("RISK_MODEL_CACHE_DIR", ".cache/risk_models")
+
+
+class RunningMoments:
+    """
+    Thống kê cộng dồn của lợi suất ngày cho 1 universe cố định.
+    Đủ để tính covariance Ledoit-Wolf mà không cần giữ lại dữ liệu thô:
+    n, Σx, Σxxᵀ, Σ‖x‖⁴ và Σ‖x‖²x.
+    """
+
+    def __init__(self, symbols):
+        p = len(symbols)
+        self.symbols = list(symbols)
+        self.n = 0
+        self.sum_x = np.zeros(p)
+        self.sum_xx = np.zeros((p, p))
+        self.sum_a2 = 0.0
+        self.sum_ax = np.zeros(p)
+        self.last_date = None
+        self.last_close = None
+
+    def update(self, returns: np.ndarray):
+        """Cộng thêm các dòng lợi suất mới (n_ngày × p)."""
+        returns = np.asarray(returns, dtype=np.float64)
+        if returns.size == 0:
+            return
+        a = np.einsum("ij,ij->i", returns, returns)
+        self.n += len(returns)
+        self.sum_x += returns.sum(axis=0)
+        self.sum_xx += returns.T @ returns
+        self.sum_a2 += float((a * a).sum())
+        self.sum_ax += a @ returns
+
+    def covariance(self):
+        """Covariance co rút về ma trận đơn vị có tỉ lệ (Ledoit-Wolf 2004)."""
+        T = self.n
+        p = len(self.symbols)
+        if T < 2 or p == 0:
+            return None, None
+
+        mu = self.sum_x / T
+        S = self.sum_xx / T - np.outer(mu, mu)
+
+        # Σ‖y_t‖⁴ với y_t = x_t - μ, khai triển theo các tổng đã lưu
+        c = float(mu @ mu)
+        sum_a = float(np.trace(self.sum_xx))
+        sum_ab = float(mu @ self.sum_ax)
+        sum_b = float(mu @ self.sum_x)
+        sum_b2 = float(mu @ self.sum_xx @ mu)
+        sum_y4 = self.sum_a2 - 4 * sum_ab + 2 * c * sum_a + 4 * sum_b2 - 4 * c * sum_b + T * c * c
+
+        m = np.trace(S) / p
+        d2 = float(((S - m * np.eye(p)) ** 2).sum()) / p
+        b_bar2 = max((sum_y4 / T - float((S ** 2).sum())) / (p * T), 0.0)
+        shrinkage = min(b_bar2, d2) / d2 if d2 > 0 else 1.0
+
+        sigma = shrinkage * m * np.eye(p) + (1 - shrinkage) * S
+        return sigma, float(shrinkage)
+
+    def to_state(self) -> dict:
+        return {
+            "n": np.array(self.n),
+            "sum_x": self.sum_x,
+            "sum_xx": self.sum_xx,
+            "sum_a2": np.array(self.sum_a2),
+            "sum_ax": self.sum_ax,
+            "last_close": self.last_close if self.last_close is not None else np.array([]),
+            "meta": np.array(json.dumps({"symbols": self.symbols, "last_date": self.last_date})),
+        }
+
+    @classmethod
+    def from_state(cls, state) -> "RunningMoments":
+        meta = json.loads(str(state["meta"]))
+        obj = cls(meta["symbols"])
+        obj.n = int(state["n"])
+        obj.sum_x = state["sum_x"]
+        obj.sum_xx = state["sum_xx"]
+        obj.sum_a2 = float(state["sum_a2"])
+        obj.sum_ax = state["sum_ax"]
+        obj.last_date = meta["last_date"]
+        obj.last_close = state["last_close"] if len(state["last_close"]) else None
+        return obj
+
+
+def universe_key(symbols) -> str:
+    return hashlib.sha1(",".join(sorted(symbols)).encode("utf-8")).hexdigest()[:16]
+
+
+class RiskModelStore:
+    """
+    Cache covariance theo (universe, ngày).
+    - Trong bộ nhớ: (universe, ngày) → DataFrame covariance
+    - Trên đĩa: RunningMoments của từng universe, cập nhật tăng dần khi có giá đóng cửa mới
+
+    `loader(symbols, since_date)` trả về DataFrame giá đóng cửa (index = ngày, cột = symbol)
+    với các ngày >= since_date (None = toàn bộ lịch sử).
+    """
+
+    def __init__(self, loader, cache_dir: str = RISK_MODEL_CACHE_DIR, max_entries: int = 256):
+        self.loader = loader
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._covs = {}
+        self._moments = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _load_moments(self, key: str, symbols):
+        if key in self._moments:
+            return self._moments[key]
+        path = self._path(key)
+        if os.path.isfile(path):
+            try:
+                with np.load(path, allow_pickle=False) as state:
+                    moments = RunningMoments.from_state(state)
+                if moments.symbols == symbols:
+                    return moments
+            except Exception as e:
+                logger.warning(f"⚠️ Bỏ qua cache risk model hỏng {path}: {e}")
+        return RunningMoments(symbols)
+
+    def _save_moments(self, key: str, moments: RunningMoments):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = self._path(key) + ".tmp.npz"
+            np.savez(tmp, **moments.to_state())
+            os.replace(tmp, self._path(key))
+        except Exception as e:
+            logger.warning(f"⚠️ Không ghi được cache risk model: {e}")
+
+    def _catch_up(self, moments: RunningMoments, as_of: str):
+        closes = self.loader(moments.symbols, moments.last_date)
+        if closes is None or closes.empty:
+            return
+        closes = closes.reindex(columns=moments.symbols).sort_index()
+        closes = closes[closes.index <= as_of].dropna()
+        if closes.empty:
+            return
+
+        values = closes.to_numpy(dtype=np.float64)
+        if moments.last_close is not None:
+            # Nối với giá đóng cửa cuối đã xử lý để không mất lợi suất ở ranh giới
+            new = closes.index.astype(str) > str(moments.last_date)
+            values = np.vstack([moments.last_close[None, :], values[new]])
+        returns = values[1:] / values[:-1] - 1
+        returns = returns[np.isfinite(returns).all(axis=1)]
+
+        moments.update(returns)
+        moments.last_close = closes.to_numpy(dtype=np.float64)[-1]
+        moments.last_date = str(closes.index[-1])
+
+    def covariance(self, symbols, as_of) -> pd.DataFrame:
+        """Covariance (DataFrame symbol × symbol) của universe tại ngày `as_of`."""
+        symbols = sorted(set(symbols))
+        as_of = str(as_of)[:10]
+        key = universe_key(symbols)
+
+        with self._lock:
+            cached = self._covs.get((key, as_of))
+            if cached is not None:
+                return cached
+
+            moments = self._load_moments(key, symbols)
+            if moments.last_date is not None and moments.last_date > as_of:
+                # Moments đã cộng dồn qua as_of → tính lại từ đầu tới as_of (không dùng dữ liệu sau đó);
+                # bản tạm này không ghi đè trạng thái tăng dần
+                moments = RunningMoments(symbols)
+                self._catch_up(moments, as_of)
+            else:
+                if moments.last_date is None or moments.last_date < as_of:
+                    self._catch_up(moments, as_of)
+                    self._save_moments(key, moments)
+                self._moments[key] = moments
+
+            sigma, _ = moments.covariance()
+            if sigma is None:
+                return None
+            cov = pd.DataFrame(sigma, index=symbols, columns=symbols)
+
+            if len(self._covs) >= self.max_entries:
+                self._covs.pop(next(iter(self._covs)))
+            self._covs[(key, as_of)] = cov
+            return cov
+
+
+def supabase_close_loader(supabase, table: str = "ai_signals", page_size: int = 1000):
+    """Loader giá đóng cửa theo ngày từ Supabase (mặc định lấy cột close của ai_signals)."""
+
+    def load(symbols, since_date):
+        rows, start = [], 0
+        while True:
+            query = supabase.table(table).select("symbol, date, close").in_("symbol", list(symbols))
+            if since_date:
+                query = query.gte("date", since_date)
+            # date trùng giữa nhiều dòng → thêm id để thứ tự phân trang ổn định (không sót / lặp dòng)
+            res = query.order("date").order("id").range(start, start + page_size - 1).execute()
+            data = res.data or []
+            rows.extend(data)
+            if len(data) < page_size:
+                break
+            start += page_size
+
+        if not rows:
+            return pd.DataFrame()
+        df = pd.DataFrame(rows)
+        df["close"] = pd.to_numeric(df["close"], errors="coerce")
+        df["date"] = df["date"].astype(str).str[:10]
+        return df.drop_duplicates(["date", "symbol"]) \
+            .pivot(index="date", columns="symbol", values="close")
+
+    return load
@@ -0,0 +1,246 @@
+import random
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from services.metrics import metrics
+from utils.logger import get_logger
+
+logger = get_logger("scheduler")
+
+# Độ dài nến Bybit (giây); nến phút được căn theo epoch UTC
+INTERVAL_SECONDS = {
+    "1": 60, "3": 180, "5": 300, "15": 900, "30": 1800,
+    "60": 3600, "120": 7200, "240": 14400, "360": 21600, "720": 43200,
+    "D": 86400, "W": 604800,
+}
+
+# Chờ thêm vài giây sau khi nến đóng để Bybit chốt dữ liệu
+CANDLE_SETTLE_SECONDS = 3
+
+
+def next_candle_close(interval: str, now: float) -> float:
+    """Thời điểm (epoch giây) nến `interval` kế tiếp đóng, tính từ `now`."""
+    interval = str(interval)
+    if interval == "M":
+        dt = datetime.fromtimestamp(now, tz=timezone.utc)
+        year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+        return datetime(year, month, 1, tzinfo=timezone.utc).timestamp()
+    if interval == "W":
+        # Nến tuần Bybit bắt đầu thứ Hai 00:00 UTC
+        dt = datetime.fromtimestamp(now, tz=timezone.utc)
+        monday = (dt - timedelta(days=dt.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (monday + timedelta(days=7)).timestamp()
+
+    period = INTERVAL_SECONDS.get(interval)
+    if period is None:
+        raise ValueError(f"Interval không hỗ trợ: {interval}")
+    return (int(now) // period + 1) * period
+
+
+def daily_at(hhmm: str):
+    """Hàm tính lần chạy kế tiếp mỗi ngày vào giờ UTC `hh:mm`."""
+    hour, minute = (int(x) for x in hhmm.split(":"))
+
+    def next_time(now: float) -> float:
+        dt = datetime.fromtimestamp(now, tz=timezone.utc)
+        target = dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if target.timestamp() <= now:
+            target += timedelta(days=1)
+        return target.timestamp()
+
+    return next_time
+
+
+def candle_close(interval: str):
+    def next_time(now: float) -> float:
+        return next_candle_close(interval, now) + CANDLE_SETTLE_SECONDS
+
+    return next_time
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat() if ts else None
+
+
+class Job:
+    def __init__(self, name, fn, next_time=None, jitter_seconds: float = 0.0, group=None):
+        self.name = name
+        self.fn = fn
+        self.next_time = next_time
+        self.jitter_seconds = jitter_seconds
+        self.group = group or name
+        self.next_run = None
+        self.running_since = None
+        self.running_source = None
+        self.pending_triggers = 0
+        self.coalesced_total = 0
+
+    def schedule_next(self, now: float):
+        if self.next_time is None:
+            self.next_run = None
+            return
+        self.next_run = self.next_time(now) + random.uniform(0, self.jitter_seconds)
+
+
+class Scheduler:
+    """
+    Lịch chạy trong tiến trình:
+    - các job cùng `group` không bao giờ chạy chồng nhau
+    - trigger đến khi group đang bận được gộp lại thành đúng 1 lần chạy bù sau đó
+    - lưu lịch sử chạy kèm thời lượng
+    """
+
+    def __init__(self, history_size: int = 200):
+        self.jobs = {}
+        self.history = deque(maxlen=history_size)
+        self._group_locks = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_job(self, job: Job):
+        with self._lock:
+            self.jobs[job.name] = job
+            self._group_locks.setdefault(job.group, threading.Lock())
+            job.schedule_next(time.time())
+        self._wake.set()
+        return job
+
+    # ===== Chạy job =====
+    def _record(self, job, source, started, status, result=None, error=None):
+        metrics.observe("scheduler_job_duration_seconds", time.time() - started, {"job": job.name})
+        metrics.inc("scheduler_job_runs_total", {"job": job.name, "source": source, "status": status})
+        self.history.appendleft({
+            "job": job.name,
+            "source": source,
+            "started_at": _iso(started),
+            "duration_s": round(time.time() - started, 4),
+            "status": status,
+            "result": result,
+            "error": error,
+        })
+
+    def _run_locked(self, job, source, group_lock, **kwargs):
+        started = time.time()
+        job.running_since, job.running_source = started, source
+        try:
+            result = job.fn(**kwargs)
+            # Pipeline trả về summary dict có cờ "success"
+            ok = not (isinstance(result, dict) and result.get("success") is False)
+            self._record(job, source, started, "success" if ok else "failed",
+                         result=result if isinstance(result, (int, float, str)) else None)
+            return result
+        except Exception as e:
+            self._record(job, source, started, "failed", error=f"{e}\n{traceback.format_exc()}")
+            raise
+        finally:
+            job.running_since, job.running_source = None, None
+            group_lock.release()
+            self._run_pending(job)
+
+    def _run_pending(self, finished):
+        # Group vừa rảnh → chạy bù 1 lần cho job đầu tiên trong group có trigger bị gộp
+        with self._lock:
+            waiting = [j for j in self.jobs.values() if j.group == finished.group and j.pending_triggers > 0]
+            if not waiting:
+                return
+            job = waiting[0]
+            job.pending_triggers = 0
+        self.trigger(job.name, source="coalesced")
+
+    def _acquire(self, job):
+        group_lock = self._group_locks[job.group]
+        if group_lock.acquire(blocking=False):
+            return group_lock
+        with self._lock:
+            job.pending_triggers += 1
+            job.coalesced_total += 1
+        return None
+
+    def trigger(self, name: str, source: str = "manual") -> str:
+        """Chạy job ở luồng nền. Trả về "started" hoặc "coalesced" nếu group đang bận."""
+        job = self.jobs[name]
+        group_lock = self._acquire(job)
+        if group_lock is None:
+            return "coalesced"
+
+        def target():
+            try:
+                self._run_locked(job, source, group_lock)
+            except Exception as e:
+                logger.error(f"❌ Job {job.name} lỗi: {e}")
+
+        threading.Thread(target=target, name=f"job-{job.name}", daemon=True).start()
+        return "started"
+
+    def run_inline(self, name: str, source: str = "http", **kwargs):
+        """
+        Chạy job ngay trong luồng gọi (dùng cho endpoint đồng bộ); `kwargs` truyền thẳng cho hàm của job.
+        Trả về (True, kết quả) hoặc (False, None) nếu group đang bận → trigger được gộp.
+        """
+        job = self.jobs[name]
+        group_lock = self._acquire(job)
+        if group_lock is None:
+            return False, None
+        return True, self._run_locked(job, source, group_lock, **kwargs)
+
+    # ===== Vòng lặp lịch =====
+    def _loop(self):
+        while not self._stop.is_set():
+            now = time.time()
+            for job in list(self.jobs.values()):
+                if job.next_run is not None and job.next_run <= now:
+                    job.schedule_next(now)
+                    self.trigger(job.name, source="schedule")
+
+            upcoming = [j.next_run for j in self.jobs.values() if j.next_run is not None]
+            timeout = min(upcoming) - time.time() if upcoming else 60
+            self._wake.wait(timeout=min(max(timeout, 0.2), 60))
+            self._wake.clear()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        jobs = sorted(self.jobs.values(), key=lambda j: j.next_run or float("inf"))
+        return {
+            "enabled": self.running,
+            "now": _iso(now),
+            "upcoming": [
+                {
+                    "job": j.name,
+                    "group": j.group,
+                    "next_run": _iso(j.next_run),
+                    "in_seconds": round(j.next_run - now, 1),
+                }
+                for j in jobs if j.next_run is not None
+            ],
+            "running": [
+                {
+                    "job": j.name,
+                    "source": j.running_source,
+                    "started_at": _iso(j.running_since),
+                    "elapsed_s": round(now - j.running_since, 1),
+                    "pending_triggers": j.pending_triggers,
+                }
+                for j in jobs if j.running_since is not None
+            ],
+            "coalesced_total": {j.name: j.coalesced_total for j in jobs if j.coalesced_total},
+        }
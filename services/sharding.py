@@ -0,0 +1,260 @@
+import bisect
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from utils.logger import get_logger
+
+logger = get_logger("sharding")
+
+VIRTUAL_NODES = 64
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hashing: thêm/bớt 1 replica chỉ di chuyển ~1/N số symbol."""
+
+    def __init__(self, replicas=(), vnodes: int = VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.replicas = sorted(set(replicas))
+        points = sorted(
+            (_hash(f"{r}#{i}"), r) for r in self.replicas for i in range(vnodes)
+        )
+        self._keys = [p[0] for p in points]
+        self._owners = [p[1] for p in points]
+
+    def owner(self, key: str):
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[i]
+
+
+# ===== Kho lease: nơi các replica báo "còn sống" =====
+class SQLiteLeaseStore:
+    """Kho lease dùng file SQLite → chạy thử nhiều process trên 1 máy không cần Supabase."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS replica_leases ("
+                "replica_id TEXT PRIMARY KEY, expires_at REAL NOT NULL, heartbeat_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def heartbeat(self, replica_id: str, ttl: float):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO replica_leases (replica_id, expires_at, heartbeat_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(replica_id) DO UPDATE SET expires_at = excluded.expires_at, "
+                "heartbeat_at = excluded.heartbeat_at",
+                (replica_id, now + ttl, now),
+            )
+
+    def live_replicas(self) -> list:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT replica_id FROM replica_leases WHERE expires_at > ?", (time.time(),)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def release(self, replica_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM replica_leases WHERE replica_id = ?", (replica_id,))
+
+
+class SupabaseLeaseStore:
+    """Kho lease trên bảng replica_leases (xem sql/replica_leases.sql)."""
+
+    def __init__(self, client, table: str = "replica_leases"):
+        self.client = client
+        self.table = table
+
+    def heartbeat(self, replica_id: str, ttl: float):
+        now = time.time()
+        self.client.table(self.table).upsert({
+            "replica_id": replica_id,
+            "expires_at": int((now + ttl) * 1000),
+            "heartbeat_at": int(now * 1000),
+        }, on_conflict="replica_id").execute()
+
+    def live_replicas(self) -> list:
+        res = self.client.table(self.table) \
+            .select("replica_id") \
+            .gt("expires_at", int(time.time() * 1000)) \
+            .execute()
+        return [r["replica_id"] for r in (res.data or [])]
+
+    def release(self, replica_id: str):
+        self.client.table(self.table).delete().eq("replica_id", replica_id).execute()
+
+
+class ShardCoordinator:
+    """
+    Mỗi replica giữ 1 lease có hạn `ttl` giây và gia hạn định kỳ.
+    Tập replica còn lease tạo thành hash ring; replica chỉ xử lý symbol mà nó sở hữu.
+    Replica chết → lease hết hạn → các replica còn lại nhận lại phần symbol đó ở lần heartbeat kế tiếp.
+    """
+
+    def __init__(self, store, replica_id: str = None, ttl: float = 30.0):
+        self.store = store
+        self.replica_id = replica_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.ttl = ttl
+        self.ring = HashRing([self.replica_id])
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_heartbeat = 0.0
+
+    def heartbeat(self):
+        self.store.heartbeat(self.replica_id, self.ttl)
+        live = set(self.store.live_replicas())
+        live.add(self.replica_id)
+        if sorted(live) != self.ring.replicas:
+            logger.info(f"🔀 Ring thay đổi: {sorted(live)}")
+            self.ring = HashRing(live)
+        self._last_heartbeat = time.time()
+
+    def _loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning(f"⚠️ Heartbeat lỗi ({self.replica_id}): {e}")
+
+    def start(self):
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._loop, name="shard-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.store.release(self.replica_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Không trả được lease: {e}")
+
+    def owns(self, symbol: str) -> bool:
+        return self.ring.owner(symbol) == self.replica_id
+
+    def filter(self, items, key=lambda item: item):
+        # Heartbeat đã cũ (VD: chạy 1 lần, không có thread) → làm mới ring trước khi chia
+        if time.time() - self._last_heartbeat > self.ttl / 3:
+            self.heartbeat()
+        return [item for item in items if self.owns(key(item))]
+
+
+# ===== Cấu hình từ biến môi trường =====
+_coordinator = None
+_coordinator_lock = threading.Lock()
+
+
+def sharding_enabled() -> bool:
+    return os.getenv("SHARDING_ENABLED") == "1"
+
+
+def get_coordinator():
+    """
+    SHARD_STORE=sqlite:<đường dẫn> dùng file SQLite; mặc định dùng bảng replica_leases trên Supabase.
+    REPLICA_ID, SHARD_LEASE_TTL tuỳ chọn.
+    """
+    global _coordinator
+    with _coordinator_lock:
+        if _coordinator is None:
+            spec = os.getenv("SHARD_STORE", "supabase")
+            if spec.startswith("sqlite:"):
+                store = SQLiteLeaseStore(spec[len("sqlite:"):])
+            else:
+                from services.db import get_client
+                store = SupabaseLeaseStore(get_client())
+            _coordinator = ShardCoordinator(
+                store,
+                replica_id=os.getenv("REPLICA_ID"),
+                ttl=float(os.getenv("SHARD_LEASE_TTL", 30)),
+            ).start()
+        return _coordinator
+
+
+def filter_owned(items, key=lambda item: item):
+    """Giữ lại phần việc thuộc replica này; không bật sharding thì trả nguyên."""
+    if not sharding_enabled():
+        return list(items)
+    items = list(items)
+    coordinator = get_coordinator()
+    owned = coordinator.filter(items, key)
+    logger.info(f"🧩 Replica {coordinator.replica_id} xử lý {len(owned)}/{len(items)} symbol")
+    return owned
+
+
+# ===== Chạy thử nhiều replica trên 1 máy =====
+def _simulate_replica(replica_id, db_path, symbols, ttl, duration, out):
+    coordinator = ShardCoordinator(SQLiteLeaseStore(db_path), replica_id=replica_id, ttl=ttl)
+    coordinator.heartbeat()
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        out[replica_id] = sorted(coordinator.filter(symbols))
+        time.sleep(ttl / 3)
+
+
+def simulate(replicas: int = 3, n_symbols: int = 60, ttl: float = 3.0, db_path: str = None):
+    import multiprocessing
+    import tempfile
+
+    db_path = db_path or os.path.join(tempfile.mkdtemp(), "leases.db")
+    SQLiteLeaseStore(db_path)
+    symbols = [f"SYM{i:03d}USDT" for i in range(n_symbols)]
+
+    with multiprocessing.Manager() as manager:
+        out = manager.dict()
+        procs = {
+            f"replica-{i}": multiprocessing.Process(
+                target=_simulate_replica,
+                args=(f"replica-{i}", db_path, symbols, ttl, ttl * 8, out),
+            )
+            for i in range(replicas)
+        }
+        for p in procs.values():
+            p.start()
+
+        def report(title):
+            snapshot = dict(out)
+            covered = sorted(s for owned in snapshot.values() for s in owned)
+            print(f"\n{title}")
+            for rid in sorted(snapshot):
+                print(f"  {rid}: {len(snapshot[rid])} symbol")
+            print(f"  → phủ {len(set(covered))}/{n_symbols} symbol, trùng {len(covered) - len(set(covered))}")
+
+        time.sleep(ttl * 2)
+        report(f"📊 {replicas} replica đang chạy:")
+
+        victim = "replica-0"
+        procs[victim].terminate()
+        procs[victim].join()
+        out.pop(victim, None)
+        print(f"\n💀 Đã dừng {victim}, chờ lease hết hạn...")
+        time.sleep(ttl * 2.5)
+        report("📊 Sau khi rebalance:")
+
+        for p in procs.values():
+            p.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chạy thử sharding với nhiều process + kho lease SQLite")
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--symbols", type=int, default=60)
+    parser.add_argument("--ttl", type=float, default=3.0)
+    args = parser.parse_args()
+    simulate(args.replicas, args.symbols, args.ttl)
@@ -0,0 +1,168 @@
+"""
+Stream tiến độ pipeline cho client (SSE hoặc NDJSON):
+- pipeline chạy ở luồng nền, sự kiện `on_event` đi qua hàng đợi có giới hạn → bộ nhớ không tăng theo độ dài log
+- log được cắt thành từng dòng; hàng đợi đầy thì bỏ dòng log (đếm lại trong trường `dropped`), không bỏ sự kiện tiến độ
+- heartbeat khi không có sự kiện để proxy không cắt kết nối; gzip flush sau mỗi frame
+"""
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+
+from services.metrics import metrics
+from utils.logger import get_logger
+
+logger = get_logger("streaming")
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 1000))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", 15))
+STREAM_MAX_LINE = 16 * 1024  # dòng log dài hơn → cắt thành nhiều sự kiện
+
+FORMAT_SSE = "sse"
+FORMAT_NDJSON = "ndjson"
+MIMETYPES = {FORMAT_SSE: "text/event-stream", FORMAT_NDJSON: "application/x-ndjson"}
+
+_DONE = object()
+
+
+def negotiate(fmt_param, accept: str):
+    """?stream=sse|ndjson thắng header Accept; mặc định SSE."""
+    if fmt_param in MIMETYPES:
+        return fmt_param
+    if MIMETYPES[FORMAT_NDJSON] in (accept or ""):
+        return FORMAT_NDJSON
+    return FORMAT_SSE
+
+
+def encode(event: dict, fmt: str) -> bytes:
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    if fmt == FORMAT_SSE:
+        return f"event: {event.get('type', 'message')}\ndata: {data}\n\n".encode("utf-8")
+    return (data + "\n").encode("utf-8")
+
+
+def heartbeat(fmt: str) -> bytes:
+    if fmt == FORMAT_SSE:
+        return b": heartbeat\n\n"
+    return encode({"type": "heartbeat", "ts": time.time()}, fmt)
+
+
+def gzip_frames(frames):
+    """Nén gzip nhưng Z_SYNC_FLUSH sau từng frame → client giải nén được ngay, không phải chờ hết stream."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for frame in frames:
+        yield compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+class EventStream:
+    """Cầu nối giữa `on_event` của pipeline (luồng nền) và generator của response (luồng request)."""
+
+    def __init__(self, fmt: str = FORMAT_SSE, heartbeat_s: float = STREAM_HEARTBEAT_SECONDS,
+                 max_events: int = STREAM_QUEUE_SIZE):
+        self.fmt = fmt
+        self.heartbeat_s = heartbeat_s
+        self._queue = queue.Queue(maxsize=max_events)
+        self._partial = {}  # step → phần dòng log chưa có "\n"
+        self._dropped = 0
+        self._closed = threading.Event()
+
+    # ===== Phía pipeline =====
+    def emit(self, event: dict):
+        if event.get("type") == "log":
+            self._emit_log(event)
+            return
+        if event.get("type") == "stage_end":
+            self._flush_partial(event.get("pipeline"), event.get("step"))
+        self._put(event)
+
+    def _emit_log(self, event):
+        step = event.get("step")
+        text = self._partial.pop(step, "") + (event.get("text") or "")
+        *lines, rest = text.split("\n")
+        while len(rest) > STREAM_MAX_LINE:
+            lines.append(rest[:STREAM_MAX_LINE])
+            rest = rest[STREAM_MAX_LINE:]
+        if rest:
+            self._partial[step] = rest
+        for line in lines:
+            if line.strip():
+                self._put_log({"type": "log", "pipeline": event.get("pipeline"), "step": step, "line": line})
+
+    def _flush_partial(self, pipeline, step):
+        rest = self._partial.pop(step, "")
+        if rest.strip():
+            self._put_log({"type": "log", "pipeline": pipeline, "step": step, "line": rest})
+
+    def _put_log(self, event):
+        if self._closed.is_set():
+            return
+        if self._dropped:
+            event["dropped"] = self._dropped
+        try:
+            self._queue.put_nowait(event)
+            self._dropped = 0
+        except queue.Full:
+            # Client đọc chậm hơn log sinh ra → bỏ dòng log thay vì để hàng đợi phình ra
+            self._dropped += 1
+            metrics.inc("stream_log_lines_dropped_total")
+
+    def _put(self, event):
+        # Sự kiện tiến độ không được mất: chờ chỗ trống, trừ khi client đã ngắt kết nối
+        while not self._closed.is_set():
+            try:
+                self._queue.put(event, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    # ===== Chạy pipeline ở luồng nền =====
+    def run(self, fn, name: str = "stream"):
+        """`fn(on_event)` chạy ở luồng nền; kết quả trả về thành sự kiện `result`."""
+
+        def target():
+            try:
+                result = fn(self.emit)
+                self._put({"type": "result", **(result if isinstance(result, dict) else {"result": result})})
+            except Exception as e:
+                logger.error(f"❌ Stream {name} lỗi: {e}", exc_info=True)
+                self._put({"type": "error", "error": f"{type(e).__name__}: {e}"})
+            finally:
+                self._put(_DONE)
+
+        threading.Thread(target=target, name=f"stream-{name}", daemon=True).start()
+        return self
+
+    # ===== Phía response =====
+    def frames(self):
+        _track_open(+1)
+        try:
+            while True:
+                try:
+                    event = self._queue.get(timeout=self.heartbeat_s)
+                except queue.Empty:
+                    yield heartbeat(self.fmt)
+                    continue
+                if event is _DONE:
+                    return
+                yield encode(event, self.fmt)
+        finally:
+            # Client ngắt (GeneratorExit) hoặc stream xong → luồng nền thôi đẩy sự kiện; pipeline vẫn chạy nốt
+            self._closed.set()
+            _track_open(-1)
+
+    def body(self, gzip: bool = False):
+        return gzip_frames(self.frames()) if gzip else self.frames()
+
+
+_open_lock = threading.Lock()
+_open_streams = 0
+
+
+def _track_open(delta: int):
+    global _open_streams
+    with _open_lock:
+        _open_streams += delta
+        metrics.set_gauge("streams_open", _open_streams)
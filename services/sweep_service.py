@@ -0,0 +1,169 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from services.backtest_service import run_backtest
+
+# Dữ liệu dùng chung trong mỗi process worker (nạp 1 lần qua initializer)
+_SHARED = {}
+
+
+def expand_grid(grid: dict) -> list:
+    """{"a": [1, 2], "b": [3]} → [{"a": 1, "b": 3}, {"a": 2, "b": 3}]"""
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+# ===== Bybit: CONFIDENCE_THRESHOLD, TIME_WINDOW_MINUTES, target ±x% / n nến =====
+def precompute_bybit(predictions: pd.DataFrame, candles: pd.DataFrame,
+                     label_horizons, hold_horizon: int = 288) -> pd.DataFrame:
+    """
+    Tính 1 lần cho mọi điểm lưới:
+    - kết quả backtest của từng tín hiệu (không phụ thuộc ngưỡng confidence)
+    - độ trễ tín hiệu (created_at - timestamp nến) để áp TIME_WINDOW_MINUTES
+    - lợi suất tương lai sau n nến cho từng horizon của nhãn
+    """
+    preds = predictions.copy()
+    preds["timestamp"] = pd.to_numeric(preds["timestamp"], errors="coerce")
+    if "created_at" in preds.columns:
+        created = pd.to_datetime(preds["created_at"], errors="coerce", utc=True)
+        created_ms = created.astype("int64") // 1_000_000
+        preds["delay_min"] = np.where(created.notna(), (created_ms - preds["timestamp"]) / 60_000, 0.0)
+    else:
+        preds["delay_min"] = 0.0
+
+    trades = run_backtest(preds, candles, confidence_threshold=-np.inf, horizon=hold_horizon)
+    if trades.empty:
+        return trades
+
+    trades = trades.merge(
+        preds[["symbol", "timestamp", "delay_min"]].drop_duplicates(["symbol", "timestamp"])
+            .rename(columns={"timestamp": "entry_ts"}),
+        on=["symbol", "entry_ts"], how="left"
+    )
+
+    # Lợi suất tương lai từ nến tín hiệu, vector hoá theo từng symbol
+    closes = candles[["symbol", "timestamp", "close"]] \
+        .drop_duplicates(["symbol", "timestamp"]) \
+        .sort_values(["symbol", "timestamp"])
+    for h in label_horizons:
+        closes[f"fwd_{h}"] = closes.groupby("symbol")["close"].shift(-h) / closes["close"] - 1
+    fwd_cols = [f"fwd_{h}" for h in label_horizons]
+    trades = trades.merge(
+        closes[["symbol", "timestamp"] + fwd_cols].rename(columns={"timestamp": "entry_ts"}),
+        on=["symbol", "entry_ts"], how="left"
+    )
+    return trades
+
+
+# Tham số nhãn không ảnh hưởng lệnh mô phỏng (TP/SL của tín hiệu) → không nhân vào lưới PnL,
+# mỗi tổ hợp (horizon, threshold) thành 1 cột độ chính xác nhãn trên cùng dòng
+LABEL_PARAMS = ("label_horizon", "label_threshold")
+
+
+def label_accuracy_column(horizon, threshold) -> str:
+    return f"label_acc_h{horizon}_t{threshold}"
+
+
+def evaluate_bybit(params: dict) -> dict:
+    trades = _SHARED["bybit"]
+    mask = (trades["confidence"].to_numpy() >= params["confidence_threshold"]) & \
+           (trades["delay_min"].fillna(0).to_numpy() <= params.get("time_window_minutes", np.inf))
+    t = trades[mask]
+    pnl = t["pnl_pct"].to_numpy()
+
+    equity = np.cumsum(pnl[np.argsort(t["exit_ts"].to_numpy(), kind="stable")]) if len(pnl) else np.array([0.0])
+    peak = np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:]
+
+    result = {
+        **params,
+        "trades": int(len(t)),
+        "win_rate": round(float((pnl > 0).mean()), 4) if len(pnl) else 0.0,
+        "total_pnl_pct": round(float(pnl.sum() * 100), 4),
+        "max_drawdown_pct": round(float((peak - equity).max() * 100), 4) if len(pnl) else 0.0,
+    }
+
+    # Tỉ lệ tín hiệu cùng hướng với nhãn (±threshold sau label_horizon nến)
+    side = t["side"].to_numpy()
+    for label in _SHARED.get("label_sets", []):
+        fwd = t[f"fwd_{label['label_horizon']}"].to_numpy()
+        thr = label["label_threshold"]
+        hit = np.where(fwd > thr, 1, np.where(fwd < -thr, -1, 0)) == side
+        result[label_accuracy_column(label["label_horizon"], thr)] = round(float(hit.mean()), 4) if len(t) else 0.0
+    return result
+
+
+# ===== VN: ngưỡng MUA/BÁN trên xác suất model.pkl =====
+def precompute_vn(signals: pd.DataFrame) -> pd.DataFrame:
+    df = signals[["ai_predicted_probability", "label_win"]].copy()
+    df = df.apply(pd.to_numeric, errors="coerce").dropna()
+    return df.astype({"label_win": int})
+
+
+def evaluate_vn(params: dict) -> dict:
+    df = _SHARED["vn"]
+    prob = df["ai_predicted_probability"].to_numpy()
+    win = df["label_win"].to_numpy()
+
+    buy = prob >= params["buy_cutoff"]
+    sell = prob <= params["sell_cutoff"]
+    buy_precision = float(win[buy].mean()) if buy.any() else 0.0
+    sell_precision = float((1 - win[sell]).mean()) if sell.any() else 0.0
+    coverage = float((buy | sell).mean()) if len(prob) else 0.0
+
+    return {
+        **params,
+        "buy_signals": int(buy.sum()),
+        "sell_signals": int(sell.sum()),
+        "buy_precision": round(buy_precision, 4),
+        "sell_precision": round(sell_precision, 4),
+        "coverage": round(coverage, 4),
+        # Trung bình có trọng số độ phủ: tránh chọn ngưỡng quá chặt chỉ còn vài tín hiệu
+        "score": round(((buy_precision + sell_precision) / 2) * np.sqrt(coverage), 4),
+    }
+
+
+# ===== Chạy song song =====
+def _init_worker(shared: dict):
+    _SHARED.update(shared)
+
+
+def _evaluate_chunk(kind: str, chunk: list) -> list:
+    fn = evaluate_bybit if kind == "bybit" else evaluate_vn
+    return [fn(p) for p in chunk]
+
+
+def run_sweep(kind: str, data: pd.DataFrame, grid: dict, workers: int = None,
+              sort_by: str = None) -> pd.DataFrame:
+    """
+    Đánh giá toàn bộ lưới tham số song song trên nhiều process.
+    `data` là kết quả precompute_* → chỉ được gửi sang mỗi worker 1 lần.
+    """
+    shared = {kind: data}
+    if kind == "bybit":
+        grid = dict(grid)
+        labels = {k: grid.pop(k) for k in LABEL_PARAMS if k in grid}
+        shared["label_sets"] = expand_grid(labels) if len(labels) == len(LABEL_PARAMS) else []
+
+    points = expand_grid(grid)
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(points)))
+    chunk_size = max(1, len(points) // (workers * 4))
+    chunks = [points[i:i + chunk_size] for i in range(0, len(points), chunk_size)]
+
+    if workers == 1:
+        _init_worker(shared)
+        results = [r for c in chunks for r in _evaluate_chunk(kind, c)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shared,)) as pool:
+            results = [r for rs in pool.map(_evaluate_chunk, [kind] * len(chunks), chunks) for r in rs]
+
+    sort_by = sort_by or ("total_pnl_pct" if kind == "bybit" else "score")
+    table = pd.DataFrame(results).sort_values(sort_by, ascending=False).reset_index(drop=True)
+    table.index += 1
+    table.index.name = "rank"
+    return table
@@ -0,0 +1,116 @@
+"""
+Ghi lại mẫu request thật (/predict, /predict_batch, /portfolio) ra JSONL để replay khi đo tải:
+- bật bằng TRAFFIC_CAPTURE_RATE > 0 (tỉ lệ lấy mẫu), file mặc định .cache/captured_requests.jsonl
+- userId được thay bằng HMAC-SHA256 (TRAFFIC_CAPTURE_SALT) → cùng user vẫn ra cùng mã, không lộ id thật
+- dừng ghi khi file vượt TRAFFIC_CAPTURE_MAX_MB
+"""
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import threading
+import time
+
+from utils.logger import get_logger
+
+logger = get_logger("traffic_capture")
+
+TRAFFIC_CAPTURE_RATE = float(os.getenv("TRAFFIC_CAPTURE_RATE", 0))
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", ".cache/captured_requests.jsonl")
+TRAFFIC_CAPTURE_MAX_MB = float(os.getenv("TRAFFIC_CAPTURE_MAX_MB", 100))
+
+CAPTURED_ENDPOINTS = ("predict", "predict_batch", "portfolio")
+CAPTURED_HEADERS = ("Content-Type", "If-None-Match", "Accept-Encoding")
+USER_ID_KEYS = ("userId", "user_id")
+
+
+def anonymize(value, salt: bytes):
+    """Thay mọi userId / user_id (ở mọi độ sâu) bằng mã băm có salt."""
+    if isinstance(value, dict):
+        return {
+            k: (f"anon-{hmac.new(salt, str(v).encode(), hashlib.sha256).hexdigest()[:16]}"
+                if k in USER_ID_KEYS and v is not None else anonymize(v, salt))
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [anonymize(v, salt) for v in value]
+    return value
+
+
+class TrafficCapture:
+    def __init__(self, path: str = TRAFFIC_CAPTURE_PATH, rate: float = TRAFFIC_CAPTURE_RATE,
+                 max_mb: float = TRAFFIC_CAPTURE_MAX_MB, salt: str = None):
+        self.path = path
+        self.rate = rate
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        salt = salt or os.getenv("TRAFFIC_CAPTURE_SALT")
+        if not salt and rate > 0:
+            # Không có salt cố định → mã ẩn danh chỉ ổn định trong 1 tiến trình
+            logger.warning("⚠️ Chưa đặt TRAFFIC_CAPTURE_SALT, dùng salt ngẫu nhiên cho tiến trình này")
+        self._salt = (salt or secrets.token_hex(16)).encode()
+        self._lock = threading.Lock()
+        self._file = None
+        self.counters = {"captured": 0, "skipped_full": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def should_capture(self, endpoint) -> bool:
+        return self.enabled and endpoint in CAPTURED_ENDPOINTS and random.random() < self.rate
+
+    def record(self, method: str, path: str, query: str, headers, body: bytes,
+               status: int, duration_s: float, response_bytes: int):
+        try:
+            payload = anonymize(json.loads(body), self._salt) if body else None
+        except ValueError:
+            payload = None  # body không phải JSON → chỉ giữ metadata
+        entry = {
+            "ts": time.time(),
+            "method": method,
+            "path": path + (f"?{query}" if query else ""),
+            "headers": {h: headers[h] for h in CAPTURED_HEADERS if h in headers},
+            "body": payload,
+            "status": status,
+            "duration_ms": round(duration_s * 1000, 3),
+            "response_bytes": response_bytes,
+        }
+        self.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    def write(self, line: str):
+        data = line.encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "ab")
+            if self._file.tell() + len(data) > self.max_bytes:
+                self.counters["skipped_full"] += 1
+                return
+            self._file.write(data)
+            self._file.flush()
+            self.counters["captured"] += 1
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "rate": self.rate, "path": self.path, **self.counters}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def load(path: str = TRAFFIC_CAPTURE_PATH) -> list:
+    """Đọc file capture (bỏ qua dòng trống / dòng hỏng do ghi dở)."""
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
@@ -0,0 +1,79 @@
+"""
+Khởi động lạnh nhanh: module nặng / client / model chỉ nạp khi dùng lần đầu
+hoặc ở luồng warm-up chạy nền ngay sau khi app import xong. /ready đọc trạng thái từ đây.
+"""
+import functools
+import threading
+import time
+
+from utils.logger import get_logger
+
+logger = get_logger("warmup")
+
+STATE_PENDING = "pending"
+STATE_RUNNING = "running"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+def once(fn):
+    """Hàm không tham số chỉ chạy 1 lần (an toàn đa luồng); lỗi thì lần gọi sau thử lại."""
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(fn)
+    def wrapper():
+        if result:
+            return result[0]
+        with lock:
+            if not result:
+                result.append(fn())
+        return result[0]
+
+    wrapper.reset = result.clear
+    return wrapper
+
+
+class Warmup:
+    def __init__(self):
+        self.steps = []  # [(tên, hàm)] chạy theo thứ tự
+        self.status = {}
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    def add(self, name: str, fn):
+        self.steps.append((name, fn))
+        self.status[name] = {"state": STATE_PENDING, "duration_s": None, "error": None}
+
+    def run(self):
+        self.started_at = time.time()
+        for name, fn in self.steps:
+            entry = self.status[name]
+            entry["state"] = STATE_RUNNING
+            started = time.perf_counter()
+            try:
+                fn()
+                entry["state"] = STATE_READY
+            except BaseException as e:  # script thiếu env gọi sys.exit() khi import
+                entry["state"] = STATE_FAILED
+                entry["error"] = f"{type(e).__name__}: {e}"
+                logger.warning(f"⚠️ Warm-up {name} lỗi: {entry['error']}")
+            entry["duration_s"] = round(time.perf_counter() - started, 4)
+        self.finished_at = time.time()
+        logger.info(f"🔥 Warm-up xong trong {self.finished_at - self.started_at:.2f}s")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def snapshot(self) -> dict:
+        done = self.finished_at is not None
+        return {
+            "ready": done and all(s["state"] == STATE_READY for s in self.status.values()),
+            "done": done,
+            "elapsed_s": round((self.finished_at or time.time()) - self.started_at, 4) if self.started_at else None,
+            "steps": {name: dict(s) for name, s in self.status.items()},
+        }
@@ -0,0 +1,8 @@
+-- Danh mục tính sẵn cho từng user (scripts/batch_portfolio.py).
+create table if not exists portfolio_snapshots (
+  user_id uuid primary key,
+  date date not null,
+  portfolio jsonb not null,
+  etag text not null,
+  computed_at timestamptz not null default now()
+);
@@ -0,0 +1,8 @@
+-- Lease của các replica khi bật sharding (services/sharding.py, SHARDING_ENABLED=1).
+-- expires_at / heartbeat_at: epoch milliseconds.
+create table if not exists replica_leases (
+  replica_id text primary key,
+  expires_at bigint not null,
+  heartbeat_at bigint not null
+);
+create index if not exists replica_leases_expires_at_idx on replica_leases (expires_at);
@@ -0,0 +1,23 @@
+-- Mỗi prediction chỉ được ghi 1 lệnh vào trading_logs.
+-- ai_execute_signals.execute_signals_batch dựa vào ràng buộc này
+-- (upsert ... on_conflict=prediction_id, ignore_duplicates) thay vì đọc-trước-ghi.
+
+-- Dọn các bản ghi trùng cũ (giữ bản sớm nhất) trước khi tạo ràng buộc;
+-- created_at bằng nhau / NULL → phân định bằng id để mỗi prediction_id còn đúng 1 dòng
+delete from trading_logs
+where id in (
+  select id
+  from (
+    select id,
+           row_number() over (
+             partition by prediction_id
+             order by created_at asc nulls last, id
+           ) as rn
+    from trading_logs
+    where prediction_id is not null
+  ) ranked
+  where rn > 1
+);
+
+alter table trading_logs
+  add constraint trading_logs_prediction_id_key unique (prediction_id);
@@ -0,0 +1,9 @@
+-- Các cột nhãn nhiều horizon/ngưỡng do services/label_engine.py sinh ra.
+-- Giá trị: 1 = buy, -1 = sell, 0 = hold, null = chưa đủ nến tương lai.
+alter table training_dataset
+  add column if not exists label_h1_t10 smallint,
+  add column if not exists label_h3_t20 smallint,
+  add column if not exists label_h3_t30 smallint,
+  add column if not exists label_h6_t30 smallint,
+  add column if not exists label_h12_t50 smallint,
+  add column if not exists label_h24_t80 smallint;
@@ -1,12 +1,230 @@
+"""
+Logger dùng chung cho server và các script:
+- Luồng gọi chỉ đẩy record vào hàng đợi (QueueHandler); 1 luồng nền (QueueListener) format JSON và ghi ra stderr
+- Mỗi dòng JSON kèm run_id / symbol / stage lấy từ `log_context(...)`
+- `.every()` (giới hạn tần suất) và `.sample()` (lấy mẫu) cho log theo từng dòng dữ liệu
+- Pipeline dùng `capture(run_id, stage, sink)` để gom log của từng bước vào stdout của bước đó
+"""
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
 
-def setup_logger(name):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+ROOT_LOGGER = "lhp"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_THROTTLE_SECONDS = float(os.getenv("LOG_THROTTLE_SECONDS", 5))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
 
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('[%(asctime)s] %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
+CONTEXT_FIELDS = ("run_id", "symbol", "stage")
+_context = {field: ContextVar(f"log_{field}", default=None) for field in CONTEXT_FIELDS}
 
-    logger.addHandler(handler)
-    return logger
+_setup_lock = threading.Lock()
+_queue = None
+_listener = None
+_captures = {}  # (run_id, stage) → hàm nhận text
+
+
+# ===== Ngữ cảnh: gắn vào record ngay tại luồng gọi =====
+@contextmanager
+def log_context(**fields):
+    tokens = [(_context[k], _context[k].set(v)) for k, v in fields.items() if k in _context]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    def filter(self, record):
+        for field, var in _context.items():
+            if getattr(record, field, None) is None:
+                setattr(record, field, var.get())
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Gộp args + traceback thành chuỗi ở luồng gọi, giữ nguyên các trường ngữ cảnh / fields
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# ===== Format =====
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        ctx = "/".join(str(getattr(record, f)) for f in CONTEXT_FIELDS if getattr(record, f, None) is not None)
+        fields = getattr(record, "fields", None)
+        line = f"[{self.formatTime(record)}] {record.levelname}{f' [{ctx}]' if ctx else ''} - {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class _CaptureHandler(logging.Handler):
+    """Chuyển log của 1 bước pipeline (theo run_id + stage) vào sink của bước đó."""
+
+    def __init__(self):
+        super().__init__()
+        self.formatter = logging.Formatter("%(message)s")
+
+    def emit(self, record):
+        sink = _captures.get((getattr(record, "run_id", None), getattr(record, "stage", None)))
+        if sink is not None:
+            fields = getattr(record, "fields", None)
+            text = record.getMessage()
+            if fields:
+                text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+            if record.exc_text:
+                text += "\n" + record.exc_text
+            sink(text + "\n")
+
+
+class _Listener(logging.handlers.QueueListener):
+    def handle(self, record):
+        if isinstance(record, threading.Event):
+            record.set()  # mốc của flush(): mọi record trước nó đã được ghi
+            return
+        super().handle(record)
+
+
+# ===== Khởi tạo 1 lần cho cả tiến trình =====
+def configure():
+    global _queue, _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        _queue = queue.Queue()
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        _listener = _Listener(_queue, stream, _CaptureHandler())
+        _listener.start()
+        atexit.register(shutdown)
+
+        handler = _QueueHandler(_queue)
+        handler.addFilter(_ContextFilter())
+        root = logging.getLogger(ROOT_LOGGER)
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+
+
+def flush(timeout: float = 2.0):
+    """Chờ luồng nền ghi hết các record đã đẩy vào hàng đợi trước thời điểm gọi."""
+    if _listener is None:
+        return
+    done = threading.Event()
+    _queue.put_nowait(done)
+    done.wait(timeout)
+
+
+def shutdown():
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+@contextmanager
+def capture(run_id, stage, sink):
+    _captures[(run_id, stage)] = sink
+    try:
+        yield
+    finally:
+        flush()
+        _captures.pop((run_id, stage), None)
+
+
+# ===== Logger có fields, giới hạn tần suất và lấy mẫu =====
+class _Throttle:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = {}
+        self._suppressed = {}
+
+    def allow(self, key, interval):
+        """None = bỏ qua; số nguyên = cho ghi, kèm số log đã bị bỏ từ lần ghi trước."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, float("-inf")) < interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return None
+            self._last[key] = now
+            return self._suppressed.pop(key, 0)
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """`logger.info("msg", rows=10)` → các keyword thành trường của dòng JSON."""
+
+    _RESERVED = ("exc_info", "stack_info", "stacklevel", "extra")
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+        self._throttle = _Throttle()
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in self._RESERVED}
+        if fields:
+            kwargs["extra"] = {**(kwargs.get("extra") or {}), "fields": fields}
+        return msg, kwargs
+
+    def every(self, key, msg, interval: float = LOG_THROTTLE_SECONDS, level: int = logging.INFO, **fields):
+        """Tối đa 1 log / `interval` giây cho mỗi `key`; lần ghi kèm số log đã bị bỏ."""
+        if not self.isEnabledFor(level):
+            return
+        suppressed = self._throttle.allow(key, interval)
+        if suppressed is None:
+            return
+        if suppressed:
+            fields["suppressed"] = suppressed
+        self.log(level, msg, **fields)
+
+    def sample(self, msg, rate: float = LOG_SAMPLE_RATE, level: int = logging.INFO, **fields):
+        """Ghi ngẫu nhiên với xác suất `rate` (log theo từng dòng dữ liệu)."""
+        if self.isEnabledFor(level) and random.random() < rate:
+            self.log(level, msg, sample_rate=rate, **fields)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    configure()
+    return StructuredLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"))
+
+
+# Tên cũ: gọi nhiều lần không còn gắn thêm handler
+setup_logger = get_logger